@@ -3,11 +3,15 @@ AI Commentary Generation System
 Generates Torah commentary in the style of traditional commentators
 """
 
-from openai import OpenAI
-from database import get_driver
+from cachetools import TTLCache
+from ai.openai_client import get_openai_client
+from database import get_async_driver, NEO4J_DATABASE
 import os
-from typing import Optional
+from typing import AsyncIterator, List, Optional, Tuple
+import hashlib
+import re
 import json
+import tiktoken
 
 # Get OpenAI API key from environment
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -19,7 +23,26 @@ else:
     print("⚠️ WARNING: OPENAI_API_KEY not found in environment variables!")
     print("   Make sure .env file exists and load_dotenv() is called before importing this module")
 
-client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+# In-process cache of recently generated commentary, keyed by a hash of the
+# request payload. Serves repeat requests without another OpenAI round trip.
+COMMENTARY_CACHE_SIZE = 10_000
+COMMENTARY_CACHE_TTL = 3600  # seconds
+_commentary_cache = TTLCache(maxsize=COMMENTARY_CACHE_SIZE, ttl=COMMENTARY_CACHE_TTL)
+
+# Tradition examples change rarely, so keep them per (tradition, limit) for an hour
+_examples_cache = TTLCache(maxsize=32, ttl=3600)
+
+# Semantic cache: stored commentary for a different reference is reused when
+# the embedding of (reference, tradition, mode, text) is at least this
+# similar (cosine). Off (1) by default: nearby verses and parallel passages
+# can score above 0.9, which would serve commentary written for another
+# reference. Opt in with e.g. 0.92 where aliased references are common.
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "1"))
+SEMANTIC_KEY_TEXT_CHARS = 512
+
+# Key embeddings computed during lookup, reused when the generated
+# commentary is stored (keyed like _commentary_cache)
+_key_embeddings = TTLCache(maxsize=1024, ttl=600)
 
 class CommentaryGenerator:
     """Generate AI-powered Torah commentary"""
@@ -67,6 +90,75 @@ Your style:
 """
     }
     
+    # Shared guidance sent ahead of every persona. It is identical for all
+    # requests so it forms a stable prompt prefix that OpenAI can cache.
+    COMMENTARY_GUIDELINES = """You write commentary on classical Jewish texts: Tanakh, Mishnah, Talmud, Midrash, and the codes.
+
+General guidelines for every commentary:
+- Anchor every comment in the words of the text. Quote the phrase (dibbur hamatchil) you are explaining before you explain it.
+- Comment on phrases in the order they appear in the text. Do not skip ahead and come back.
+- Explain only what needs explaining: difficult words, unusual grammar, apparent redundancies, contradictions with other verses, and gaps in the narrative.
+- When a word is rare or ambiguous, give its meaning and, where useful, a parallel usage elsewhere in Tanakh.
+- When you bring a midrash, Talmudic passage, or earlier commentator, name the source precisely (book, chapter and verse, or tractate and daf).
+- Never invent sources, quotations, or page references. If you are unsure of a source, describe the idea without attributing it.
+- Distinguish clearly between the plain meaning of the text and homiletical or mystical readings layered on top of it.
+- When the text raises a question that the tradition answers in several ways, present the reading of your own school first and mention others briefly.
+- Keep halakhic statements accurate and cautious. Do not issue practical rulings; describe what the sources say.
+- Hebrew and Aramaic terms may be used where they are standard, followed by a short English gloss the first time they appear.
+- Write in the voice and register of the commentator you are asked to emulate, but keep the output readable for a modern student.
+- Prefer several short, focused comments over one long essay.
+- Do not summarize the text back to the reader and do not add a concluding moral unless the mode asks for one.
+- Respond in the language of the request (English unless the text or request is in Hebrew).
+
+Structure of the response:
+1. One comment per phrase or verse you address, each starting with the quoted phrase.
+2. Under each, the explanation in two to six sentences.
+3. Sources cited inline in parentheses.
+
+Citation formats:
+- Tanakh: book, chapter and verse in English (Genesis 1:1, Isaiah 40:3, Psalms 23:4).
+- Mishnah: tractate, chapter and mishnah (Mishnah Berakhot 1:1).
+- Babylonian Talmud: tractate, daf and side (Berakhot 2a, Bava Metzia 59b).
+- Jerusalem Talmud: prefix with "Yerushalmi" and give chapter and halakhah (Yerushalmi Peah 1:1).
+- Midrash: collection, then parashah or section (Bereshit Rabbah 1:1, Mekhilta Beshalach 3, Sifrei Devarim 32).
+- Rishonim on Torah: commentator and verse (Rashi on Genesis 1:1, Ramban on Exodus 12:2).
+- Rambam: Mishneh Torah, book of laws, chapter and law (Mishneh Torah, Hilchot Shabbat 2:1).
+- Shulchan Arukh: section, siman and se'if (Shulchan Arukh, Orach Chayim 1:1).
+- Zohar: parashah and page where known (Zohar, Bereshit 15a).
+
+Common mistakes to avoid:
+- Attributing a well-known interpretation to the wrong commentator.
+- Citing a daf or verse number from memory when you are not certain of it.
+- Treating a later commentator's view as the plain meaning of the verse.
+- Translating idioms word for word when the idiomatic sense is what matters.
+- Mixing the voices of several commentators in one comment.
+- Answering a question the text does not raise instead of the one it does.
+
+Working with the Hebrew and Aramaic text:
+- Quote the dibbur hamatchil in the original language exactly as it appears in the text you were given, without adding or removing vowels or cantillation marks.
+- When the text is given without vowels, do not guess at a vocalization that changes the meaning; note the ambiguity instead.
+- Treat the ketiv and qeri as separate readings when they differ, and say which one your comment follows.
+- Aramaic passages in the Talmud should be explained in their own terms; do not read Hebrew meanings into Aramaic words that look alike.
+- Transliterate Hebrew terms consistently: ch for chet, kh for khaf, tz for tzadi, and an apostrophe for a silent aleph or ayin only where needed for clarity.
+- Names of books, tractates and commentators follow the spelling used in the citation formats above.
+
+When the text is ambiguous:
+- State the ambiguity in one sentence before resolving it.
+- Give the reading your commentator adopts, with the reason drawn from the text itself (word order, a parallel verse, the flow of the narrative).
+- If a well-known alternative reading exists, mention it in one sentence with its source.
+- Do not invent a disagreement between commentators where none is recorded.
+
+Tone and length:
+- Aim for a response a student can read in a few minutes: usually three to eight comments.
+- If the passage is a single short verse, one to three comments are enough.
+- Do not open with a greeting or close with a summary; begin directly with the first quoted phrase.
+- Avoid modern colloquialisms and avoid anachronistic references to later history, science or technology unless the mode asks for a contemporary application.
+
+Example of the expected layout (content shortened):
+"בראשית ברא" - In the beginning of the creation of heaven and earth. The verse does not come to teach the order of creation; it introduces the account that follows (Rashi on Genesis 1:1).
+"והארץ היתה תהו ובהו" - The earth was formless and void. The pair of words describes matter that has not yet received a form (Ramban on Genesis 1:2).
+"""
+    
     MODE_INSTRUCTIONS = {
         "pshat": "Focus on the plain, literal meaning of the text.",
         "halakhah": "Emphasize halakhic (legal) implications and rulings.",
@@ -74,81 +166,296 @@ Your style:
         "homiletical": "Offer inspiring, moralistic teachings."
     }
     
+    # (tradition, mode) -> assembled static system prompt, built on first use
+    _system_prompts = None
+    
+    # OpenAI only caches prompts of at least this many tokens, so every
+    # assembled system prompt must be longer on its own (requests without
+    # tradition examples send nothing else ahead of the text)
+    PROMPT_CACHE_MIN_TOKENS = 1024
+    
+    @classmethod
+    def _prompt_variant(cls, tradition: str, mode: str) -> Tuple[str, str]:
+        """The (tradition, mode) whose prompt is used; unknown ones fall back to Rashi/pshat"""
+        if tradition not in cls.TRADITION_PROMPTS:
+            tradition = "Rashi"
+        if mode not in cls.MODE_INSTRUCTIONS:
+            mode = "pshat"
+        return tradition, mode
+    
+    @classmethod
+    def _system_prompt(cls, tradition: str, mode: str) -> str:
+        """Return the preassembled guidelines + persona + mode prompt"""
+        if cls._system_prompts is None:
+            cls._system_prompts = {
+                (name, mode_name): f"{cls.COMMENTARY_GUIDELINES}\n{persona}\nMode: {instruction}"
+                for name, persona in cls.TRADITION_PROMPTS.items()
+                for mode_name, instruction in cls.MODE_INSTRUCTIONS.items()
+            }
+            cls._check_prompt_cacheable()
+        return cls._system_prompts[cls._prompt_variant(tradition, mode)]
+    
+    @classmethod
+    def _check_prompt_cacheable(cls):
+        """Warn if a system prompt is too short for OpenAI's prompt cache"""
+        try:
+            encoding = tiktoken.encoding_for_model("gpt-4o")
+        except Exception as e:
+            print(f"⚠️ Could not load tokenizer, skipping prompt cache check: {e}")
+            return
+        shortest = min(len(encoding.encode(prompt)) for prompt in cls._system_prompts.values())
+        if shortest < cls.PROMPT_CACHE_MIN_TOKENS:
+            print(f"⚠️ Commentary system prompt is {shortest} tokens; OpenAI only caches "
+                  f"prompts of {cls.PROMPT_CACHE_MIN_TOKENS}+ tokens")
+    
+    @classmethod
+    def _cache_routing(cls, tradition: str, mode: str) -> dict:
+        """
+        OpenAI prompt_cache_key for a request. Requests with the same key are
+        routed to the same prompt cache, so the shared system prompt prefix
+        is reused. Sent via extra_body so older SDK versions accept it.
+        """
+        tradition, mode = cls._prompt_variant(tradition, mode)
+        return {"prompt_cache_key": f"commentary:{tradition}:{mode}"}
+    
+    @staticmethod
+    def _log_usage(text_ref: str, usage):
+        """Print token usage, including how much of the prompt came from OpenAI's prompt cache"""
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = (getattr(details, "cached_tokens", None) or 0) if details else 0
+        print(f"📊 Commentary for {text_ref}: {usage.prompt_tokens} prompt tokens "
+              f"({cached_tokens} cached), {usage.completion_tokens} completion tokens")
+    
     def __init__(self):
-        self.model = "gpt-4-turbo"
+        # A model with automatic prompt caching, so the shared system prompt
+        # prefix is billed at the cached rate on repeat requests
+        self.model = "gpt-4o"
         self.temperature = 0.3
+        # How long commentary stored in Neo4j stays valid
+        self.cache_ttl_days = 30
     
     async def get_tradition_examples(self, tradition: str, limit: int = 3) -> str:
-        """Fetch real commentary examples from Neo4j if available"""
-        driver = get_driver()
+        """Fetch real commentary examples from Neo4j if available (cached per tradition)"""
+        # Don't let arbitrary user input reach the database
+        if tradition not in self.TRADITION_PROMPTS:
+            return ""
+        
+        cache_key = (tradition, limit)
+        if cache_key in _examples_cache:
+            return _examples_cache[cache_key]
+        
+        driver = get_async_driver()
         
         try:
-            with driver.session() as session:
-                # Use OPTIONAL MATCH - won't fail if Author/Text nodes don't exist
-                result = session.run("""
-                    OPTIONAL MATCH (a:Author)-[:WRITTEN_BY]-(t:Text)
+            async with driver.session(database=NEO4J_DATABASE) as session:
+                # Plain MATCH lets the planner start from the Author.name text
+                # index; no rows simply means no examples
+                result = await session.run("""
+                    MATCH (a:Author)-[:WRITTEN_BY]-(t:Text)
                     WHERE a.name CONTAINS $tradition
                           AND t.content_he IS NOT NULL
                     RETURN t.content_he as content
                     LIMIT $limit
                 """, {"tradition": tradition, "limit": limit})
                 
-                examples = [record["content"][:500] for record in result if record.get("content")]
+                examples = [record["content"][:500] async for record in result if record.get("content")]
                 
                 if examples:
                     print(f"✅ Found {len(examples)} example(s) for {tradition}")
-                    return "\n\n---\n\n".join(examples)
                 else:
                     print(f"ℹ️ No examples found for {tradition} - will use prompt only")
-                    return ""
+                
+                # Errors below are not cached so the next request retries
+                _examples_cache[cache_key] = "\n\n---\n\n".join(examples)
+                return _examples_cache[cache_key]
         except Exception as e:
             print(f"⚠️ Error fetching examples (skipping): {e}")
             return ""
     
-    async def generate(
+    def _cache_key(self, text: str, text_ref: str, tradition: str, mode: str) -> str:
+        """Hash everything that determines the generated commentary"""
+        payload = json.dumps({
+            "model": self.model,
+            "tradition": tradition,
+            "mode": mode,
+            "text_ref": text_ref,
+            "text": text
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    async def _find_cached(
         self,
+        cache_key: str,
         text: str,
         text_ref: str,
-        tradition: str = "Rashi",
-        mode: str = "pshat"
-    ) -> str:
-        """Generate commentary in specified tradition and mode"""
+        tradition: str,
+        mode: str,
+        check_stored: bool
+    ) -> Optional[str]:
+        """
+        Look in the in-memory cache, then (optionally) the exact Neo4j cache,
+        then the semantic cache
+        """
+        cached = _commentary_cache.get(cache_key)
+        if cached:
+            print(f"✅ Found commentary in memory cache for {text_ref}")
+            return cached
         
-        # Check if OpenAI client is available
-        if not client:
-            raise ValueError("OpenAI API key not configured. Set OPENAI_API_KEY in .env file.")
+        if check_stored:
+            stored = await self.get_cached_commentary(text_ref, tradition, mode)
+            if stored:
+                _commentary_cache[cache_key] = stored
+                return stored
+        
+        similar = await self.find_similar_commentary(cache_key, text, text_ref, tradition, mode)
+        if similar:
+            _commentary_cache[cache_key] = similar
+            return similar
+        
+        return None
+    
+    def _semantic_key(self, text: str, text_ref: str, tradition: str, mode: str) -> str:
+        """Text that is embedded for semantic cache lookups"""
+        return f"{text_ref}\n{tradition}\n{mode}\n{text[:SEMANTIC_KEY_TEXT_CHARS]}"
+    
+    async def _key_embedding(self, cache_key: str, text: str, text_ref: str, tradition: str, mode: str):
+        """Embedding of the semantic cache key (None if it can't be computed)"""
+        if cache_key in _key_embeddings:
+            return _key_embeddings[cache_key]
         
+        from ai.embeddings import get_text_embedder
+        try:
+            embedding = await get_text_embedder().embed_text(self._semantic_key(text, text_ref, tradition, mode))
+        except Exception as e:
+            print(f"⚠️ Could not embed semantic cache key (skipping): {e}")
+            return None
+        if embedding:
+            _key_embeddings[cache_key] = embedding
+        return embedding
+    
+    async def find_similar_commentary(
+        self,
+        cache_key: str,
+        text: str,
+        text_ref: str,
+        tradition: str,
+        mode: str
+    ) -> Optional[str]:
+        """
+        Semantic cache lookup: return stored commentary (same tradition, mode
+        and model) whose key embedding is within SEMANTIC_CACHE_THRESHOLD of
+        this request's, so aliased or near-identical references are served
+        without a new generation.
+        """
+        if SEMANTIC_CACHE_THRESHOLD >= 1:
+            return None
+        
+        embedding = await self._key_embedding(cache_key, text, text_ref, tradition, mode)
+        if not embedding:
+            return None
+        
+        driver = get_async_driver()
+        try:
+            async with driver.session(database=NEO4J_DATABASE) as session:
+                # The index reports cosine as (1 + cos) / 2, so map it back to cos
+                records = await session.run("""
+                    CALL db.index.vector.queryNodes('ai_commentary_key_embedding_idx', 10, $embedding)
+                    YIELD node AS c, score
+                    WITH c, 2 * score - 1 AS score
+                    WHERE c.tradition = $tradition
+                      AND c.mode = $mode
+                      AND c.model = $model
+                      AND (c.expires_at IS NULL OR c.expires_at > datetime())
+                      AND score >= $threshold
+                    RETURN c.content AS commentary, c.text_ref AS text_ref, score
+                    ORDER BY score DESC
+                    LIMIT 1
+                """, {
+                    "embedding": embedding,
+                    "tradition": tradition,
+                    "mode": mode,
+                    "model": self.model,
+                    "threshold": SEMANTIC_CACHE_THRESHOLD
+                })
+                result = await records.single()
+                
+                if result and result["commentary"]:
+                    print(f"✅ Found similar cached commentary for {text_ref} ({result['text_ref']}, score {result['score']:.3f})")
+                    return result["commentary"]
+                return None
+        except Exception as e:
+            print(f"⚠️ Semantic cache lookup failed (skipping): {e}")
+            return None
+    
+    async def _build_messages(self, text: str, text_ref: str, tradition: str, mode: str) -> list:
+        """Build the chat messages for a commentary request"""
         # Get real examples from database
         examples = await self.get_tradition_examples(tradition)
         
-        # Build prompt
-        system_prompt = self.TRADITION_PROMPTS.get(tradition, self.TRADITION_PROMPTS["Rashi"])
-        mode_instruction = self.MODE_INSTRUCTIONS.get(mode, self.MODE_INSTRUCTIONS["pshat"])
+        # Build prompt - static content first and per-request content last, so
+        # the longest possible prefix is shared between requests and cached
+        system_prompt = self._system_prompt(tradition, mode)
         
         if examples:
             system_prompt += f"\n\nExamples of your commentary style:\n{examples}"
         
-        system_prompt += f"\n\nMode: {mode_instruction}"
-        
-        try:
-            response = client.chat.completions.create(
-                model=self.model,
-                temperature=self.temperature,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"""Provide commentary on this text:
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"""Provide commentary on this text:
 
 Reference: {text_ref}
 Text: {text}
 
 Provide insightful commentary following your tradition's methodology."""}
-                ]
+        ]
+    
+    async def _store_generated(self, cache_key: str, text_ref: str, tradition: str, mode: str, commentary: str):
+        """Remember freshly generated commentary in memory and in Neo4j"""
+        _commentary_cache[cache_key] = commentary
+        await self.cache_commentary(
+            text_ref, tradition, mode, commentary,
+            key_embedding=_key_embeddings.pop(cache_key, None)
+        )
+    
+    async def generate(
+        self,
+        text: str,
+        text_ref: str,
+        tradition: str = "Rashi",
+        mode: str = "pshat",
+        check_stored: bool = True
+    ) -> str:
+        """
+        Generate commentary in specified tradition and mode.
+        Checks the in-memory cache, then the Neo4j cache (unless the caller
+        already did so and passes check_stored=False), before calling OpenAI.
+        """
+        
+        # Check if OpenAI client is available
+        client = get_openai_client()
+        if not client:
+            raise ValueError("OpenAI API key not configured. Set OPENAI_API_KEY in .env file.")
+        
+        cache_key = self._cache_key(text, text_ref, tradition, mode)
+        cached = await self._find_cached(cache_key, text, text_ref, tradition, mode, check_stored)
+        if cached:
+            return cached
+        
+        messages = await self._build_messages(text, text_ref, tradition, mode)
+        
+        try:
+            response = await client.chat.completions.create(
+                model=self.model,
+                temperature=self.temperature,
+                messages=messages,
+                extra_body=self._cache_routing(tradition, mode)
             )
+            self._log_usage(text_ref, response.usage)
             
             commentary = response.choices[0].message.content
-            
-            # Store in Neo4j for caching
-            await self.cache_commentary(text_ref, tradition, mode, commentary)
+            await self._store_generated(cache_key, text_ref, tradition, mode, commentary)
             
             return commentary
             
@@ -156,20 +463,79 @@ Provide insightful commentary following your tradition's methodology."""}
             print(f"Error generating commentary: {e}")
             return f"Error generating commentary: {str(e)}"
     
+    async def generate_stream(
+        self,
+        text: str,
+        text_ref: str,
+        tradition: str = "Rashi",
+        mode: str = "pshat",
+        check_stored: bool = True
+    ) -> AsyncIterator[str]:
+        """
+        Like generate, but yields the commentary piece by piece as OpenAI
+        produces it. Cached commentary is yielded in one piece. The full
+        text is cached once the stream completes.
+        """
+        
+        # Check if OpenAI client is available
+        client = get_openai_client()
+        if not client:
+            raise ValueError("OpenAI API key not configured. Set OPENAI_API_KEY in .env file.")
+        
+        cache_key = self._cache_key(text, text_ref, tradition, mode)
+        cached = await self._find_cached(cache_key, text, text_ref, tradition, mode, check_stored)
+        if cached:
+            yield cached
+            return
+        
+        messages = await self._build_messages(text, text_ref, tradition, mode)
+        
+        parts = []
+        try:
+            stream = await client.chat.completions.create(
+                model=self.model,
+                temperature=self.temperature,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                extra_body=self._cache_routing(tradition, mode)
+            )
+            
+            async for chunk in stream:
+                # The final chunk carries usage and no choices
+                if chunk.usage:
+                    self._log_usage(text_ref, chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except Exception as e:
+            print(f"Error streaming commentary: {e}")
+            yield f"Error generating commentary: {str(e)}"
+            return
+        
+        await self._store_generated(cache_key, text_ref, tradition, mode, "".join(parts))
+    
     async def cache_commentary(
         self,
         text_ref: str,
         tradition: str,
         mode: str,
-        commentary: str
+        commentary: str,
+        key_embedding: Optional[List[float]] = None
     ):
-        """Cache generated commentary in Neo4j - creates nodes if they don't exist"""
-        driver = get_driver()
+        """
+        Cache generated commentary in Neo4j - creates nodes if they don't exist.
+        key_embedding, if given, makes the commentary findable by the semantic cache.
+        """
+        driver = get_async_driver()
         
         try:
-            with driver.session() as session:
+            async with driver.session(database=NEO4J_DATABASE) as session:
                 # Use MERGE to create Text node if it doesn't exist
-                session.run("""
+                await session.run("""
                     MERGE (t:Text {id: $text_ref})
                     ON CREATE SET t.created_at = datetime()
                     MERGE (c:AICommentary {
@@ -179,14 +545,20 @@ Provide insightful commentary following your tradition's methodology."""}
                     })
                     SET c.content = $commentary,
                         c.generated_at = datetime(),
+                        c.expires_at = datetime() + duration({days: $ttl_days}),
                         c.model = $model
                     MERGE (t)-[:HAS_AI_COMMENTARY]->(c)
+                    WITH c
+                    WHERE $key_embedding IS NOT NULL
+                    CALL db.create.setNodeVectorProperty(c, 'key_embedding', $key_embedding)
                 """, {
                     "text_ref": text_ref,
                     "tradition": tradition,
                     "mode": mode,
                     "commentary": commentary,
-                    "model": self.model
+                    "model": self.model,
+                    "ttl_days": self.cache_ttl_days,
+                    "key_embedding": key_embedding
                 })
                 print(f"✅ Cached commentary for {text_ref} ({tradition}/{mode})")
         except Exception as e:
@@ -198,21 +570,28 @@ Provide insightful commentary following your tradition's methodology."""}
         tradition: str,
         mode: str
     ) -> Optional[str]:
-        """Retrieve cached commentary from Neo4j - returns None if not found"""
-        driver = get_driver()
+        """
+        Retrieve cached commentary from Neo4j - returns None if not found,
+        expired, or generated by a different model
+        """
+        driver = get_async_driver()
         
         try:
-            with driver.session() as session:
-                # Use OPTIONAL MATCH to handle missing nodes gracefully
-                result = session.run("""
-                    OPTIONAL MATCH (t:Text {id: $text_ref})-[:HAS_AI_COMMENTARY]->(c:AICommentary)
-                    WHERE c.tradition = $tradition AND c.mode = $mode
+            async with driver.session(database=NEO4J_DATABASE) as session:
+                # Look up by the full key so the ai_commentary_key index is used
+                records = await session.run("""
+                    MATCH (c:AICommentary {text_ref: $text_ref, tradition: $tradition, mode: $mode})
+                    WHERE c.model = $model
+                      AND (c.expires_at IS NULL OR c.expires_at > datetime())
                     RETURN c.content as commentary
+                    LIMIT 1
                 """, {
                     "text_ref": text_ref,
                     "tradition": tradition,
-                    "mode": mode
-                }).single()
+                    "mode": mode,
+                    "model": self.model
+                })
+                result = await records.single()
                 
                 if result and result["commentary"]:
                     print(f"✅ Found cached commentary for {text_ref}")
@@ -223,22 +602,90 @@ Provide insightful commentary following your tradition's methodology."""}
         except Exception as e:
             print(f"❌ Error retrieving cached commentary: {e}")
             return None
+    
+    async def purge_expired_commentary(self) -> int:
+        """Delete expired AICommentary nodes in batches. Returns the number removed."""
+        driver = get_async_driver()
+        
+        async with driver.session(database=NEO4J_DATABASE) as session:
+            # CALL {} IN TRANSACTIONS needs an auto-commit transaction (session.run)
+            result = await session.run("""
+                MATCH (c:AICommentary)
+                WHERE c.expires_at < datetime()
+                CALL {
+                    WITH c
+                    DETACH DELETE c
+                } IN TRANSACTIONS OF 1000 ROWS
+                RETURN count(*) AS purged
+            """)
+            record = await result.single()
+            purged = record["purged"] if record else 0
+        
+        print(f"🧹 Purged {purged} expired commentaries")
+        return purged
 
 class CitationExtractor:
     """Extract halakhic citations using AI"""
     
+    # Structured-outputs schema: the model can only emit JSON matching this
+    CITATIONS_SCHEMA = {
+        "name": "citations",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "citations": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "type": {"type": "string"},
+                            "reference": {"type": "string"},
+                            "context": {"type": "string"}
+                        },
+                        "required": ["type", "reference", "context"],
+                        "additionalProperties": False
+                    }
+                }
+            },
+            "required": ["citations"],
+            "additionalProperties": False
+        }
+    }
+    
     def __init__(self):
-        self.model = "gpt-4-turbo"
+        # Structured outputs (json_schema) require gpt-4o or newer
+        self.model = "gpt-4o"
+    
+    def _parse_citations(self, content: str) -> list:
+        """Parse the model output, recovering the JSON object if it is wrapped in other text"""
+        try:
+            result = json.loads(content)
+        except json.JSONDecodeError:
+            match = re.search(r"\{.*\}", content, re.DOTALL)
+            if not match:
+                print("⚠️ Could not find JSON in citation response")
+                return []
+            try:
+                result = json.loads(match.group(0))
+            except json.JSONDecodeError as e:
+                print(f"⚠️ Could not parse citation response: {e}")
+                return []
+        
+        if isinstance(result, list):
+            return result
+        return result.get("citations", [])
     
     async def extract_citations(self, text: str) -> list:
         """Extract all Torah/Talmud citations from text"""
         
         # Check if OpenAI client is available
+        client = get_openai_client()
         if not client:
             raise ValueError("OpenAI API key not configured. Set OPENAI_API_KEY in .env file.")
         
         try:
-            response = client.chat.completions.create(
+            response = await client.chat.completions.create(
                 model=self.model,
                 temperature=0.1,
                 messages=[
@@ -246,24 +693,36 @@ class CitationExtractor:
 Extract all citations and source references from the given text.
 Include: Biblical verses, Mishnah, Gemara, Rambam, Shulchan Arukh, etc.
 
-Return as JSON array with format:
-[
-    {
-        "type": "Torah|Mishnah|Gemara|Rambam|etc",
-        "reference": "exact reference (e.g., 'Genesis 1:1', 'Berakhot 2a')",
-        "context": "brief context or quote"
-    }
-]
+For each citation give:
+- type: Torah|Mishnah|Gemara|Rambam|etc
+- reference: exact reference (e.g., 'Genesis 1:1', 'Berakhot 2a')
+- context: brief context or quote
 """},
                     {"role": "user", "content": f"Extract citations from:\n\n{text}"}
                 ],
-                response_format={"type": "json_object"}
+                response_format={"type": "json_schema", "json_schema": self.CITATIONS_SCHEMA}
             )
             
-            result = json.loads(response.choices[0].message.content)
-            return result.get("citations", [])
+            return self._parse_citations(response.choices[0].message.content or "")
             
         except Exception as e:
             print(f"Error extracting citations: {e}")
             return []
 
+
+_commentary_generator = None
+_citation_extractor = None
+
+def get_commentary_generator() -> CommentaryGenerator:
+    """Get singleton CommentaryGenerator instance"""
+    global _commentary_generator
+    if _commentary_generator is None:
+        _commentary_generator = CommentaryGenerator()
+    return _commentary_generator
+
+def get_citation_extractor() -> CitationExtractor:
+    """Get singleton CitationExtractor instance"""
+    global _citation_extractor
+    if _citation_extractor is None:
+        _citation_extractor = CitationExtractor()
+    return _citation_extractor
@@ -3,11 +3,16 @@ Text Embedding System for Semantic Search
 Generates and manages vector embeddings for all texts in Neo4j
 """
 
-from openai import OpenAI
-from database import get_driver
+from ai.openai_client import get_openai_client
+from database import get_async_driver, NEO4J_DATABASE
 import os
-from typing import List, Optional
+from typing import Callable, List, Optional
+from array import array
 import asyncio
+import hashlib
+import math
+import diskcache
+import tiktoken
 
 # Get OpenAI API key from environment
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -18,43 +23,235 @@ if OPENAI_API_KEY:
 else:
     print("⚠️ WARNING: OPENAI_API_KEY not found - embeddings will not work!")
 
-client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+# Maximum number of embedding requests in flight at once in batch_embed_texts.
+# Keep this below what the OpenAI account's rate limit allows to avoid 429s.
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "16"))
+
+# Batches embedded at the same time by embed_all_texts; they share the
+# EMBED_CONCURRENCY request budget
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "4"))
+
+# The embeddings endpoint accepts at most 2048 inputs and 300k tokens per request
+EMBED_MAX_INPUTS_PER_REQUEST = 2048
+EMBED_MAX_TOKENS_PER_REQUEST = 300_000
+
+# Must match the dimensions of the text_embedding_idx vector index (see database.py)
+EMBED_DIMENSIONS = 1536
+
+# On-disk cache of computed embeddings, so reruns of the embedding job (and
+# repeated queries) don't pay for texts that were already embedded
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", "/var/cache/text_embeddings")
+
+_encoding = None
+
+def get_encoding():
+    """Return the tokenizer used by the embedding models (loaded once)"""
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+def normalize(vector: List[float]) -> List[float]:
+    """Scale a vector to unit L2 length so cosine similarity is a plain dot product"""
+    # hypot computes the norm in C rather than a Python generator loop
+    norm = math.hypot(*vector)
+    # OpenAI already returns unit-length embeddings; skip the rescale then
+    if norm == 0 or abs(norm - 1.0) < 1e-6:
+        return vector
+    return [x / norm for x in vector]
 
 class TextEmbedder:
     def __init__(self):
         self.model = "text-embedding-3-large"  # 1536 dimensions
         self.max_tokens = 8000
+        
+        try:
+            self.embedding_cache = diskcache.Cache(EMBED_CACHE_DIR)
+        except Exception as e:
+            print(f"⚠️ Could not open embedding cache at {EMBED_CACHE_DIR} (caching disabled): {e}")
+            self.embedding_cache = None
     
-    async def embed_text(self, text: str) -> List[float]:
-        """Generate embedding for a single text"""
-        # Check if OpenAI client is available
-        if not client:
-            raise ValueError("OpenAI API key not configured. Set OPENAI_API_KEY in .env file.")
+    def _embedding_cache_key(self, text: str) -> str:
+        """Hash everything that determines an embedding"""
+        return hashlib.sha256(f"{self.model}\x00{EMBED_DIMENSIONS}\x00{text}".encode("utf-8")).hexdigest()
+    
+    def _get_cached_embeddings(self, inputs: List[str]) -> List[Optional[List[float]]]:
+        """Previously computed embeddings for (already truncated) inputs, None where missing"""
+        if self.embedding_cache is None:
+            return [None] * len(inputs)
+        embeddings = []
+        try:
+            for text in inputs:
+                stored = self.embedding_cache.get(self._embedding_cache_key(text))
+                embeddings.append(array("f", stored).tolist() if stored else None)
+        except Exception as e:
+            print(f"⚠️ Embedding cache read failed: {e}")
+            return [None] * len(inputs)
+        return embeddings
+    
+    def _set_cached_embeddings(self, inputs: List[str], embeddings: List[Optional[List[float]]]):
+        """Remember embeddings (as float32 bytes, like the stored vectors) for identical future inputs"""
+        if self.embedding_cache is None:
+            return
+        try:
+            for text, embedding in zip(inputs, embeddings):
+                if embedding:
+                    self.embedding_cache.set(self._embedding_cache_key(text), array("f", embedding).tobytes())
+        except Exception as e:
+            print(f"⚠️ Embedding cache write failed: {e}")
+    
+    def _truncate(self, text: str) -> str:
+        """Cut text down to max_tokens tokens (the API limit is in tokens, not characters)"""
+        # A token is at least one character, so short texts can't be over the limit
+        if len(text) <= self.max_tokens:
+            return text
+        
+        try:
+            encoding = get_encoding()
+        except Exception as e:
+            print(f"⚠️ Could not load tokenizer, truncating by characters: {e}")
+            return text[:self.max_tokens]
         
+        tokens = encoding.encode(text)
+        if len(tokens) <= self.max_tokens:
+            return text
+        return encoding.decode(tokens[:self.max_tokens])
+    
+    async def _create_embeddings(self, inputs: List[str]) -> Optional[List[List[float]]]:
+        """Call the embeddings endpoint (the client retries 429s with backoff)"""
         try:
-            response = client.embeddings.create(
+            response = await get_openai_client().embeddings.create(
                 model=self.model,
-                input=text[:self.max_tokens]
+                input=inputs,
+                dimensions=EMBED_DIMENSIONS
             )
-            return response.data[0].embedding
+            # The API returns one item per input, tagged with its position.
+            # Normalize so stored and query vectors are always unit length.
+            return [normalize(item.embedding) for item in sorted(response.data, key=lambda d: d.index)]
         except Exception as e:
             print(f"Error generating embedding: {e}")
             return None
     
-    async def embed_and_store(self, node_id: str, content: str):
-        """Generate embedding and store in Neo4j"""
-        embedding = await self.embed_text(content)
+    async def embed_text(self, text: str) -> List[float]:
+        """Generate embedding for a single text"""
+        # Check if OpenAI client is available
+        if not get_openai_client():
+            raise ValueError("OpenAI API key not configured. Set OPENAI_API_KEY in .env file.")
         
-        if not embedding:
-            return False
+        text = self._truncate(text)
+        cached = self._get_cached_embeddings([text])[0]
+        if cached:
+            return cached
+        
+        embeddings = await self._create_embeddings([text])
+        if not embeddings:
+            return None
+        self._set_cached_embeddings([text], embeddings)
+        return embeddings[0]
+    
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """
+        Tokens per text as the embedding model counts them. Falls back to
+        the character count (never less than the token count) if the
+        tokenizer can't be loaded.
+        """
+        try:
+            encoding = get_encoding()
+        except Exception as e:
+            print(f"⚠️ Could not load tokenizer, counting characters instead: {e}")
+            return [len(text) for text in texts]
+        # encode_batch tokenizes on several threads
+        return [len(tokens) for tokens in encoding.encode_batch(texts, disallowed_special=())]
+    
+    def _micro_batches(self, inputs: List[str], chunk_size: int) -> List[List[str]]:
+        """
+        Split length-sorted inputs into consecutive requests of at most
+        chunk_size texts and EMBED_MAX_TOKENS_PER_REQUEST tokens, so each
+        request holds texts of similar length and is as full as the API's
+        per-request token limit allows.
+        """
+        chunks = []
+        current = []
+        current_tokens = 0
+        for text, tokens in zip(inputs, self.count_tokens(inputs)):
+            if current and (
+                len(current) >= chunk_size
+                or current_tokens + tokens > EMBED_MAX_TOKENS_PER_REQUEST
+            ):
+                chunks.append(current)
+                current = []
+                current_tokens = 0
+            current.append(text)
+            current_tokens += tokens
+        if current:
+            chunks.append(current)
+        return chunks
+    
+    async def embed_texts(
+        self,
+        texts: List[str],
+        max_concurrency: Optional[int] = None
+    ) -> List[Optional[List[float]]]:
+        """
+        Generate embeddings for many texts using batched API requests.
+        Returns one embedding per input text, in input order (None where a request failed).
+        
+        Texts are split into at least max_concurrency requests (up to 2048
+        texts each) that run in parallel, so even a small batch isn't sent
+        as a single slow request. Texts already in the embedding cache are
+        not sent at all.
+        """
+        if not get_openai_client():
+            raise ValueError("OpenAI API key not configured. Set OPENAI_API_KEY in .env file.")
+        if not texts:
+            return []
+        
+        max_concurrency = max_concurrency or EMBED_CONCURRENCY
+        
+        truncated = [self._truncate(text) for text in texts]
+        embeddings = self._get_cached_embeddings(truncated)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if not missing:
+            return embeddings
+        
+        # Group texts of similar length so requests take about the same time
+        order = sorted(missing, key=lambda i: len(texts[i]), reverse=True)
+        inputs = [truncated[i] for i in order]
+        
+        chunk_size = min(EMBED_MAX_INPUTS_PER_REQUEST, -(-len(inputs) // max_concurrency))
+        chunks = self._micro_batches(inputs, chunk_size)
         
-        driver = get_driver()
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def embed_chunk(chunk):
+            async with semaphore:
+                return await self._create_embeddings(chunk)
+        
+        results = await asyncio.gather(*[embed_chunk(chunk) for chunk in chunks])
+        
+        sorted_embeddings = []
+        for chunk, chunk_embeddings in zip(chunks, results):
+            sorted_embeddings.extend(chunk_embeddings if chunk_embeddings else [None] * len(chunk))
+        self._set_cached_embeddings(inputs, sorted_embeddings)
+        
+        # Back to input order
+        for position, embedding in zip(order, sorted_embeddings):
+            embeddings[position] = embedding
+        return embeddings
+    
+    async def store_embedding(self, node_id: str, embedding: List[float]) -> bool:
+        """
+        Store a precomputed embedding on its Text node in Neo4j.
+        setNodeVectorProperty stores the vector as float32 rather than the
+        float64 list a plain SET would write, halving its size.
+        """
+        driver = get_async_driver()
         try:
-            with driver.session() as session:
-                session.run("""
-                    MATCH (t:Text {`<id>`: $node_id})
-                    SET t.embedding = $embedding,
-                        t.embedding_model = $model,
+            async with driver.session(database=NEO4J_DATABASE) as session:
+                await session.run("""
+                    MATCH (t:Text {id: $node_id})
+                    CALL db.create.setNodeVectorProperty(t, 'embedding', $embedding)
+                    SET t.embedding_model = $model,
                         t.embedded_at = datetime()
                 """, {
                     "node_id": node_id,
@@ -66,45 +263,159 @@ class TextEmbedder:
             print(f"Error storing embedding: {e}")
             return False
     
-    async def batch_embed_texts(self, batch_size: int = 100):
-        """Embed all texts in batches"""
-        driver = get_driver()
+    async def _bulk_store_embeddings(self, rows: List[dict]) -> int:
+        """
+        Store many embeddings in a single UNWIND write transaction.
+        Each row is {"id": <text node id>, "embedding": [...]}.
+        Returns the number of Text nodes updated.
+        """
+        async def write(tx):
+            result = await tx.run("""
+                UNWIND $rows AS row
+                MATCH (t:Text {id: row.id})
+                CALL db.create.setNodeVectorProperty(t, 'embedding', row.embedding)
+                SET t.embedding_model = $model,
+                    t.embedded_at = datetime()
+                RETURN count(t) AS stored
+            """, {"rows": rows, "model": self.model})
+            record = await result.single()
+            return record["stored"]
+        
+        driver = get_async_driver()
+        try:
+            async with driver.session(database=NEO4J_DATABASE) as session:
+                return await session.execute_write(write)
+        except Exception as e:
+            print(f"Error storing embeddings: {e}")
+            return 0
+    
+    async def embed_and_store(self, node_id: str, content: str):
+        """Generate embedding and store in Neo4j"""
+        embedding = await self.embed_text(content)
+        
+        if not embedding:
+            return False
         
-        with driver.session() as session:
-            # Get texts without embeddings
-            result = session.run("""
+        return await self.store_embedding(node_id, embedding)
+    
+    async def _fetch_unembedded(self, batch_size: int, after_id: Optional[str] = None) -> List[dict]:
+        """
+        Next batch_size texts without embeddings, in id order after after_id.
+        Paging by id (backed by the text_id_unique index) keeps concurrent
+        workers on disjoint batches.
+        """
+        driver = get_async_driver()
+        async with driver.session(database=NEO4J_DATABASE) as session:
+            result = await session.run("""
                 MATCH (t:Text)
                 WHERE t.embedding IS NULL
-                RETURN t.`<id>` as id, 
+                AND ($after_id IS NULL OR t.id > $after_id)
+                RETURN t.id as id, 
                        coalesce(t.content_he, t.content_en, '') as content
+                ORDER BY t.id
                 LIMIT $batch_size
-            """, {"batch_size": batch_size})
-            
-            texts = list(result)
+            """, {"batch_size": batch_size, "after_id": after_id})
             
-            if not texts:
-                print("No texts to embed")
-                return 0
-            
-            print(f"Embedding {len(texts)} texts...")
-            
-            embedded_count = 0
-            for record in texts:
-                if record["content"]:
-                    success = await self.embed_and_store(
-                        record["id"],
-                        record["content"]
-                    )
-                    if success:
-                        embedded_count += 1
-            
-            return embedded_count
+            return [record.data() async for record in result]
+    
+    async def _embed_records(self, texts: List[dict], max_concurrency: Optional[int] = None) -> int:
+        """Embed and store a batch of {"id", "content"} records; returns the number stored"""
+        texts = [record for record in texts if record["content"]]
+        if not texts:
+            return 0
+        
+        # Identical content (repeated verses, headers) only needs embedding once
+        ids_by_hash = {}
+        content_by_hash = {}
+        for record in texts:
+            content_hash = hashlib.sha1(record["content"].encode("utf-8")).hexdigest()
+            ids_by_hash.setdefault(content_hash, []).append(record["id"])
+            content_by_hash.setdefault(content_hash, record["content"])
+        
+        print(f"Embedding {len(texts)} texts ({len(content_by_hash)} unique)...")
+        
+        # A few parallel requests instead of one request per text
+        hashes = list(content_by_hash)
+        embeddings = await self.embed_texts([content_by_hash[h] for h in hashes], max_concurrency)
+        
+        # Fan each vector out to every text that shares its content
+        rows = [
+            {"id": text_id, "embedding": embedding}
+            for content_hash, embedding in zip(hashes, embeddings)
+            if embedding
+            for text_id in ids_by_hash[content_hash]
+        ]
+        if not rows:
+            return 0
+        
+        # Write every vector in one transaction instead of one round-trip per text
+        return await self._bulk_store_embeddings(rows)
+    
+    async def batch_embed_texts(self, batch_size: int = 100, max_concurrency: Optional[int] = None):
+        """Embed all texts in batches"""
+        texts = await self._fetch_unembedded(batch_size)
+        
+        if not texts:
+            print("No texts to embed")
+            return 0
+        
+        return await self._embed_records(texts, max_concurrency)
+    
+    async def embed_all_texts(
+        self,
+        batch_size: int = 100,
+        workers: Optional[int] = None,
+        on_batch: Optional[Callable[[int], None]] = None
+    ) -> int:
+        """
+        Embed every text that has no embedding yet.
+        One producer pages through the unembedded texts while `workers`
+        consumers embed and store batches concurrently, sharing
+        EMBED_CONCURRENCY API requests between them. Rate-limited (429)
+        requests are retried with backoff by the OpenAI client.
+        on_batch, if given, is called with the count stored for each batch.
+        Returns the total number of texts embedded.
+        """
+        if not get_openai_client():
+            raise ValueError("OpenAI API key not configured. Set OPENAI_API_KEY in .env file.")
+        
+        workers = max(1, workers or EMBED_WORKERS)
+        per_worker_concurrency = max(1, EMBED_CONCURRENCY // workers)
+        # Keep at most one fetched batch waiting per worker
+        queue = asyncio.Queue(maxsize=workers)
+        
+        async def produce():
+            after_id = None
+            try:
+                while True:
+                    texts = await self._fetch_unembedded(batch_size, after_id)
+                    if not texts:
+                        break
+                    await queue.put(texts)
+                    after_id = texts[-1]["id"]
+            finally:
+                for _ in range(workers):
+                    await queue.put(None)
+        
+        async def consume():
+            embedded = 0
+            while True:
+                texts = await queue.get()
+                if texts is None:
+                    return embedded
+                count = await self._embed_records(texts, per_worker_concurrency)
+                embedded += count
+                if on_batch:
+                    on_batch(count)
+        
+        results = await asyncio.gather(produce(), *[consume() for _ in range(workers)])
+        return sum(results[1:])
 
 class SemanticSearch:
     """Semantic search using vector similarity"""
     
     def __init__(self):
-        self.embedder = TextEmbedder()
+        self.embedder = get_text_embedder()
     
     async def search(self, query: str, limit: int = 10) -> List[dict]:
         """Find texts semantically similar to query"""
@@ -115,58 +426,69 @@ class SemanticSearch:
         if not query_embedding:
             return []
         
-        driver = get_driver()
+        return await self.search_by_vector(query_embedding, limit)
+    
+    async def search_many(self, queries: List[str], limit: int = 10) -> List[List[dict]]:
+        """
+        Search for several queries at once.
+        All queries are embedded in a single API request, then the vector
+        index lookups run concurrently. Returns one result list per query.
+        """
+        # Queries are short, so one request (max_concurrency=1) beats several
+        embeddings = await self.embedder.embed_texts(queries, max_concurrency=1)
+        
+        async def search_one(embedding):
+            if not embedding:
+                return []
+            return await self.search_by_vector(embedding, limit)
+        
+        return await asyncio.gather(*[search_one(embedding) for embedding in embeddings])
+    
+    async def search_by_vector(self, query_embedding: List[float], limit: int = 10) -> List[dict]:
+        """Find texts similar to an already computed (unit length) query embedding"""
+        driver = get_async_driver()
         try:
-            with driver.session() as session:
-                # Use Neo4j vector similarity search
-                results = session.run("""
-                    MATCH (t:Text)
-                    WHERE t.embedding IS NOT NULL
-                    WITH t, 
-                         gds.similarity.cosine(t.embedding, $query_embedding) AS score
+            async with driver.session(database=NEO4J_DATABASE) as session:
+                # Use the Neo4j vector index (HNSW) instead of scanning every text.
+                # The index reports cosine as (1 + cos) / 2, so map it back to cos.
+                results = await session.run("""
+                    CALL db.index.vector.queryNodes('text_embedding_idx', $limit, $query_embedding)
+                    YIELD node AS t, score
+                    WITH t, 2 * score - 1 AS score
                     WHERE score > 0.7
-                    RETURN t.`<id>` as id,
+                    RETURN t.id as id,
                            t.id as text_ref,
                            coalesce(t.content_he, t.content_en) as content,
                            score
                     ORDER BY score DESC
-                    LIMIT $limit
                 """, {
                     "query_embedding": query_embedding,
                     "limit": limit
                 })
                 
-                return [dict(record) for record in results]
+                return await results.data()
         except Exception as e:
             print(f"Error in semantic search: {e}")
             return []
     
     async def find_similar_texts(self, text_id: str, limit: int = 10) -> List[dict]:
         """Find texts similar to a given text"""
-        driver = get_driver()
+        driver = get_async_driver()
         
         try:
-            with driver.session() as session:
-                # Get embedding of source text
-                source = session.run("""
-                    MATCH (t:Text {`<id>`: $text_id})
-                    RETURN t.embedding as embedding
-                """, {"text_id": text_id}).single()
-                
-                if not source or not source["embedding"]:
-                    return []
-                
-                source_embedding = source["embedding"]
-                
-                # Find similar texts
-                results = session.run("""
-                    MATCH (t:Text)
-                    WHERE t.`<id>` <> $text_id 
-                          AND t.embedding IS NOT NULL
-                    WITH t,
-                         gds.similarity.cosine(t.embedding, $source_embedding) AS score
-                    WHERE score > 0.8
-                    RETURN t.`<id>` as id,
+            async with driver.session(database=NEO4J_DATABASE) as session:
+                # Read the source vector and probe the vector index in one
+                # query, so the 1536-float embedding never travels to the
+                # client and back. Ask for one extra neighbour since the
+                # source text is its own nearest match.
+                results = await session.run("""
+                    MATCH (source:Text {id: $text_id})
+                    WHERE source.embedding IS NOT NULL
+                    CALL db.index.vector.queryNodes('text_embedding_idx', $k, source.embedding)
+                    YIELD node AS t, score
+                    WITH t, 2 * score - 1 AS score
+                    WHERE t.id <> $text_id AND score > 0.8
+                    RETURN t.id as id,
                            t.id as text_ref,
                            coalesce(t.content_he, t.content_en) as content,
                            score
@@ -174,12 +496,29 @@ class SemanticSearch:
                     LIMIT $limit
                 """, {
                     "text_id": text_id,
-                    "source_embedding": source_embedding,
+                    "k": limit + 1,
                     "limit": limit
                 })
                 
-                return [dict(record) for record in results]
+                return await results.data()
         except Exception as e:
             print(f"Error finding similar texts: {e}")
             return []
 
+
+_text_embedder = None
+_semantic_search = None
+
+def get_text_embedder() -> TextEmbedder:
+    """Get singleton TextEmbedder instance"""
+    global _text_embedder
+    if _text_embedder is None:
+        _text_embedder = TextEmbedder()
+    return _text_embedder
+
+def get_semantic_search() -> SemanticSearch:
+    """Get singleton SemanticSearch instance"""
+    global _semantic_search
+    if _semantic_search is None:
+        _semantic_search = SemanticSearch()
+    return _semantic_search
@@ -0,0 +1,44 @@
+"""
+Shared OpenAI client
+One AsyncOpenAI client (and connection pool) per worker process, used by
+the commentary and embedding modules
+"""
+
+from openai import AsyncOpenAI
+from typing import Optional
+import os
+import httpx
+
+client = None
+
+def get_openai_client() -> Optional[AsyncOpenAI]:
+    """
+    Returns a singleton AsyncOpenAI client, or None if OPENAI_API_KEY is not set.
+    The underlying httpx client keeps connections alive and uses HTTP/2, so
+    concurrent requests share a few multiplexed connections instead of
+    opening a new TLS connection each.
+    """
+    global client
+    if client is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            return None
+
+        http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=500,
+                max_keepalive_connections=200,
+                keepalive_expiry=60
+            ),
+            timeout=httpx.Timeout(60.0, connect=5.0)
+        )
+        client = AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=5)
+    return client
+
+async def close_openai_client():
+    """Close the shared OpenAI client and its connection pool."""
+    global client
+    if client:
+        await client.close()
+        client = None
@@ -3,11 +3,163 @@ AI-Powered Sugya Extraction System
 Uses OpenAI GPT-4 to analyze Talmudic texts and extract sugyot
 """
 import os
-from typing import List, Dict, Optional, Tuple
-from openai import OpenAI
+import asyncio
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 import json
 import re
-from database import get_driver
+import hashlib
+import diskcache
+from ai.openai_client import get_openai_client
+from ai.embeddings import get_encoding
+from database import get_async_driver, ensure_schema, NEO4J_DATABASE
+
+# Patterns used on every text node, compiled once
+# \x00 separates texts in _combine_texts, so a tag never spans two texts
+_PAGE_REF_RE = re.compile(r'\s\d+[ab]$')
+_HTML_RE = re.compile(r'<[^>\x00]+>')
+_JSON_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+# Keyword classes for simulated analysis, matched in one pass per line.
+# When a line hits several classes the first one listed wins.
+_LINE_KIND_RE = re.compile(
+    r'(?P<kasha>\?|למה|מאי|מנא|היכי)'
+    r'|(?P<statement>אמר|תנן|תניא)'
+    r'|(?P<dispute>פלוגתא|מחלוקת)'
+)
+_LINE_KIND_PRIORITY = ('kasha', 'statement', 'dispute')
+_LINE_KIND_SPEAKERS = {'kasha': 'Gemara', 'statement': 'Gemara', 'dispute': 'Talmud'}
+
+# Maximum number of pages analyzed by GPT-4 at the same time.
+# Tune to the OpenAI account's RPM/TPM limits.
+SUGYA_CONCURRENCY = int(os.getenv("SUGYA_CONCURRENCY", "8"))
+
+# Number of tractates extracted at the same time by extract_all_sugyot.
+# Each one runs up to SUGYA_CONCURRENCY page analyses of its own.
+SUGYA_TRACTATE_CONCURRENCY = int(os.getenv("SUGYA_TRACTATE_CONCURRENCY", "4"))
+
+# On-disk cache of raw model responses, so reruns don't pay for pages
+# whose content hasn't changed
+SUGYA_AI_CACHE_DIR = os.getenv("SUGYA_AI_CACHE_DIR", "/var/cache/sugya_ai")
+
+# Size of one page's content in an analysis prompt, in tokens. gpt-4 has an
+# 8192-token context: this leaves room for the ~700 tokens of instructions
+# and the 1500-token completion.
+MAX_PAGE_TOKENS = 5500
+
+# Several pages are sent in one request so the shared instructions are only
+# paid for once. Pages are packed until either limit is reached.
+SUGYA_PAGES_PER_PROMPT = int(os.getenv("SUGYA_PAGES_PER_PROMPT", "5"))
+SUGYA_PROMPT_TOKEN_BUDGET = 12000
+
+# Multi-page prompts need a larger context window than gpt-4's 8k
+SUGYA_BATCHED_MODEL = "gpt-4o"
+
+# Sugyot with at least this many dialectic nodes are written with
+# apoc.periodic.iterate (committing in chunks) when APOC is installed
+APOC_NODE_THRESHOLD = 50
+APOC_BATCH_SIZE = 500
+
+# Per-row Cypher shared by the UNWIND and APOC write paths
+# (row variables: n for nodes, e for edges)
+_DIALECTIC_NODE_WRITE = """
+MATCH (s:Sugya {ref: $sugya_ref})
+MERGE (d:DialecticNode {
+    id: n.id,
+    sugya_ref: $sugya_ref
+})
+SET d.type = n.type,
+    d.label = n.label,
+    d.speaker = n.speaker,
+    d.content_preview = n.content_preview,
+    d.sequence = n.sequence,
+    d.parent_id = n.parent_id
+MERGE (s)-[:HAS_DIALECTIC_NODE]->(d)
+"""
+_DIALECTIC_EDGE_WRITE = """
+MATCH (parent:DialecticNode {id: e.parent, sugya_ref: $sugya_ref})
+MATCH (child:DialecticNode {id: e.child, sugya_ref: $sugya_ref})
+MERGE (parent)-[:LEADS_TO]->(child)
+"""
+
+ANALYSIS_SYSTEM_PROMPT = "You are an expert in Talmudic literature and dialectic analysis. Analyze the given sugya and extract its structure."
+
+ANALYSIS_INSTRUCTIONS = """Please provide a COMPLETE analysis with:
+1. A concise title (5-10 words) that captures the main topic
+2. A one-sentence summary
+3. The main theme or question being discussed
+4. The COMPLETE dialectic structure - extract ALL steps, statements, and arguments
+
+For the dialectic_nodes array, include EVERY step of the sugya:
+- EVERY question (kasha, kushya, teyuvta)
+- EVERY answer (terutz, peshat, teshuvah)
+- EVERY teaching (mishnah, braita, statement)
+- EVERY dispute (machloket, pluga)
+- EVERY challenge and resolution
+- EVERY proof and refutation
+- ALL intermediate steps
+
+For each node provide:
+- id: sequential number (1, 2, 3, ...)
+- type: "question", "answer", "kasha", "terutz", "mishnah", "braita", "statement", "dispute", "proof", "refutation", "conclusion", "teiku"
+- label: clear description of this step (50-100 characters)
+- speaker: who is speaking (Mishnah, Gemara, specific rabbi if mentioned)
+- content_preview: first 30-50 words from the actual text
+- parent_id: ID of the step this responds to (null for first step)
+
+IMPORTANT: Extract as many nodes as possible - aim for 10-20+ nodes per sugya to capture the complete dialectic flow.
+
+Format your response as JSON:
+{
+    "title": "...",
+    "summary": "...",
+    "main_question": "...",
+    "theme": "...",
+    "dialectic_nodes": [
+        {
+            "id": "1",
+            "type": "mishnah",
+            "label": "Initial teaching from Mishnah",
+            "speaker": "Mishnah",
+            "content_preview": "...",
+            "parent_id": null
+        },
+        {
+            "id": "2",
+            "type": "question",
+            "label": "Gemara asks for clarification",
+            "speaker": "Gemara",
+            "content_preview": "...",
+            "parent_id": "1"
+        },
+        {
+            "id": "3",
+            "type": "answer",
+            "label": "Response explaining the timing",
+            "speaker": "R. Yochanan",
+            "content_preview": "...",
+            "parent_id": "2"
+        },
+        ... (continue with ALL steps)
+    ]
+}"""
+
+# Prompt text that is identical for every page. It comes first in each
+# prompt, with the page-specific text last, so OpenAI's automatic prompt
+# caching can reuse the prefix across requests.
+_STATIC_PROMPT_PREFIX = f"""Analyze the Talmudic sugya given after the ---- line and extract ALL dialectic steps.
+
+{ANALYSIS_INSTRUCTIONS}"""
+
+_STATIC_BATCHED_PROMPT_PREFIX = f"""Analyze each of the Talmudic sugyot given after the ---- line separately and extract ALL dialectic steps of each.
+Each page starts with a "### PAGE n: <page reference>" header.
+
+For EACH page, follow these instructions:
+
+{ANALYSIS_INSTRUCTIONS}
+
+Return ONE JSON object of the form {{"pages": [...]}} with one element per page, in the same order.
+Each element has the format above plus a "page_ref" field with the page reference exactly as given
+in its ### PAGE header (e.g. "Berakhot 2a")."""
 
 class SugyaExtractor:
     """
@@ -20,41 +172,60 @@ class SugyaExtractor:
     - Generate titles and summaries
     """
     
+    # Schema check runs once per process, not once per instance
+    _schema_ready = False
+    _schema_lock = None
+    
     def __init__(self):
-        self.driver = get_driver()
+        self.driver = get_async_driver()
         api_key = os.getenv("OPENAI_API_KEY")
         
         if not api_key or api_key == "sk-your-openai-api-key-here":
             print("⚠️  Warning: OPENAI_API_KEY not set. AI extraction will be simulated.")
             self.client = None
         else:
-            self.client = OpenAI(api_key=api_key)
+            # Shared pooled HTTP/2 client; it retries rate-limited (429)
+            # requests with exponential backoff
+            self.client = get_openai_client()
             print("✅ OpenAI client initialized for sugya extraction")
+        
+        try:
+            self.response_cache = diskcache.Cache(SUGYA_AI_CACHE_DIR)
+        except Exception as e:
+            print(f"⚠️  Could not open AI response cache at {SUGYA_AI_CACHE_DIR} (caching disabled): {e}")
+            self.response_cache = None
+        
+        # Whether apoc.periodic.iterate is available; detected on first use
+        self._has_apoc = None
+        self._tokenizer_failed = False
     
-    def discover_all_tractates(self) -> List[str]:
+    async def discover_all_tractates(self) -> List[str]:
         """
         Discover all Talmudic tractates that have texts in the database.
         
         Returns:
             List of tractate names found in the database
         """
-        with self.driver.session() as session:
-            query = """
-            MATCH (t:Text)
-            WHERE t.id =~ '.*\\d+[ab]:.*'
-            WITH split(t.id, ' ') as parts
-            WHERE size(parts) > 1
-            WITH parts[0] as tractate
-            RETURN DISTINCT tractate
-            ORDER BY tractate
-            """
-            
-            result = session.run(query)
-            tractates = [record['tractate'] for record in result]
-            
-            return tractates
+        # Same page grouping as _iter_pages: "Bava Metzia 2a:5" is on page
+        # "Bava Metzia 2a", whose tractate is everything before the last
+        # space, so multi-word names stay whole
+        query = """
+        MATCH (t:Text)
+        WHERE t.id IS NOT NULL
+        RETURN DISTINCT split(t.id, ':')[0] AS page_ref
+        """
+        
+        tractates = set()
+        async with self.driver.session(database=NEO4J_DATABASE) as session:
+            result = await session.run(query)
+            async for record in result:
+                page_ref = record['page_ref']
+                if _PAGE_REF_RE.search(page_ref):
+                    tractates.add(page_ref.rsplit(' ', 1)[0])
+        
+        return sorted(tractates)
     
-    def extract_all_sugyot(self, limit_per_tractate: int = 100) -> Dict:
+    async def extract_all_sugyot(self, limit_per_tractate: int = 100) -> Dict:
         """
         Discover and extract ALL sugyot from ALL tractates in the database.
         
@@ -71,7 +242,7 @@ class SugyaExtractor:
         print("=" * 80)
         
         # Discover all tractates
-        tractates = self.discover_all_tractates()
+        tractates = await self.discover_all_tractates()
         print(f"\nFound {len(tractates)} tractates with Talmudic texts:")
         for tractate in tractates:
             print(f"  - {tractate}")
@@ -100,40 +271,202 @@ class SugyaExtractor:
             'tractate_details': []
         }
         
-        for i, tractate in enumerate(tractates, 1):
-            print(f"\n{'=' * 80}")
-            print(f"📖 TRACTATE {i}/{len(tractates)}: {tractate}")
-            print(f"{'=' * 80}")
-            
-            try:
-                stats = self.extract_and_save_all(
+        # Tractates are independent, so several run at once; the semaphore
+        # keeps the Neo4j pool and OpenAI rate limits from being swamped
+        semaphore = asyncio.Semaphore(SUGYA_TRACTATE_CONCURRENCY)
+        
+        async def process(i: int, tractate: str) -> Dict:
+            async with semaphore:
+                print(f"\n{'=' * 80}")
+                print(f"📖 TRACTATE {i}/{len(tractates)}: {tractate}")
+                print(f"{'=' * 80}")
+                
+                return await self.extract_and_save_all(
                     tractate=tractate,
                     start_page="",  # Empty means all pages
                     limit=limit_per_tractate
                 )
-                
-                all_stats['tractates_processed'] += 1
-                all_stats['total_extracted'] += stats['total_extracted']
-                all_stats['total_saved'] += stats['saved']
-                all_stats['total_failed'] += stats['failed']
-                all_stats['tractate_details'].append({
-                    'tractate': tractate,
-                    'extracted': stats['total_extracted'],
-                    'saved': stats['saved']
-                })
-                
-                print(f"\n✅ {tractate}: Extracted {stats['total_extracted']}, Saved {stats['saved']}")
-                
-            except Exception as e:
-                print(f"\n❌ Error processing {tractate}: {e}")
+        
+        results = await asyncio.gather(
+            *[process(i, tractate) for i, tractate in enumerate(tractates, 1)],
+            return_exceptions=True
+        )
+        
+        for tractate, stats in zip(tractates, results):
+            if isinstance(stats, Exception):
+                print(f"\n❌ Error processing {tractate}: {stats}")
                 all_stats['tractate_details'].append({
                     'tractate': tractate,
-                    'error': str(e)
+                    'error': str(stats)
                 })
+                continue
+            
+            all_stats['tractates_processed'] += 1
+            all_stats['total_extracted'] += stats['total_extracted']
+            all_stats['total_saved'] += stats['saved']
+            all_stats['total_failed'] += stats['failed']
+            all_stats['tractate_details'].append({
+                'tractate': tractate,
+                'extracted': stats['total_extracted'],
+                'saved': stats['saved']
+            })
+            
+            print(f"\n✅ {tractate}: Extracted {stats['total_extracted']}, Saved {stats['saved']}")
+        
+        return all_stats
+    
+    async def extract_all_sugyot_batch(
+        self,
+        limit_per_tractate: int = 100,
+        poll_interval: int = 60
+    ) -> Dict:
+        """
+        Extract sugyot from ALL tractates through the OpenAI Batch API.
+        
+        Batch jobs cost half as much as live requests and use a separate rate
+        limit pool, at the price of up to 24h turnaround - a good fit for
+        whole-database extraction. The batch id is stored on a SugyaBatch
+        node, so re-running after a restart resumes the pending batch
+        instead of submitting (and paying for) a new one.
+        
+        Args:
+            limit_per_tractate: Maximum texts to analyze per tractate
+            poll_interval: Seconds between batch status checks
+        
+        Returns:
+            Statistics about the complete extraction (same shape as extract_all_sugyot)
+        """
+        if not self.client:
+            print("⚠️  Batch API needs OPENAI_API_KEY - falling back to live extraction")
+            return await self.extract_all_sugyot(limit_per_tractate)
+        
+        batch_id = await self._get_pending_batch_id()
+        
+        if batch_id:
+            print(f"🔁 Resuming pending batch {batch_id}")
+        else:
+            tractates = await self.discover_all_tractates()
+            print(f"\nFound {len(tractates)} tractates with Talmudic texts")
+            
+            # One request line per page, keyed by page reference
+            lines = []
+            for tractate in tractates:
+                async for page_ref, page_texts in self._iter_pages(tractate, "", limit_per_tractate):
+                    lines.append(json.dumps({
+                        "custom_id": page_ref,
+                        "method": "POST",
+                        "url": "/v1/chat/completions",
+                        "body": self._analysis_request(page_ref, self._combine_texts(page_texts))
+                    }, ensure_ascii=False))
+            
+            if not lines:
+                print("\n❌ No pages found in database")
+                return {
+                    'tractates_found': len(tractates),
+                    'tractates_processed': 0,
+                    'total_extracted': 0,
+                    'total_saved': 0,
+                    'total_failed': 0
+                }
+            
+            batch_file = await self.client.files.create(
+                file=("sugya_batch.jsonl", "\n".join(lines).encode("utf-8")),
+                purpose="batch"
+            )
+            batch = await self.client.batches.create(
+                input_file_id=batch_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h"
+            )
+            batch_id = batch.id
+            await self._record_batch(batch_id, batch.status)
+            print(f"📤 Submitted batch {batch_id} with {len(lines)} pages")
+        
+        # Wait for the batch to finish
+        while True:
+            batch = await self.client.batches.retrieve(batch_id)
+            await self._record_batch(batch_id, batch.status)
+            if batch.status in ("completed", "failed", "expired", "cancelled"):
+                break
+            print(f"   ⏳ Batch {batch_id}: {batch.status}")
+            await asyncio.sleep(poll_interval)
+        
+        if batch.status != "completed" or not batch.output_file_id:
+            raise RuntimeError(f"Batch {batch_id} ended with status '{batch.status}'")
+        
+        # Map each result back to its page and save it
+        output = await self.client.files.content(batch.output_file_id)
+        all_stats = {
+            'tractates_found': 0,
+            'tractates_processed': 0,
+            'total_extracted': 0,
+            'total_saved': 0,
+            'total_failed': 0,
+            'tractate_details': []
+        }
+        per_tractate = {}
+        
+        for line in output.text.splitlines():
+            if not line.strip():
+                continue
+            
+            item = json.loads(line)
+            page_ref = item["custom_id"]
+            details = per_tractate.setdefault(
+                page_ref.rsplit(' ', 1)[0],
+                {'extracted': 0, 'saved': 0}
+            )
+            
+            response = item.get("response") or {}
+            if item.get("error") or response.get("status_code") != 200:
+                print(f"   ⚠️  Batch request failed for {page_ref}: {item.get('error')}")
+                all_stats['total_failed'] += 1
+                continue
+            
+            content = response["body"]["choices"][0]["message"]["content"]
+            sugya_data = self._parse_ai_response(page_ref, content)
+            details['extracted'] += 1
+            all_stats['total_extracted'] += 1
+            
+            if await self.save_sugya_to_database(sugya_data):
+                details['saved'] += 1
+                all_stats['total_saved'] += 1
+                print(f"   ✅ Saved: {sugya_data['ref']} - {sugya_data['title']}")
+            else:
+                all_stats['total_failed'] += 1
+        
+        for tractate, details in per_tractate.items():
+            all_stats['tractate_details'].append({'tractate': tractate, **details})
+        all_stats['tractates_found'] = len(per_tractate)
+        all_stats['tractates_processed'] = len(per_tractate)
         
+        await self._record_batch(batch_id, "processed")
         return all_stats
     
-    def extract_sugyot_from_tractate(
+    async def _get_pending_batch_id(self) -> Optional[str]:
+        """Return the id of a submitted batch whose results haven't been saved yet"""
+        async with self.driver.session(database=NEO4J_DATABASE) as session:
+            result = await session.run("""
+            MATCH (b:SugyaBatch)
+            WHERE NOT b.status IN ['processed', 'failed', 'expired', 'cancelled']
+            RETURN b.id as id
+            ORDER BY b.created_at DESC
+            LIMIT 1
+            """)
+            record = await result.single()
+            return record['id'] if record else None
+    
+    async def _record_batch(self, batch_id: str, status: str):
+        """Persist a batch's status so interrupted runs can resume it"""
+        async with self.driver.session(database=NEO4J_DATABASE) as session:
+            await session.run("""
+            MERGE (b:SugyaBatch {id: $id})
+            ON CREATE SET b.created_at = datetime()
+            SET b.status = $status,
+                b.updated_at = datetime()
+            """, {'id': batch_id, 'status': status})
+    
+    async def extract_sugyot_from_tractate(
         self, 
         tractate: str = "Berakhot",
         start_page: str = "2a",
@@ -154,106 +487,96 @@ class SugyaExtractor:
         """
         print(f"\n🔍 Extracting sugyot from {tractate} {start_page}...")
         
-        # Step 1: Fetch texts from database
-        texts = self._fetch_texts(tractate, start_page, limit)
-        print(f"   Found {len(texts)} texts to analyze")
+        # Step 1: Stream texts from database, already grouped by page for context
+        pages = {}
         
-        if not texts:
-            return []
+        async def page_contents():
+            async for page_ref, page_texts in self._iter_pages(tractate, start_page, limit):
+                pages[page_ref] = page_texts
+                yield page_ref, self._combine_texts(page_texts)
+        
+        # Step 2: Analyze pages with AI, several pages per request, with
+        # requests running concurrently (bounded by SUGYA_CONCURRENCY).
+        # Each group is sent as soon as it is full, while later pages are
+        # still arriving from the database.
+        semaphore = asyncio.Semaphore(SUGYA_CONCURRENCY)
         
-        # Step 2: Group texts by page for context
-        pages = self._group_texts_by_page(texts)
+        async def analyze_slice(pages_slice: List[Tuple[str, str]]) -> List[Optional[Dict]]:
+            async with semaphore:
+                print(f"\n   Analyzing {', '.join(page_ref for page_ref, _ in pages_slice)}...")
+                
+                if len(pages_slice) == 1:
+                    page_ref, content = pages_slice[0]
+                    return [await self._analyze_sugya_with_ai(page_ref, content)]
+                return await self._analyze_sugyot_batched(pages_slice)
+        
+        tasks = []
+        async for pages_slice in self._iter_page_slices(page_contents()):
+            tasks.append(asyncio.create_task(analyze_slice(pages_slice)))
+        
+        print(f"   Found {sum(len(texts) for texts in pages.values())} texts to analyze")
+        if not tasks:
+            return []
         print(f"   Grouped into {len(pages)} pages")
         
-        # Step 3: Analyze each page with AI
-        extracted_sugyot = []
-        for page_ref, page_texts in pages.items():
-            print(f"\n   Analyzing {page_ref}...")
-            
-            # Combine texts for analysis
-            combined_content = self._combine_texts(page_texts)
-            
-            # Use AI to analyze the sugya
-            sugya_data = self._analyze_sugya_with_ai(page_ref, combined_content)
-            
+        slice_results = await asyncio.gather(*tasks)
+        results = [sugya_data for slice_result in slice_results for sugya_data in slice_result]
+        
+        for sugya_data in results:
             if sugya_data:
-                sugya_data['texts'] = page_texts
-                extracted_sugyot.append(sugya_data)
+                sugya_data['texts'] = pages.get(sugya_data['ref'], [])
                 print(f"   ✅ Extracted: {sugya_data['title']}")
         
-        return extracted_sugyot
-    
-    def _fetch_texts(self, tractate: str, page: str, limit: int) -> List[Dict]:
-        """Fetch texts from Neo4j database"""
-        with self.driver.session() as session:
-            # Build query based on parameters
-            if page:
-                # Specific page
-                query = """
-                MATCH (t:Text)
-                WHERE t.id CONTAINS $tractate 
-                AND t.id CONTAINS $page
-                RETURN t.id as id,
-                       t.content_he as content_he,
-                       t.content_en as content_en
-                ORDER BY t.id
-                LIMIT $limit
-                """
-                params = {"tractate": tractate, "page": page, "limit": limit}
-            else:
-                # All pages from tractate
-                query = """
-                MATCH (t:Text)
-                WHERE t.id STARTS WITH $tractate
-                AND t.id =~ '.*\\d+[ab]:.*'
-                RETURN t.id as id,
-                       t.content_he as content_he,
-                       t.content_en as content_en
-                ORDER BY t.id
-                LIMIT $limit
-                """
-                params = {"tractate": tractate + " ", "limit": limit}
-            
-            result = session.run(query, params)
-            
-            texts = []
-            for record in result:
-                texts.append({
-                    'id': record['id'],
-                    'content_he': record.get('content_he', ''),
-                    'content_en': record.get('content_en', [])
-                })
-            
-            return texts
+        # gather keeps page order
+        return [sugya_data for sugya_data in results if sugya_data]
     
-    def _group_texts_by_page(self, texts: List[Dict]) -> Dict[str, List[Dict]]:
-        """Group texts by page reference"""
-        pages = {}
+    async def _iter_pages(self, tractate: str, page: str, limit: int) -> AsyncIterator[Tuple[str, List[Dict]]]:
+        """
+        Stream texts from Neo4j database, grouped by page reference.
         
-        for text in texts:
-            text_id = text['id']
-            
-            # Extract page reference (e.g., "2a", "2b")
-            page_match = re.search(r'(\d+[ab])', text_id)
-            if page_match:
-                page = page_match.group(1)
-                
-                # Extract tractate name
-                tractate_match = re.search(r'([A-Za-z]+)\s+\d+[ab]', text_id)
-                tractate = tractate_match.group(1) if tractate_match else "Unknown"
-                
-                page_ref = f"{tractate} {page}"
-                
-                if page_ref not in pages:
-                    pages[page_ref] = []
-                
-                pages[page_ref].append(text)
+        Grouping happens in Cypher: a text id like "Berakhot 2a:5" belongs to
+        page "Berakhot 2a" (everything before the colon). Pages are yielded
+        as their records arrive, so callers can start working on the first
+        pages while the rest are still being received.
+        
+        Yields:
+            (page reference, texts on that page in id order)
+        """
+        # A prefix match on the structured id can use the Text.id index
+        if page:
+            # Specific page
+            prefix = f"{tractate} {page}:"
+        else:
+            # All pages from tractate
+            prefix = f"{tractate} "
+        
+        query = """
+        MATCH (t:Text)
+        WHERE t.id STARTS WITH $prefix
+        WITH t
+        ORDER BY t.id
+        LIMIT $limit
+        WITH split(t.id, ':')[0] AS page_ref, t
+        RETURN page_ref,
+               collect({
+                   id: t.id,
+                   content_he: coalesce(t.content_he, ''),
+                   content_en: t.content_en
+               }) AS texts
+        ORDER BY page_ref
+        """
         
-        return pages
+        async with self.driver.session(database=NEO4J_DATABASE) as session:
+            result = await session.run(query, {"prefix": prefix, "limit": limit})
+            async for record in result:
+                # Only Talmud pages (ids like "Berakhot 2a:5"); checked once
+                # per page here instead of with a regex on every text in Cypher
+                if _PAGE_REF_RE.search(record['page_ref']):
+                    yield record['page_ref'], record['texts']
     
     def _combine_texts(self, texts: List[Dict]) -> str:
         """Combine multiple text nodes into a single string for analysis"""
-        combined = []
+        contents = []
         
         for text in texts:
             content = text.get('content_he', '')
@@ -262,15 +585,15 @@ class SugyaExtractor:
             if isinstance(content, list):
                 content = ' '.join(str(c) for c in content if c)
             
-            # Remove HTML tags
-            content = re.sub(r'<[^>]+>', '', str(content))
-            
-            if content.strip():
-                combined.append(content.strip())
+            contents.append(str(content))
+        
+        # Remove HTML tags in one pass over the whole page
+        stripped = _HTML_RE.sub('', '\x00'.join(contents))
         
+        combined = [content.strip() for content in stripped.split('\x00') if content.strip()]
         return '\n\n'.join(combined)
     
-    def _analyze_sugya_with_ai(self, page_ref: str, content: str) -> Optional[Dict]:
+    async def _analyze_sugya_with_ai(self, page_ref: str, content: str) -> Optional[Dict]:
         """
         Use AI to analyze a sugya and extract its structure.
         
@@ -281,29 +604,23 @@ class SugyaExtractor:
             # Simulate AI response when no API key
             return self._simulate_ai_analysis(page_ref, content)
         
+        request = self._analysis_request(page_ref, content)
+        
+        # The page reference is left out of the key so pages with identical
+        # content share one response
+        cache_key = self._response_cache_key(
+            request["model"], _STATIC_PROMPT_PREFIX, self._truncate_content(content)
+        )
+        cached = self._get_cached_response(cache_key)
+        if cached:
+            return self._parse_ai_response(page_ref, cached)
+        
         try:
-            # Prepare the prompt
-            prompt = self._create_analysis_prompt(page_ref, content)
-            
             # Call GPT-4
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert in Talmudic literature and dialectic analysis. Analyze the given sugya and extract its structure."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.7,
-                max_tokens=1500
-            )
+            result = await self._complete_streamed(request)
             
             # Parse the response
-            result = response.choices[0].message.content
+            self._set_cached_response(cache_key, result)
             sugya_data = self._parse_ai_response(page_ref, result)
             
             return sugya_data
@@ -312,83 +629,188 @@ class SugyaExtractor:
             print(f"   ⚠️  AI analysis failed: {e}")
             return self._simulate_ai_analysis(page_ref, content)
     
-    def _create_analysis_prompt(self, page_ref: str, content: str) -> str:
-        """Create a prompt for AI analysis"""
-        # Truncate content if too long
-        max_length = 4000
-        if len(content) > max_length:
-            content = content[:max_length] + "..."
+    async def _complete_streamed(self, request: Dict) -> str:
+        """
+        Run a chat completion with stream=True and return the full text.
+        Tokens arrive continuously, so the client's read timeout applies
+        between chunks rather than to the whole 1500-token generation.
+        """
+        stream = await self.client.chat.completions.create(**request, stream=True)
+        parts = []
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+        return "".join(parts)
+    
+    async def _iter_page_slices(
+        self,
+        page_contents: AsyncIterator[Tuple[str, str]]
+    ) -> AsyncIterator[List[Tuple[str, str]]]:
+        """
+        Pack consecutive pages into groups that fit one prompt, yielding each
+        group as soon as it is full.
+        """
+        current = []
+        current_tokens = 0
         
-        return f"""Analyze this Talmudic sugya from {page_ref} and extract ALL dialectic steps.
-
+        async for page_ref, content in page_contents:
+            tokens = min(self._count_tokens(content), MAX_PAGE_TOKENS)
+            if current and (
+                len(current) >= SUGYA_PAGES_PER_PROMPT
+                or current_tokens + tokens > SUGYA_PROMPT_TOKEN_BUDGET
+            ):
+                yield current
+                current = []
+                current_tokens = 0
+            current.append((page_ref, content))
+            current_tokens += tokens
+        
+        if current:
+            yield current
+    
+    async def _analyze_sugyot_batched(self, pages_slice: List[Tuple[str, str]]) -> List[Optional[Dict]]:
+        """
+        Analyze several pages with a single request.
+        Pages missing from the response are analyzed on their own.
+        
+        Returns:
+            One sugya dict per page, in the order of pages_slice
+        """
+        if not self.client:
+            return [self._simulate_ai_analysis(page_ref, content) for page_ref, content in pages_slice]
+        
+        prompt = self._create_batched_analysis_prompt(pages_slice)
+        cache_key = self._response_cache_key(SUGYA_BATCHED_MODEL, prompt)
+        
+        by_ref = {}
+        try:
+            result = self._get_cached_response(cache_key)
+            if not result:
+                result = await self._complete_streamed({
+                    "model": SUGYA_BATCHED_MODEL,
+                    "messages": [
+                        {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+                        {"role": "user", "content": prompt}
+                    ],
+                    "temperature": 0.7,
+                    "max_tokens": min(1500 * len(pages_slice), 16000),
+                    "response_format": {"type": "json_object"}
+                })
+                self._set_cached_response(cache_key, result)
+            
+            data = json.loads(result)
+            for item in data.get('pages', []):
+                if isinstance(item, dict) and item.get('page_ref'):
+                    by_ref[item['page_ref']] = item
+        except Exception as e:
+            print(f"   ⚠️  Batched AI analysis failed, analyzing pages one by one: {e}")
+        
+        results = []
+        for page_ref, content in pages_slice:
+            item = by_ref.get(page_ref)
+            if item:
+                results.append(self._parse_ai_response(page_ref, json.dumps(item, ensure_ascii=False)))
+            else:
+                results.append(await self._analyze_sugya_with_ai(page_ref, content))
+        return results
+    
+    def _response_cache_key(self, *parts: str) -> str:
+        """Hash everything that determines a model response"""
+        return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+    
+    def _get_cached_response(self, key: str) -> Optional[str]:
+        """Return a previously cached raw model response, if any"""
+        if self.response_cache is None:
+            return None
+        try:
+            return self.response_cache.get(key)
+        except Exception as e:
+            print(f"   ⚠️  AI response cache read failed: {e}")
+            return None
+    
+    def _set_cached_response(self, key: str, response: str):
+        """Remember a raw model response for identical future requests"""
+        if self.response_cache is None or not response:
+            return
+        try:
+            self.response_cache.set(key, response)
+        except Exception as e:
+            print(f"   ⚠️  AI response cache write failed: {e}")
+    
+    def _analysis_request(self, page_ref: str, content: str) -> Dict:
+        """Chat completion parameters for analyzing one page (live or via the Batch API)"""
+        return {
+            "model": "gpt-4",
+            "messages": [
+                {
+                    "role": "system",
+                    "content": ANALYSIS_SYSTEM_PROMPT
+                },
+                {
+                    "role": "user",
+                    "content": self._create_analysis_prompt(page_ref, content)
+                }
+            ],
+            "temperature": 0.7,
+            "max_tokens": 1500
+        }
+    
+    def _create_analysis_prompt(self, page_ref: str, content: str) -> str:
+        """Create a prompt for AI analysis (static instructions first, page last)"""
+        return f"""{_STATIC_PROMPT_PREFIX}
+----
+PAGE: {page_ref}
 TEXT:
-{content}
-
-Please provide a COMPLETE analysis with:
-1. A concise title (5-10 words) that captures the main topic
-2. A one-sentence summary
-3. The main theme or question being discussed
-4. The COMPLETE dialectic structure - extract ALL steps, statements, and arguments
-
-For the dialectic_nodes array, include EVERY step of the sugya:
-- EVERY question (kasha, kushya, teyuvta)
-- EVERY answer (terutz, peshat, teshuvah)
-- EVERY teaching (mishnah, braita, statement)
-- EVERY dispute (machloket, pluga)
-- EVERY challenge and resolution
-- EVERY proof and refutation
-- ALL intermediate steps
-
-For each node provide:
-- id: sequential number (1, 2, 3, ...)
-- type: "question", "answer", "kasha", "terutz", "mishnah", "braita", "statement", "dispute", "proof", "refutation", "conclusion", "teiku"
-- label: clear description of this step (50-100 characters)
-- speaker: who is speaking (Mishnah, Gemara, specific rabbi if mentioned)
-- content_preview: first 30-50 words from the actual text
-- parent_id: ID of the step this responds to (null for first step)
-
-IMPORTANT: Extract as many nodes as possible - aim for 10-20+ nodes per sugya to capture the complete dialectic flow.
-
-Format your response as JSON:
-{{
-    "title": "...",
-    "summary": "...",
-    "main_question": "...",
-    "theme": "...",
-    "dialectic_nodes": [
-        {{
-            "id": "1",
-            "type": "mishnah",
-            "label": "Initial teaching from Mishnah",
-            "speaker": "Mishnah",
-            "content_preview": "...",
-            "parent_id": null
-        }},
-        {{
-            "id": "2",
-            "type": "question",
-            "label": "Gemara asks for clarification",
-            "speaker": "Gemara",
-            "content_preview": "...",
-            "parent_id": "1"
-        }},
-        {{
-            "id": "3",
-            "type": "answer",
-            "label": "Response explaining the timing",
-            "speaker": "R. Yochanan",
-            "content_preview": "...",
-            "parent_id": "2"
-        }},
-        ... (continue with ALL steps)
-    ]
-}}"""
+{self._truncate_content(content)}
+"""
+    
+    def _tokenize(self, content: str) -> Optional[List[int]]:
+        """Token ids for content, or None if the tokenizer can't be loaded"""
+        if self._tokenizer_failed:
+            return None
+        try:
+            return get_encoding().encode(content)
+        except Exception as e:
+            # Don't retry the download for every page
+            self._tokenizer_failed = True
+            print(f"⚠️  Could not load tokenizer, counting characters instead: {e}")
+            return None
+    
+    def _count_tokens(self, content: str) -> int:
+        """Prompt tokens used by content (one per character if the tokenizer is unavailable)"""
+        tokens = self._tokenize(content)
+        return len(tokens) if tokens is not None else len(content)
+    
+    def _truncate_content(self, content: str) -> str:
+        """Truncate page content to MAX_PAGE_TOKENS tokens"""
+        # A token is at least one character, so short pages can't be over the limit
+        if len(content) <= MAX_PAGE_TOKENS:
+            return content
+        
+        tokens = self._tokenize(content)
+        if tokens is None:
+            return content[:MAX_PAGE_TOKENS] + "..."
+        if len(tokens) <= MAX_PAGE_TOKENS:
+            return content
+        return get_encoding().decode(tokens[:MAX_PAGE_TOKENS]) + "..."
+    
+    def _create_batched_analysis_prompt(self, pages_slice: List[Tuple[str, str]]) -> str:
+        """Create one prompt that asks for the analysis of several pages at once"""
+        sections = "\n\n".join(
+            f"### PAGE {i}: {page_ref}\n{self._truncate_content(content)}"
+            for i, (page_ref, content) in enumerate(pages_slice, 1)
+        )
+        
+        return f"""{_STATIC_BATCHED_PROMPT_PREFIX}
+----
+{sections}
+"""
     
     def _parse_ai_response(self, page_ref: str, response: str) -> Dict:
         """Parse AI response into structured data"""
         try:
             # Extract JSON from response
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
+            json_match = _JSON_RE.search(response)
             if json_match:
                 data = json.loads(json_match.group(0))
                 
@@ -418,18 +840,14 @@ Format your response as JSON:
         # Create nodes from content lines (simulate extracting steps)
         for i, line in enumerate(lines[:15], 1):  # Take up to 15 lines
             # Determine type based on position and keywords
+            kinds = {m.lastgroup for m in _LINE_KIND_RE.finditer(line)} if i > 1 else ()
+            kind = next((k for k in _LINE_KIND_PRIORITY if k in kinds), None)
             if i == 1:
                 node_type = 'mishnah'
                 speaker = 'Mishnah'
-            elif '?' in line or any(word in line for word in ['למה', 'מאי', 'מנא', 'היכי']):
-                node_type = 'kasha'
-                speaker = 'Gemara'
-            elif any(word in line for word in ['אמר', 'תנן', 'תניא']):
-                node_type = 'statement'
-                speaker = 'Gemara'
-            elif any(word in line for word in ['פלוגתא', 'מחלוקת']):
-                node_type = 'dispute'
-                speaker = 'Talmud'
+            elif kind:
+                node_type = kind
+                speaker = _LINE_KIND_SPEAKERS[kind]
             elif i % 2 == 0:
                 node_type = 'question'
                 speaker = 'Gemara'
@@ -473,104 +891,178 @@ Format your response as JSON:
             'dialectic_nodes': nodes
         }
     
-    def save_sugya_to_database(self, sugya_data: Dict) -> bool:
+    async def _ensure_schema(self):
+        """
+        Make sure the Sugya/DialecticNode constraints exist before the first
+        write. The API does this at startup, but the CLI doesn't go through it.
+        """
+        if SugyaExtractor._schema_ready:
+            return
+        # Saves run concurrently; they all wait for the one schema check
+        # instead of MERGEing before the unique constraints exist
+        if SugyaExtractor._schema_lock is None:
+            SugyaExtractor._schema_lock = asyncio.Lock()
+        async with SugyaExtractor._schema_lock:
+            if not SugyaExtractor._schema_ready:
+                # Left unset on failure so the next save tries again
+                SugyaExtractor._schema_ready = await ensure_schema()
+    
+    async def save_sugya_to_database(self, sugya_data: Dict) -> bool:
         """
         Save extracted sugya to Neo4j database.
-        Creates Sugya node and dialectic structure.
+        Creates Sugya node and dialectic structure in a single transaction.
         """
-        with self.driver.session() as session:
+        await self._ensure_schema()
+        
+        async def write(tx):
+            # Create Sugya node and link it to its Text nodes in one statement
+            query = """
+            MERGE (s:Sugya {ref: $ref})
+            SET s.title = $title,
+                s.summary = $summary,
+                s.theme = $theme,
+                s.main_question = $main_question,
+                s.extraction_method = 'ai_powered',
+                s.created_at = coalesce(s.created_at, datetime()),
+                s.updated_at = datetime()
+            WITH s
+            MATCH (t:Text)
+            WHERE t.id CONTAINS $ref
+            MERGE (s)-[:CONTAINS_TEXT]->(t)
+            """
+            
+            await tx.run(query, {
+                'ref': sugya_data['ref'],
+                'title': sugya_data['title'],
+                'summary': sugya_data['summary'],
+                'theme': sugya_data.get('theme', ''),
+                'main_question': sugya_data.get('main_question', '')
+            })
+            
+            # Create dialectic nodes
+            if sugya_data.get('dialectic_nodes') and not use_apoc:
+                await self._create_dialectic_nodes(tx, sugya_data)
+        
+        async with self.driver.session(database=NEO4J_DATABASE) as session:
             try:
-                # Create Sugya node
-                query = """
-                MERGE (s:Sugya {ref: $ref})
-                SET s.title = $title,
-                    s.summary = $summary,
-                    s.theme = $theme,
-                    s.main_question = $main_question,
-                    s.extraction_method = 'ai_powered',
-                    s.updated_at = datetime()
-                WITH s
-                WHERE s.created_at IS NULL
-                SET s.created_at = datetime()
-                RETURN s
-                """
-                
-                session.run(query, {
-                    'ref': sugya_data['ref'],
-                    'title': sugya_data['title'],
-                    'summary': sugya_data['summary'],
-                    'theme': sugya_data.get('theme', ''),
-                    'main_question': sugya_data.get('main_question', '')
-                })
-                
-                # Link to Text nodes
-                link_query = """
-                MATCH (s:Sugya {ref: $ref})
-                MATCH (t:Text)
-                WHERE t.id CONTAINS $ref
-                MERGE (s)-[:CONTAINS_TEXT]->(t)
-                """
-                
-                session.run(link_query, {'ref': sugya_data['ref']})
-                
-                # Create dialectic nodes
-                if sugya_data.get('dialectic_nodes'):
-                    self._create_dialectic_nodes(session, sugya_data)
-                
+                # Large structures are written after the sugya commits, in
+                # APOC-managed chunks instead of one growing transaction
+                use_apoc = (
+                    len(sugya_data.get('dialectic_nodes') or []) >= APOC_NODE_THRESHOLD
+                    and await self._apoc_available(session)
+                )
+                await session.execute_write(write)
+                if use_apoc:
+                    await self._create_dialectic_nodes_apoc(session, sugya_data)
                 return True
                 
             except Exception as e:
                 print(f"   ❌ Failed to save sugya: {e}")
                 return False
     
-    def _create_dialectic_nodes(self, session, sugya_data: Dict):
-        """Create dialectic node structure in database with parent-child relationships"""
+    async def _apoc_available(self, session) -> bool:
+        """Check once whether apoc.periodic.iterate is installed"""
+        if self._has_apoc is None:
+            try:
+                result = await session.run(
+                    "SHOW PROCEDURES YIELD name "
+                    "WHERE name = 'apoc.periodic.iterate' "
+                    "RETURN count(*) > 0 AS found"
+                )
+                record = await result.single()
+                self._has_apoc = bool(record and record['found'])
+            except Exception as e:
+                print(f"   ⚠️  Could not check for APOC, using UNWIND writes: {e}")
+                self._has_apoc = False
+        return self._has_apoc
+    
+    def _dialectic_rows(self, sugya_data: Dict) -> Tuple[List[Dict], List[Dict]]:
+        """Build the node and edge parameter rows for a sugya's dialectic structure"""
+        ref = sugya_data['ref']
         nodes = sugya_data.get('dialectic_nodes', [])
         
-        # First pass: Create all nodes
-        for i, node in enumerate(nodes):
-            query = """
-            MATCH (s:Sugya {ref: $sugya_ref})
-            MERGE (d:DialecticNode {
-                id: $node_id,
-                sugya_ref: $sugya_ref
-            })
-            SET d.type = $type,
-                d.label = $label,
-                d.speaker = $speaker,
-                d.content_preview = $content_preview,
-                d.sequence = $sequence,
-                d.parent_id = $parent_id
-            MERGE (s)-[:HAS_DIALECTIC_NODE]->(d)
-            """
-            
-            session.run(query, {
-                'sugya_ref': sugya_data['ref'],
-                'node_id': f"{sugya_data['ref']}-{node['id']}",
+        # Database ids are "<sugya ref>-<node id>"; build each one once
+        full_ids = {str(node['id']): f"{ref}-{node['id']}" for node in nodes}
+        
+        node_rows = [
+            {
+                'id': full_ids[str(node['id'])],
                 'type': node.get('type', 'unknown'),
                 'label': node.get('label', ''),
                 'speaker': node.get('speaker', ''),
                 'content_preview': node.get('content_preview', ''),
                 'sequence': i + 1,
                 'parent_id': node.get('parent_id', '')
-            })
+            }
+            for i, node in enumerate(nodes)
+        ]
+        # Edges to a parent that isn't in this sugya could never match anyway
+        edge_rows = [
+            {'parent': full_ids[str(node['parent_id'])], 'child': full_ids[str(node['id'])]}
+            for node in nodes
+            if node.get('parent_id') and str(node['parent_id']) in full_ids
+        ]
+        return node_rows, edge_rows
+    
+    async def _create_dialectic_nodes(self, tx, sugya_data: Dict):
+        """
+        Create dialectic node structure in database with parent-child relationships.
+        Uses one UNWIND query for all nodes and one for all edges instead of
+        a round trip per node and per edge.
+        """
+        ref = sugya_data['ref']
+        node_rows, edge_rows = self._dialectic_rows(sugya_data)
+        
+        # First pass: Create all nodes
+        await tx.run(
+            "UNWIND $nodes AS n " + _DIALECTIC_NODE_WRITE,
+            {'sugya_ref': ref, 'nodes': node_rows}
+        )
         
         # Second pass: Create parent-child relationships
-        for node in nodes:
-            parent_id = node.get('parent_id')
-            if parent_id:
-                link_query = """
-                MATCH (parent:DialecticNode {id: $parent_full_id})
-                MATCH (child:DialecticNode {id: $child_full_id})
-                MERGE (parent)-[:LEADS_TO]->(child)
-                """
-                
-                session.run(link_query, {
-                    'parent_full_id': f"{sugya_data['ref']}-{parent_id}",
-                    'child_full_id': f"{sugya_data['ref']}-{node['id']}"
-                })
+        if edge_rows:
+            await tx.run(
+                "UNWIND $edges AS e " + _DIALECTIC_EDGE_WRITE,
+                {'sugya_ref': ref, 'edges': edge_rows}
+            )
+    
+    async def _create_dialectic_nodes_apoc(self, session, sugya_data: Dict):
+        """
+        Same writes as _create_dialectic_nodes, but through apoc.periodic.iterate
+        so very large structures are committed in chunks. Must run outside a
+        transaction, after the Sugya node has been committed.
+        """
+        ref = sugya_data['ref']
+        node_rows, edge_rows = self._dialectic_rows(sugya_data)
+        
+        query = """
+        CALL apoc.periodic.iterate($outer, $inner, {
+            batchSize: $batch_size,
+            parallel: false,
+            params: {rows: $rows, sugya_ref: $sugya_ref}
+        })
+        YIELD errorMessages
+        RETURN errorMessages
+        """
+        passes = [
+            ("UNWIND $rows AS n RETURN n", _DIALECTIC_NODE_WRITE, node_rows),
+            ("UNWIND $rows AS e RETURN e", _DIALECTIC_EDGE_WRITE, edge_rows),
+        ]
+        for outer, inner, rows in passes:
+            if not rows:
+                continue
+            result = await session.run(query, {
+                'outer': outer,
+                'inner': inner,
+                'batch_size': APOC_BATCH_SIZE,
+                'rows': rows,
+                'sugya_ref': ref
+            })
+            record = await result.single()
+            if record and record['errorMessages']:
+                raise RuntimeError(f"apoc.periodic.iterate failed: {record['errorMessages']}")
     
-    def extract_and_save_all(
+    async def extract_and_save_all(
         self, 
         tractate: str = "Berakhot",
         start_page: str = "2a",
@@ -587,15 +1079,17 @@ Format your response as JSON:
         print("=" * 80)
         
         # Extract sugyot
-        sugyot = self.extract_sugyot_from_tractate(tractate, start_page, limit=limit)
+        sugyot = await self.extract_sugyot_from_tractate(tractate, start_page, limit=limit)
         
         # Save to database
         saved_count = 0
         failed_count = 0
         
         print("\n💾 Saving to database...")
-        for sugya in sugyot:
-            if self.save_sugya_to_database(sugya):
+        # Saves are independent transactions, so run them concurrently
+        results = await asyncio.gather(*[self.save_sugya_to_database(sugya) for sugya in sugyot])
+        for sugya, saved in zip(sugyot, results):
+            if saved:
                 saved_count += 1
                 print(f"   ✅ Saved: {sugya['ref']} - {sugya['title']}")
             else:
@@ -620,7 +1114,12 @@ Format your response as JSON:
         return stats
 
 
+_sugya_extractor = None
+
 def get_sugya_extractor() -> SugyaExtractor:
     """Get singleton SugyaExtractor instance"""
-    return SugyaExtractor()
+    global _sugya_extractor
+    if _sugya_extractor is None:
+        _sugya_extractor = SugyaExtractor()
+    return _sugya_extractor
 
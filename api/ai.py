@@ -1,30 +1,35 @@
 from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse
 from models import AICommentary
 from pydantic import BaseModel
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
 class AICommentaryRequest(BaseModel):
     text_ref: str
     tradition: str = "Rashi"
     mode: str = "pshat"
 
+# Stub responses all have the same shape. Inputs are already validated by
+# FastAPI, so copy a pre-built instance instead of validating a new one.
+_TEMPLATE = AICommentary.model_construct(text_ref="", tradition="", mode="", generated="")
+
 @router.get("/ai/commentary/{text_ref}", response_model=AICommentary)
 def get_ai_commentary(text_ref: str, tradition: str = "Rashi", mode: str = "pshat"):
     # Dummy implementation
-    return AICommentary(
-        text_ref=text_ref,
-        tradition=tradition,
-        mode=mode,
-        generated=f"Example AI commentary on {text_ref} according to {tradition} ({mode})"
-    )
+    return _TEMPLATE.model_copy(update={
+        "text_ref": text_ref,
+        "tradition": tradition,
+        "mode": mode,
+        "generated": f"Example AI commentary on {text_ref} according to {tradition} ({mode})"
+    })
 
 @router.post("/ai/commentary/", response_model=AICommentary)
 def ai_commentary_post(payload: AICommentaryRequest):
     # Dummy/stub for now
-    return AICommentary(
-        text_ref=payload.text_ref,
-        tradition=payload.tradition,
-        mode=payload.mode,
-        generated=f"Generated (stub) AI commentary for {payload.text_ref} with {payload.tradition} ({payload.mode})"
-    )
+    return _TEMPLATE.model_copy(update={
+        "text_ref": payload.text_ref,
+        "tradition": payload.tradition,
+        "mode": payload.mode,
+        "generated": f"Generated (stub) AI commentary for {payload.text_ref} with {payload.tradition} ({payload.mode})"
+    })
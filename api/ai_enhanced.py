@@ -3,15 +3,12 @@ Enhanced AI API with real implementations
 Requires OPENAI_API_KEY in environment
 """
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from models import AICommentary
 from pydantic import BaseModel
 from typing import List
-import sys
-import os
-
-# Add ai module to path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import asyncio
 
 router = APIRouter()
 
@@ -24,6 +21,122 @@ class SemanticSearchRequest(BaseModel):
     query: str
     limit: int = 10
 
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    limit: int = 10
+
+# Upper bound on queries per batch search call; each one runs its own
+# vector index lookup
+MAX_BATCH_QUERIES = 100
+
+class TextLookupBatcher:
+    """
+    Coalesces Text lookups from concurrent requests. References requested
+    within the same short window are fetched with one UNWIND query instead
+    of one query each.
+    """
+    
+    def __init__(self, window: float = 0.005, max_batch: int = 500):
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = {}  # text_ref -> futures waiting for it
+        self._flush_task = None
+        # Strong references to running flushes; the loop only keeps weak
+        # ones, so an unreferenced task could be collected mid-query
+        self._tasks = set()
+        self._loop = None
+    
+    async def lookup(self, text_ref: str) -> str:
+        """Return the stored content for text_ref ('' if there is none)"""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Pending state belongs to a loop that is gone (e.g. test clients)
+            self._loop = loop
+            self._pending = {}
+            self._flush_task = None
+            self._tasks = set()
+        
+        future = loop.create_future()
+        self._pending.setdefault(text_ref, []).append(future)
+        
+        if len(self._pending) >= self.max_batch:
+            self._flush_now()
+        elif self._flush_task is None:
+            self._flush_task = self._spawn(self._flush_later())
+        
+        return await future
+    
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        self._flush_task = None
+        await self._run(self._take())
+    
+    def _flush_now(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self._spawn(self._run(self._take()))
+    
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+    
+    def _take(self) -> dict:
+        pending, self._pending = self._pending, {}
+        return pending
+    
+    async def _run(self, pending: dict):
+        if not pending:
+            return
+        
+        from database import get_async_driver, NEO4J_DATABASE
+        
+        try:
+            async with get_async_driver().session(database=NEO4J_DATABASE) as session:
+                records = await session.run("""
+                    UNWIND $refs AS ref
+                    OPTIONAL MATCH (t:Text {id: ref})
+                    RETURN ref, coalesce(t.content_he, t.content_en, '') as content
+                """, {"refs": list(pending)})
+                contents = {record["ref"]: record["content"] async for record in records}
+        except Exception as e:
+            for futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        
+        for text_ref, futures in pending.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(contents.get(text_ref, ""))
+
+_text_lookup = TextLookupBatcher()
+
+async def _get_text_content(text_ref: str) -> str:
+    """
+    Get the text to comment on from Neo4j.
+    Falls back to the reference itself if the text isn't in the database.
+    Concurrent lookups are batched into one query (see TextLookupBatcher).
+    """
+    # Try to get text from database, but don't fail if not found
+    text_content = None
+    try:
+        text_content = await _text_lookup.lookup(text_ref)
+        if text_content:
+            print(f"✅ Found text in database for {text_ref}")
+    except Exception as db_error:
+        print(f"⚠️ Database lookup failed (continuing anyway): {db_error}")
+    
+    # If no text found in database, use the reference itself for commentary
+    if not text_content:
+        print(f"ℹ️ No text in database for {text_ref} - generating commentary on reference")
+        text_content = f"Biblical reference: {text_ref}"
+    
+    return text_content
+
 @router.get("/ai-enhanced/commentary/{text_ref}", response_model=AICommentary)
 async def get_ai_commentary(text_ref: str, tradition: str = "Rashi", mode: str = "pshat"):
     """
@@ -35,10 +148,9 @@ async def get_ai_commentary(text_ref: str, tradition: str = "Rashi", mode: str =
     """
     try:
         # Import here to avoid circular dependencies
-        from ai.commentary_generator import CommentaryGenerator
-        from database import get_driver
+        from ai.commentary_generator import get_commentary_generator
         
-        generator = CommentaryGenerator()
+        generator = get_commentary_generator()
         
         # Check cache first
         cached = await generator.get_cached_commentary(text_ref, tradition, mode)
@@ -51,34 +163,15 @@ async def get_ai_commentary(text_ref: str, tradition: str = "Rashi", mode: str =
                 generated=cached
             )
         
-        # Try to get text from database, but don't fail if not found
-        text_content = None
-        driver = get_driver()
-        try:
-            with driver.session() as session:
-                # Use OPTIONAL MATCH - won't fail if Text node doesn't exist
-                result = session.run("""
-                    OPTIONAL MATCH (t:Text {id: $text_ref})
-                    RETURN coalesce(t.content_he, t.content_en, '') as content
-                """, {"text_ref": text_ref}).single()
-                
-                if result and result["content"]:
-                    text_content = result["content"]
-                    print(f"✅ Found text in database for {text_ref}")
-        except Exception as db_error:
-            print(f"⚠️ Database lookup failed (continuing anyway): {db_error}")
-        
-        # If no text found in database, use the reference itself for commentary
-        if not text_content:
-            print(f"ℹ️ No text in database for {text_ref} - generating commentary on reference")
-            text_content = f"Biblical reference: {text_ref}"
+        text_content = await _get_text_content(text_ref)
         
         # Generate commentary
         commentary = await generator.generate(
             text=text_content,
             text_ref=text_ref,
             tradition=tradition,
-            mode=mode
+            mode=mode,
+            check_stored=False  # already checked above
         )
         
         return AICommentary(
@@ -98,6 +191,41 @@ async def get_ai_commentary(text_ref: str, tradition: str = "Rashi", mode: str =
             generated=f"Error generating commentary: {str(e)}"
         )
 
+@router.get("/ai-enhanced/commentary/{text_ref}/stream")
+async def stream_ai_commentary(text_ref: str, tradition: str = "Rashi", mode: str = "pshat"):
+    """
+    Stream AI-generated commentary as plain text while it is being generated,
+    so clients can start rendering before the full commentary is ready.
+    """
+    try:
+        from ai.commentary_generator import get_commentary_generator
+        
+        generator = get_commentary_generator()
+        text_content = await _get_text_content(text_ref)
+        
+        stream = generator.generate_stream(
+            text=text_content,
+            text_ref=text_ref,
+            tradition=tradition,
+            mode=mode
+        )
+        # Pull the first piece here so setup errors (e.g. missing API key)
+        # become a proper HTTP error instead of a broken stream
+        try:
+            first = await stream.__anext__()
+        except StopAsyncIteration:
+            # Nothing was generated; send an empty body, not a 500
+            return Response(content=b"", media_type="text/plain; charset=utf-8")
+        
+        async def body():
+            yield first
+            async for piece in stream:
+                yield piece
+        
+        return StreamingResponse(body(), media_type="text/plain; charset=utf-8")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Commentary streaming error: {str(e)}")
+
 @router.post("/ai-enhanced/commentary/", response_model=AICommentary)
 async def ai_commentary_post(payload: AICommentaryRequest):
     """Generate AI commentary via POST with request body"""
@@ -107,6 +235,26 @@ async def ai_commentary_post(payload: AICommentaryRequest):
         mode=payload.mode
     )
 
+@router.delete("/ai-enhanced/commentary-cache/expired")
+async def purge_expired_commentary():
+    """
+    Delete expired AI commentary from Neo4j.
+    Intended to be called periodically (e.g. from a cron job).
+    """
+    try:
+        from ai.commentary_generator import get_commentary_generator
+        
+        generator = get_commentary_generator()
+        purged = await generator.purge_expired_commentary()
+        
+        return {
+            "message": f"Purged {purged} expired commentaries",
+            "purged": purged,
+            "status": "success"
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Cache purge error: {str(e)}")
+
 @router.post("/ai-enhanced/semantic-search/")
 async def semantic_search(request: SemanticSearchRequest):
     """
@@ -114,9 +262,9 @@ async def semantic_search(request: SemanticSearchRequest):
     Requires texts to be embedded first (see /ai-enhanced/embed endpoint).
     """
     try:
-        from ai.embeddings import SemanticSearch
+        from ai.embeddings import get_semantic_search
         
-        searcher = SemanticSearch()
+        searcher = get_semantic_search()
         results = await searcher.search(request.query, request.limit)
         
         return {
@@ -127,21 +275,52 @@ async def semantic_search(request: SemanticSearchRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Semantic search error: {str(e)}")
 
+@router.post("/ai-enhanced/semantic-search-batch/")
+async def semantic_search_batch(request: BatchSearchRequest):
+    """
+    Semantic search for several queries in one call.
+    The queries are embedded with a single OpenAI request instead of one
+    request per query, which is what bulk callers should use.
+    """
+    if len(request.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BATCH_QUERIES} queries per request"
+        )
+    
+    try:
+        from ai.embeddings import get_semantic_search
+        
+        searcher = get_semantic_search()
+        results = await searcher.search_many(request.queries, request.limit)
+        
+        return {
+            "results": [
+                {"query": query, "results": hits, "count": len(hits)}
+                for query, hits in zip(request.queries, results)
+            ],
+            "count": len(request.queries)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Semantic search error: {str(e)}")
+
 @router.post("/ai-enhanced/embed-batch/")
-async def embed_batch_texts(batch_size: int = 100):
+async def embed_batch_texts(batch_size: int = 100, max_concurrency: int = 8):
     """
     Embed a batch of texts (requires OPENAI_API_KEY).
     This is a background task that should be run periodically.
+    The batch is split into up to max_concurrency parallel embedding requests.
     """
     try:
-        from ai.embeddings import TextEmbedder
+        from ai.embeddings import get_text_embedder
         
-        embedder = TextEmbedder()
-        count = await embedder.batch_embed_texts(batch_size)
+        embedder = get_text_embedder()
+        count = await embedder.batch_embed_texts(batch_size, max_concurrency=max(1, max_concurrency))
         
         return {
             "message": f"Successfully embedded {count} texts",
             "batch_size": batch_size,
+            "max_concurrency": max_concurrency,
             "status": "success"
         }
     except Exception as e:
@@ -151,9 +330,9 @@ async def embed_batch_texts(batch_size: int = 100):
 async def find_similar_texts(text_id: str, limit: int = 10):
     """Find texts semantically similar to the given text"""
     try:
-        from ai.embeddings import SemanticSearch
+        from ai.embeddings import get_semantic_search
         
-        searcher = SemanticSearch()
+        searcher = get_semantic_search()
         results = await searcher.find_similar_texts(text_id, limit)
         
         return {
@@ -168,9 +347,9 @@ async def find_similar_texts(text_id: str, limit: int = 10):
 async def extract_citations(text: str):
     """Extract halakhic citations from text using AI"""
     try:
-        from ai.commentary_generator import CitationExtractor
+        from ai.commentary_generator import get_citation_extractor
         
-        extractor = CitationExtractor()
+        extractor = get_citation_extractor()
         citations = await extractor.extract_citations(text)
         
         return {
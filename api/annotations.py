@@ -1,26 +1,59 @@
 from fastapi import APIRouter, HTTPException
 from models import Annotation
-from typing import List
+from typing import Dict, List
+from collections import defaultdict
 
 router = APIRouter()
 
-# In-memory store for demo
-ANNOTATIONS = []
+# In-memory store for demo. ANNOTATIONS keeps insertion order for the
+# index-based edit/delete API; the dicts index the same objects by text
+# reference and by user so lookups don't scan every annotation.
+ANNOTATIONS: List[Annotation] = []
+_BY_REF: Dict[str, List[Annotation]] = defaultdict(list)
+_BY_USER: Dict[str, List[Annotation]] = defaultdict(list)
+
+def _index(annotation: Annotation):
+    _BY_REF[annotation.text_ref].append(annotation)
+    _BY_USER[annotation.user].append(annotation)
+
+def _position(bucket: List[Annotation], annotation: Annotation) -> int:
+    # By identity: equal annotations are separate entries
+    for i, existing in enumerate(bucket):
+        if existing is annotation:
+            return i
+    raise ValueError("annotation is not indexed")
+
+def _unindex(annotation: Annotation):
+    for bucket in (_BY_REF[annotation.text_ref], _BY_USER[annotation.user]):
+        del bucket[_position(bucket, annotation)]
+
+def _reindex(old: Annotation, new: Annotation):
+    """Swap an edited annotation into the indexes, keeping ANNOTATIONS order"""
+    for index, field in ((_BY_REF, "text_ref"), (_BY_USER, "user")):
+        old_key, new_key = getattr(old, field), getattr(new, field)
+        bucket = index[old_key]
+        if old_key == new_key:
+            bucket[_position(bucket, old)] = new
+        else:
+            del bucket[_position(bucket, old)]
+            # Rare: rebuild the new key's list in ANNOTATIONS order
+            index[new_key] = [a for a in ANNOTATIONS if getattr(a, field) == new_key]
 
 @router.get("/annotations/{text_ref}", response_model=List[Annotation])
 def get_annotations(text_ref: str):
     """Get all annotations for a given text reference."""
-    return [a for a in ANNOTATIONS if a.text_ref == text_ref]
+    return _BY_REF.get(text_ref, [])
 
 @router.get("/annotations/user/{username}", response_model=List[Annotation])
 def get_user_annotations(username: str):
     """Get all annotations from a user."""
-    return [a for a in ANNOTATIONS if a.user == username]
+    return _BY_USER.get(username, [])
 
 @router.post("/annotations/", response_model=Annotation)
 def add_annotation(annotation: Annotation):
     """Add a new annotation."""
     ANNOTATIONS.append(annotation)
+    _index(annotation)
     return annotation
 
 @router.put("/annotations/{idx}", response_model=Annotation)
@@ -28,7 +61,9 @@ def edit_annotation(idx: int, annotation: Annotation):
     """Edit an annotation by index (demo use only)."""
     if idx < 0 or idx >= len(ANNOTATIONS):
         raise HTTPException(status_code=404, detail="Annotation not found")
+    old = ANNOTATIONS[idx]
     ANNOTATIONS[idx] = annotation
+    _reindex(old, annotation)
     return annotation
 
 @router.delete("/annotations/{idx}")
@@ -36,5 +71,5 @@ def delete_annotation(idx: int):
     """Delete an annotation by index (demo use only)."""
     if idx < 0 or idx >= len(ANNOTATIONS):
         raise HTTPException(status_code=404, detail="Annotation not found")
-    ANNOTATIONS.pop(idx)
+    _unindex(ANNOTATIONS.pop(idx))
     return {"removed": True, "index": idx}
@@ -1,8 +1,13 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional, Set
+from collections import defaultdict
+from bisect import bisect_left, bisect_right
+import sys
+from api.http_cache import static_etag, static_response
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
 class Author(BaseModel):
     id: str
@@ -80,8 +85,44 @@ RELATIONS_DATA = [
     {"source": "ramban", "target": "maharal", "type": "influenced", "strength": 0.7},
 ]
 
+# Lookup structures over the data above, built once at import.
+# Filter fields are kept as parallel columns indexed by author position
+# (AUTHORS_DATA order), with categorical strings interned. The indexes hold
+# positions; the year lists are sorted for bisect.
+_A_ROWS: List[dict] = list(AUTHORS_DATA.values())
+_A_TRADITION: List[str] = [sys.intern(a["tradition"]) for a in _A_ROWS]
+_A_SCHOOL: List[str] = [sys.intern(a["school"]) for a in _A_ROWS]
+_A_BIRTH: List[int] = [a.get("birth_year") or 0 for a in _A_ROWS]
+_A_DEATH: List[int] = [a.get("death_year") or 9999 for a in _A_ROWS]
+
+_BY_TRADITION: Dict[str, List[int]] = defaultdict(list)
+_BY_SCHOOL: Dict[str, List[int]] = defaultdict(list)
+for _i in range(len(_A_ROWS)):
+    _BY_TRADITION[_A_TRADITION[_i]].append(_i)
+    _BY_SCHOOL[_A_SCHOOL[_i]].append(_i)
+
+_BY_BIRTH: List[int] = sorted(range(len(_A_ROWS)), key=_A_BIRTH.__getitem__)
+_BIRTH_YEARS: List[int] = [_A_BIRTH[i] for i in _BY_BIRTH]
+_BY_DEATH: List[int] = sorted(range(len(_A_ROWS)), key=_A_DEATH.__getitem__)
+_DEATH_YEARS: List[int] = [_A_DEATH[i] for i in _BY_DEATH]
+
+_OUT_EDGES: Dict[str, List[dict]] = defaultdict(list)
+_IN_EDGES: Dict[str, List[dict]] = defaultdict(list)
+for _relation in RELATIONS_DATA:
+    _OUT_EDGES[_relation["source"]].append(_relation)
+    _IN_EDGES[_relation["target"]].append(_relation)
+
+def _years_of(authors: List[dict]) -> List[int]:
+    years = [a.get("birth_year", 0) for a in authors] + [a.get("death_year", 0) for a in authors]
+    return [y for y in years if y and y > 0]
+
+_ALL_YEARS: List[int] = _years_of(list(AUTHORS_DATA.values()))
+
+_STATIC_ETAG = static_etag(AUTHORS_DATA, RELATIONS_DATA)
+
 @router.get("/author-map/", response_model=AuthorMapData)
 def get_author_map(
+    request: Request,
     tradition: Optional[str] = None,
     school: Optional[str] = None,
     min_year: Optional[int] = None,
@@ -91,40 +132,68 @@ def get_author_map(
     Get chronological-conceptual map of authors and their relationships.
     Filter by tradition, school, or time period.
     """
-    authors = list(AUTHORS_DATA.values())
+    # Client already has this version - skip the filtering too
+    if request.headers.get("if-none-match") == _STATIC_ETAG:
+        return static_response(request, None, _STATIC_ETAG)
+    
+    if not (tradition or school or min_year or max_year):
+        return static_response(request, {
+            "authors": list(AUTHORS_DATA.values()),
+            "relations": RELATIONS_DATA,
+            "time_range": {
+                "min": min(_ALL_YEARS) if _ALL_YEARS else 0,
+                "max": max(_ALL_YEARS) if _ALL_YEARS else 2024
+            }
+        }, _STATIC_ETAG)
     
-    # Apply filters
+    # Start from the narrowest index, then check the remaining filters
+    # against the columns
+    candidates: List[List[int]] = []
+    checks: List[Callable[[int], bool]] = []
     if tradition:
-        authors = [a for a in authors if a["tradition"] == tradition]
+        candidates.append(_BY_TRADITION.get(tradition, []))
+        checks.append(lambda i: _A_TRADITION[i] == tradition)
     if school:
-        authors = [a for a in authors if a["school"] == school]
+        candidates.append(_BY_SCHOOL.get(school, []))
+        checks.append(lambda i: _A_SCHOOL[i] == school)
     if min_year:
-        authors = [a for a in authors if a.get("birth_year", 0) >= min_year]
+        candidates.append(_BY_BIRTH[bisect_left(_BIRTH_YEARS, min_year):])
+        checks.append(lambda i: _A_BIRTH[i] >= min_year)
     if max_year:
-        authors = [a for a in authors if a.get("death_year", 9999) <= max_year]
+        candidates.append(_BY_DEATH[:bisect_right(_DEATH_YEARS, max_year)])
+        checks.append(lambda i: _A_DEATH[i] <= max_year)
+    
+    smallest = min(range(len(candidates)), key=lambda k: len(candidates[k]))
+    rest: List[Callable[[int], bool]] = checks[:smallest] + checks[smallest + 1:]
+    positions: List[int] = sorted(i for i in candidates[smallest] if all(check(i) for check in rest))
+    authors: List[dict] = [_A_ROWS[i] for i in positions]
     
-    # Filter relations to only include authors in filtered list
-    author_ids = {a["id"] for a in authors}
-    relations = [r for r in RELATIONS_DATA if r["source"] in author_ids and r["target"] in author_ids]
+    # Filter relations to only include authors in filtered list. Walking
+    # RELATIONS_DATA keeps the order fixed, so equal filters give identical
+    # bodies in every worker (the ETag depends on it).
+    author_ids: Set[str] = {a["id"] for a in authors}
+    relations: List[dict] = [
+        r for r in RELATIONS_DATA
+        if r["source"] in author_ids and r["target"] in author_ids
+    ]
     
     # Calculate time range
-    years = [a.get("birth_year", 0) for a in authors] + [a.get("death_year", 0) for a in authors]
-    years = [y for y in years if y > 0]
+    years = _years_of(authors)
     
-    return {
+    return static_response(request, {
         "authors": authors,
         "relations": relations,
         "time_range": {
             "min": min(years) if years else 0,
             "max": max(years) if years else 2024
         }
-    }
+    }, _STATIC_ETAG)
 
 @router.get("/author/{author_id}", response_model=Author)
-def get_author(author_id: str):
+def get_author(author_id: str, request: Request):
     """Get detailed information about a specific author."""
     if author_id in AUTHORS_DATA:
-        return AUTHORS_DATA[author_id]
+        return static_response(request, AUTHORS_DATA[author_id], _STATIC_ETAG)
     raise HTTPException(status_code=404, detail=f"Author {author_id} not found")
 
 @router.get("/author/{author_id}/influences")
@@ -133,8 +202,8 @@ def get_author_influences(author_id: str):
     if author_id not in AUTHORS_DATA:
         raise HTTPException(status_code=404, detail=f"Author {author_id} not found")
     
-    influenced_by = [r for r in RELATIONS_DATA if r["target"] == author_id]
-    influenced = [r for r in RELATIONS_DATA if r["source"] == author_id]
+    influenced_by = _IN_EDGES.get(author_id, [])
+    influenced = _OUT_EDGES.get(author_id, [])
     
     return {
         "author": author_id,
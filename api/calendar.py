@@ -1,9 +1,13 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
+from cachetools import TTLCache
+import orjson
+from api.http_cache import static_etag, static_response
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
 class CalendarItem(BaseModel):
     type: str  # daf_yomi, parsha, haftara, rambam, fast, holiday
@@ -61,6 +65,28 @@ CALENDAR_DATA = {
     }
 }
 
+# Learning cycles served by /calendar/cycle/{cycle_type}
+CYCLES_DATA = {
+    "daf_yomi": {
+        "name": "Daf Yomi",
+        "description": "Daily page of Talmud, completing Shas in ~7.5 years",
+        "duration_days": 2711,
+        "current_cycle_start": "2020-01-05",
+        "current_cycle_end": "2027-06-09"
+    },
+    "rambam_daily": {
+        "name": "Daily Rambam",
+        "description": "3 chapters per day, completing Mishneh Torah in ~1 year",
+        "duration_days": 365,
+        "current_cycle_start": "2024-01-01"
+    }
+}
+
+_CYCLES_ETAG = static_etag(CYCLES_DATA)
+
+# Today's schedule, keyed by date so it rolls over at midnight
+_today_cache = TTLCache(maxsize=2, ttl=3600)
+
 def get_parsha_for_date(date_str: str) -> Optional[str]:
     """Get Torah portion for a given date (simplified)."""
     # In production, use proper Hebrew calendar library
@@ -68,37 +94,34 @@ def get_parsha_for_date(date_str: str) -> Optional[str]:
     # Simplified logic - would use real calendar in production
     return parshiyot[0]
 
-@router.get("/calendar/{date_str}", response_model=DaySchedule)
-def get_calendar_for_date(date_str: str):
+# Items of the generated schedule that don't depend on the date
+_DAILY_ITEMS = [
+    {
+        "type": "daf_yomi",
+        "title": "Daf Yomi",
+        "ref": "Berakhot 2a",  # Would calculate actual daf
+        "description": "Today's Talmud page in the Daf Yomi cycle"
+    },
+    {
+        "type": "rambam",
+        "title": "Daily Rambam",
+        "ref": "Mishneh Torah, De'ot 1-3",
+        "description": "Three chapters per day"
+    }
+]
+
+def _schedule_for(date_obj: date, date_str: str) -> dict:
     """
-    Get all relevant Torah texts and learning for a specific date.
-    Includes: Daf Yomi, Parsha, Haftara, daily Rambam, holidays, fast days, etc.
+    Build the schedule for an already parsed date. Never raises, so callers
+    looping over many days need no exception handling; only request input
+    parsing turns into HTTPException.
     """
     # Check if we have data for this specific date
     if date_str in CALENDAR_DATA:
         return CALENDAR_DATA[date_str]
     
-    # Generate dynamic data for dates not in cache
-    try:
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
-    
     # Generate dynamic schedule
-    items = [
-        {
-            "type": "daf_yomi",
-            "title": "Daf Yomi",
-            "ref": "Berakhot 2a",  # Would calculate actual daf
-            "description": "Today's Talmud page in the Daf Yomi cycle"
-        },
-        {
-            "type": "rambam",
-            "title": "Daily Rambam",
-            "ref": "Mishneh Torah, De'ot 1-3",
-            "description": "Three chapters per day"
-        }
-    ]
+    items = list(_DAILY_ITEMS)
     
     # Add parsha if it's Shabbat (Saturday)
     if date_obj.weekday() == 5:  # Saturday
@@ -116,11 +139,33 @@ def get_calendar_for_date(date_str: str):
         "items": items
     }
 
+@router.get("/calendar/{date_str}", response_model=DaySchedule)
+def get_calendar_for_date(date_str: str):
+    """
+    Get all relevant Torah texts and learning for a specific date.
+    Includes: Daf Yomi, Parsha, Haftara, daily Rambam, holidays, fast days, etc.
+    """
+    # Check if we have data for this specific date
+    if date_str in CALENDAR_DATA:
+        return CALENDAR_DATA[date_str]
+    
+    # Generate dynamic data for dates not in cache
+    try:
+        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    
+    return _schedule_for(date_obj, date_str)
+
 @router.get("/calendar/today/", response_model=DaySchedule)
 def get_todays_calendar():
     """Get today's learning schedule and relevant texts."""
-    today = date.today().strftime("%Y-%m-%d")
-    return get_calendar_for_date(today)
+    today = date.today()
+    today_str = today.strftime("%Y-%m-%d")
+    schedule = _today_cache.get(today_str)
+    if schedule is None:
+        schedule = _today_cache[today_str] = _schedule_for(today, today_str)
+    return schedule
 
 @router.get("/calendar/range/")
 def get_calendar_range(start_date: str, end_date: str):
@@ -134,44 +179,26 @@ def get_calendar_range(start_date: str, end_date: str):
     if (end - start).days > 365:
         raise HTTPException(status_code=400, detail="Date range too large (max 365 days)")
     
-    # Generate data for each day
-    results = []
-    current = start
-    while current <= end:
-        date_str = current.strftime("%Y-%m-%d")
-        try:
-            day_data = get_calendar_for_date(date_str)
-            results.append(day_data)
-        except:
-            pass
-        current = current.replace(day=current.day + 1)
+    # Stream the days as they are built instead of buffering the whole range
+    # (timedelta steps across month and year ends)
+    def body():
+        yield b'{"range":' + orjson.dumps({"start": start_date, "end": end_date}) + b',"days":['
+        for offset in range((end - start).days + 1):
+            current = start + timedelta(days=offset)
+            day = orjson.dumps(_schedule_for(current, current.strftime("%Y-%m-%d")))
+            yield day if offset == 0 else b"," + day
+        yield b"]}"
     
-    return {"range": {"start": start_date, "end": end_date}, "days": results}
+    return StreamingResponse(body(), media_type="application/json")
 
 @router.get("/calendar/cycle/{cycle_type}")
-def get_cycle_info(cycle_type: str):
+def get_cycle_info(cycle_type: str, request: Request):
     """
     Get information about a learning cycle.
     Types: daf_yomi, mishna_yomit, rambam_daily, etc.
     """
-    cycles = {
-        "daf_yomi": {
-            "name": "Daf Yomi",
-            "description": "Daily page of Talmud, completing Shas in ~7.5 years",
-            "duration_days": 2711,
-            "current_cycle_start": "2020-01-05",
-            "current_cycle_end": "2027-06-09"
-        },
-        "rambam_daily": {
-            "name": "Daily Rambam",
-            "description": "3 chapters per day, completing Mishneh Torah in ~1 year",
-            "duration_days": 365,
-            "current_cycle_start": "2024-01-01"
-        }
-    }
-    
-    if cycle_type in cycles:
-        return cycles[cycle_type]
+    if cycle_type in CYCLES_DATA:
+        return static_response(request, CYCLES_DATA[cycle_type], _CYCLES_ETAG)
     
     raise HTTPException(status_code=404, detail=f"Cycle type '{cycle_type}' not found")
 
@@ -1,8 +1,12 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional, Set
+from collections import defaultdict
+import sys
+from api.http_cache import static_etag, static_response
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
 class ConceptReference(BaseModel):
     ref: str
@@ -100,19 +104,74 @@ CONCEPTS_DATA = {
     }
 }
 
+# Search structures, built once at import: lowercased fields per concept and
+# per-field trigram postings. A field can only contain the query if it
+# contains every trigram of it, so the substring check (and its score) is
+# only run for the postings' intersection.
+_CONCEPT_INDEX: List[dict] = [
+    {
+        "id": concept_id,
+        "name_lc": concept["name"].lower(),
+        "hebrew": concept["hebrew_name"],
+        "desc_lc": concept["description"].lower(),
+        "category": sys.intern(concept["category"]),
+        "ref_traditions_lc": [sys.intern(r["tradition"].lower()) for r in concept["references"]],
+        "data": concept
+    }
+    for concept_id, concept in CONCEPTS_DATA.items()
+]
+
+# Concepts as the API returns them: dumped through the model once, so the
+# model's defaults (e.g. "author": null) are filled in even though the
+# cached responses below bypass response_model
+_CONCEPTS_OUT: Dict[str, dict] = {
+    concept_id: Concept.model_validate(concept).model_dump()
+    for concept_id, concept in CONCEPTS_DATA.items()
+}
+
+_STATIC_ETAG = static_etag(_CONCEPTS_OUT)
+
+# Relevance added when the query occurs in a field
+_FIELD_WEIGHTS: Dict[str, float] = {"name_lc": 1.0, "hebrew": 1.0, "desc_lc": 0.5}
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+_POSTINGS: Dict[str, Dict[str, Set[int]]] = {field: defaultdict(set) for field in _FIELD_WEIGHTS}
+for _position, _entry in enumerate(_CONCEPT_INDEX):
+    for _field, _postings in _POSTINGS.items():
+        for _gram in _trigrams(_entry[_field]):
+            _postings[_gram].add(_position)
+
+def _score_concepts(query_lc: str) -> Dict[int, float]:
+    """Relevance of every concept that matches query_lc, by index position"""
+    grams = _trigrams(query_lc)
+    scores: Dict[int, float] = defaultdict(float)
+    for field, weight in _FIELD_WEIGHTS.items():
+        if grams:
+            postings = _POSTINGS[field]
+            positions: Iterable[int] = set.intersection(*(postings.get(g, set()) for g in grams))
+        else:
+            # Too short for trigrams - check every concept
+            positions = range(len(_CONCEPT_INDEX))
+        for position in positions:
+            if query_lc in _CONCEPT_INDEX[position][field]:
+                scores[position] += weight
+    return scores
+
 @router.get("/concepts/", response_model=List[Concept])
-def list_concepts(category: Optional[str] = None):
+def list_concepts(request: Request, category: Optional[str] = None):
     """List all available concepts, optionally filtered by category."""
-    concepts = list(CONCEPTS_DATA.values())
+    concepts = list(_CONCEPTS_OUT.values())
     if category:
         concepts = [c for c in concepts if c["category"] == category]
-    return concepts
+    return static_response(request, concepts, _STATIC_ETAG)
 
 @router.get("/concepts/{concept_id}", response_model=Concept)
-def get_concept(concept_id: str):
+def get_concept(concept_id: str, request: Request):
     """Get detailed information about a specific concept."""
-    if concept_id in CONCEPTS_DATA:
-        return CONCEPTS_DATA[concept_id]
+    if concept_id in _CONCEPTS_OUT:
+        return static_response(request, _CONCEPTS_OUT[concept_id], _STATIC_ETAG)
     raise HTTPException(status_code=404, detail=f"Concept {concept_id} not found")
 
 @router.get("/concepts/search/", response_model=List[ConceptSearchResult])
@@ -126,33 +185,33 @@ def search_concepts(
     Filter by tradition (Biblical, Rabbinic, Kabbalistic, Hasidic, Rationalist, etc.)
     or category (theological, philosophical, ethical, halakhic).
     """
-    results = []
+    results: List[dict] = []
+    query_lc: str = query.lower()
+    tradition_lc: Optional[str] = tradition.lower() if tradition else None
     
-    for concept_id, concept_data in CONCEPTS_DATA.items():
-        # Simple text matching
-        relevance = 0.0
-        if query.lower() in concept_data["name"].lower():
-            relevance += 1.0
-        if query.lower() in concept_data["hebrew_name"]:
-            relevance += 1.0
-        if query.lower() in concept_data["description"].lower():
-            relevance += 0.5
+    # Concepts in CONCEPTS_DATA order, so equal scores keep their order
+    for position, relevance in sorted(_score_concepts(query_lc).items()):
+        entry = _CONCEPT_INDEX[position]
+        
+        # Apply category filter
+        if category and entry["category"] != category:
+            continue
+        
+        concept_data = entry["data"]
+        
+        # Filter references by tradition if specified
+        refs = concept_data["references"]
+        if tradition_lc:
+            refs = [
+                r for r, ref_tradition in zip(refs, entry["ref_traditions_lc"])
+                if ref_tradition == tradition_lc
+            ]
         
-        if relevance > 0:
-            # Filter references by tradition if specified
-            refs = concept_data["references"]
-            if tradition:
-                refs = [r for r in refs if r["tradition"].lower() == tradition.lower()]
-            
-            # Apply category filter
-            if category and concept_data["category"] != category:
-                continue
-            
-            filtered_concept = {**concept_data, "references": refs}
-            results.append({
-                "concept": filtered_concept,
-                "relevance": relevance
-            })
+        filtered_concept = {**concept_data, "references": refs}
+        results.append({
+            "concept": filtered_concept,
+            "relevance": relevance
+        })
     
     # Sort by relevance
     results.sort(key=lambda x: x["relevance"], reverse=True)
@@ -1,76 +1,284 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.responses import ORJSONResponse
 from models import Connection
-from typing import List, Optional
-from database import get_driver
+from typing import List, Optional, FrozenSet
+from cachetools import TTLCache
+import orjson
+from neo4j import AsyncSession
+from database import get_async_driver, get_async_session, NEO4J_DATABASE
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
+
+MAX_GRAPH_DEPTH = 3
+
+# Labels whose `id` is backed by a unique constraint (see SCHEMA_STATEMENTS).
+# Passing one as `label` turns the start-node lookup into an index seek;
+# without it Neo4j has to scan every node for a matching id.
+NODE_LABELS = ("Text", "DialecticNode")
+
+# Shortcut edges written offline for citation chains up to MAX_GRAPH_DEPTH
+# hops, with the hop count in `distance`
+TRANSITIVE_REL_TYPE = "CITES_TRANSITIVE"
+
+# Fixed, fully parameterized query texts. The relationship type is passed as
+# $rel_type instead of being formatted into the pattern, so Neo4j plans each
+# template once and reuses the cached plan for every node and filter value.
+# Query based on your actual Neo4j schema, using the n.id property (not the
+# deprecated id() function).
+def _start_node(label: Optional[str]) -> str:
+    return f"(n:{label} {{id: $node_id}})" if label else "(n {id: $node_id})"
+
+def _connection_query(label: Optional[str], has_type: bool) -> str:
+    type_filter = "\n    WHERE type(r) = $rel_type" if has_type else ""
+    return f"""
+    MATCH {_start_node(label)}-[r]-(m){type_filter}
+    RETURN 
+        n.id AS source,
+        m.id AS target,
+        type(r) as rel_type,
+        coalesce(m.name, m.title, m.id) AS target_name,
+        labels(m) AS target_labels
+    LIMIT $limit
+    """
+
+# Columns returned by the graph queries, in the order get_graph_data unpacks them.
+# Snippets are cut server-side so full content never crosses the wire.
+_GRAPH_COLUMNS = """
+    RETURN 
+        source.id as source_id,
+        target.id as target_id,
+        type(rel) as rel_type,
+        coalesce(source.name, source.title, source.id) as source_name,
+        coalesce(target.name, target.title, target.id) as target_name,
+        labels(source) as source_labels,
+        labels(target) as target_labels,
+        source.era as source_era,
+        target.era as target_era,
+        substring(coalesce(source.content, source.snippet), 0, 100) as source_snippet,
+        substring(coalesce(target.content, target.snippet), 0, 100) as target_snippet
+    """
+
+def _graph_query(label: Optional[str], has_type: bool, depth: int) -> str:
+    # A variable-length pattern cannot bind a single r, so a typed filter
+    # requires every hop of the path to have that type (same as [:TYPE*1..d])
+    type_filter = "\n    WHERE all(r IN relationships(path) WHERE type(r) = $rel_type)" if has_type else ""
+    return f"""
+    MATCH path = {_start_node(label)}-[*1..{depth}]-(m){type_filter}
+    WITH nodes(path) as pathNodes, relationships(path) as pathRels
+    UNWIND range(0, size(pathRels)-1) as i
+    // Deduplicate on the entities and stop at $limit edges before reading
+    // any properties, so the lazy traversal can stop early on hub nodes
+    WITH DISTINCT pathNodes[i] as source, pathRels[i] as rel, pathNodes[i+1] as target
+    LIMIT $limit{_GRAPH_COLUMNS}"""
+
+def _transitive_query(label: Optional[str]) -> str:
+    # Single hop over the precomputed CITES_TRANSITIVE edges
+    # (scripts/materialize_transitive_citations.py)
+    return f"""
+    MATCH {_start_node(label)}-[rel:{TRANSITIVE_REL_TYPE}]-(m)
+    WHERE rel.distance <= $depth
+    WITH n as source, rel, m as target
+    LIMIT $limit{_GRAPH_COLUMNS}"""
+
+_LABEL_OPTIONS = (None,) + NODE_LABELS
+
+CONNECTION_QUERIES = {
+    (label, has_type): _connection_query(label, has_type)
+    for label in _LABEL_OPTIONS
+    for has_type in (False, True)
+}
+GRAPH_QUERIES = {
+    (label, has_type, depth): _graph_query(label, has_type, depth)
+    for label in _LABEL_OPTIONS
+    for has_type in (False, True)
+    for depth in range(1, MAX_GRAPH_DEPTH + 1)
+}
+TRANSITIVE_QUERIES = {label: _transitive_query(label) for label in _LABEL_OPTIONS}
+
+# Serialized responses, so warm requests skip both Neo4j and JSON encoding.
+# Graph traversals for popular texts repeat identically within a minute;
+# stats and relationship types change rarely.
+_graph_cache = TTLCache(maxsize=2048, ttl=60)
+_meta_cache = TTLCache(maxsize=2, ttl=300)
+
+STATS_QUERY = """
+CALL { MATCH (n) RETURN count(n) AS node_count }
+CALL { MATCH ()-[r]->() RETURN count(r) AS rel_count }
+CALL { CALL db.labels() YIELD label WITH label ORDER BY label RETURN collect(label) AS labels }
+CALL {
+    CALL db.relationshipTypes() YIELD relationshipType
+    WITH relationshipType ORDER BY relationshipType
+    RETURN collect(relationshipType) AS rel_types
+}
+RETURN node_count, rel_count, labels, rel_types
+"""
+
+def _json_response(body: bytes) -> Response:
+    return Response(content=body, media_type="application/json")
+
+def _graph_node(node_id: str, name, labels, era, snippet) -> dict:
+    return {
+        "id": node_id,
+        "title": name,
+        "type": labels[0] if labels else "Unknown",
+        "snippet": (snippet + "...") if snippet else "",
+        "metadata": {
+            "labels": labels,
+            "era": era
+        }
+    }
+
+def _check_label(label: Optional[str]):
+    if label is not None and label not in NODE_LABELS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"label must be one of: {', '.join(NODE_LABELS)}"
+        )
+
+# Relationship types that exist in the database, loaded at startup and
+# refreshed every few minutes so newly imported types become valid
+_rel_types_cache = TTLCache(maxsize=1, ttl=300)
+
+REL_TYPES_QUERY = "CALL db.relationshipTypes() YIELD relationshipType RETURN relationshipType"
+
+async def _load_rel_types(session: AsyncSession) -> FrozenSet[str]:
+    result = await session.run(REL_TYPES_QUERY)
+    rel_types = _rel_types_cache["rel_types"] = frozenset(await result.value())
+    return rel_types
+
+async def preload_relationship_types():
+    """Fetch the allowed relationship types once at startup"""
+    try:
+        async with get_async_driver().session(database=NEO4J_DATABASE) as session:
+            rel_types = await _load_rel_types(session)
+        print(f"✅ Loaded {len(rel_types)} relationship types")
+    except Exception as e:
+        print(f"⚠️ Could not load relationship types (will retry on first use): {e}")
+
+async def _check_rel_type(session: AsyncSession, relationship_type: Optional[str]):
+    """Reject relationship types that don't exist in the graph with a 400"""
+    if not relationship_type or relationship_type == "all":
+        return
+    rel_types = _rel_types_cache.get("rel_types")
+    if rel_types is None:
+        rel_types = await _load_rel_types(session)
+    if relationship_type not in rel_types:
+        raise HTTPException(status_code=400, detail=f"Unknown relationship type: {relationship_type}")
+
+@router.get("/connections/relationship-types")
+async def get_relationship_types(session: AsyncSession = Depends(get_async_session)):
+    """
+    Get all available relationship types in the graph database.
+    Useful for filters and UI options.
+    """
+    body = _meta_cache.get("relationship-types")
+    if body is not None:
+        return _json_response(body)
+    
+    try:
+        query = """
+        CALL db.relationshipTypes() YIELD relationshipType
+        RETURN relationshipType
+        ORDER BY relationshipType
+        LIMIT 50
+        """
+        records = await session.run(query)
+        types = [rec["relationshipType"] async for rec in records]
+        
+        body = _meta_cache["relationship-types"] = orjson.dumps({
+            "relationship_types": types,
+            "total": len(types)
+        })
+        return _json_response(body)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+@router.get("/connections/stats")
+async def get_graph_stats(session: AsyncSession = Depends(get_async_session)):
+    """
+    Get overall statistics about the graph database.
+    """
+    body = _meta_cache.get("stats")
+    if body is not None:
+        return _json_response(body)
+    
+    try:
+        # One round trip for counts (served from the count store),
+        # labels and relationship types
+        result = await session.run(STATS_QUERY)
+        rec = await result.single()
+        
+        labels, rel_types = rec["labels"], rec["rel_types"]
+        body = _meta_cache["stats"] = orjson.dumps({
+            "nodes": {
+                "total": rec["node_count"],
+                "labels": labels,
+                "label_count": len(labels)
+            },
+            "relationships": {
+                "total": rec["rel_count"],
+                "types": rel_types,
+                "type_count": len(rel_types)
+            }
+        })
+        return _json_response(body)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 @router.get("/connections/{node_id}", response_model=List[Connection])
-def get_connections(
+async def get_connections(
     node_id: str,
     relationship_type: Optional[str] = None,
-    limit: int = 100
+    limit: int = 100,
+    label: Optional[str] = None,
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Get intertextual connections for a node from your Neo4j database.
     Relationship types: CITES, COMMENTARY_ON, EXPLICIT, BELONGS_TO, MEMBER_OF, etc.
+    Pass the node's label (e.g. Text) to look it up by index.
     """
-    driver = get_driver()
+    _check_label(label)
     try:
-        with driver.session() as session:
-            # Query based on your actual Neo4j schema
-            # Using n.id property (not deprecated id() function)
-            if relationship_type:
-                query = f"""
-                MATCH (n)-[r:{relationship_type}]-(m)
-                WHERE n.id = $node_id
-                RETURN 
-                    n.id AS source,
-                    m.id AS target,
-                    type(r) as rel_type,
-                    coalesce(m.name, m.title, m.id) AS target_name,
-                    labels(m) AS target_labels
-                LIMIT $limit
-                """
-            else:
-                query = """
-                MATCH (n)-[r]-(m)
-                WHERE n.id = $node_id
-                RETURN 
-                    n.id AS source,
-                    m.id AS target,
-                    type(r) as rel_type,
-                    coalesce(m.name, m.title, m.id) AS target_name,
-                    labels(m) AS target_labels
-                LIMIT $limit
-                """
-            
-            records = session.run(query, {"node_id": node_id, "limit": limit})
-            results = []
-            for rec in records:
-                results.append(Connection(
-                    source=str(rec["source"]),
-                    target=str(rec["target"]),
-                    type=rec["rel_type"],
-                    strength=0.8,  # Default strength
-                    metadata={
-                        "target_name": rec.get("target_name", ""),
-                        "target_labels": rec.get("target_labels", [])
-                    }
-                ))
-            
-            if not results:
-                raise HTTPException(status_code=404, detail=f"No connections found for node: {node_id}")
-            return results
+        await _check_rel_type(session, relationship_type)
+        query = CONNECTION_QUERIES[(label, bool(relationship_type))]
+        params = {"node_id": node_id, "limit": limit, "rel_type": relationship_type}
+        
+        records = await session.run(query, params)
+        results = []
+        append_result = results.append
+        async for rec in records:
+            # Plain dicts in the Connection shape; response_model stays
+            # for the schema, but the rows aren't re-validated
+            source, target, rel_type, target_name, target_labels = rec.values()
+            append_result({
+                "source": str(source),
+                "target": str(target),
+                "type": rel_type,
+                "strength": 0.8,  # Default strength
+                "metadata": {
+                    "target_name": target_name or "",
+                    "target_labels": target_labels or []
+                }
+            })
+        
+        if not results:
+            raise HTTPException(status_code=404, detail=f"No connections found for node: {node_id}")
+        return ORJSONResponse(results)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 @router.get("/connections/graph/{node_id}")
-def get_graph_data(
+async def get_graph_data(
     node_id: str, 
     depth: int = 2,
     relationship_type: Optional[str] = None,
-    limit: int = 200
+    limit: int = 200,
+    label: Optional[str] = None,
+    transitive: bool = False,
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Get full graph data (nodes + edges) for visualization.
@@ -81,165 +289,78 @@ def get_graph_data(
         depth: Number of hops (1-3)
         relationship_type: Optional filter by relationship type
         limit: Maximum number of results
+        label: Optional node label (Text, DialecticNode) for an indexed lookup
+        transitive: Return the precomputed CITES_TRANSITIVE edges within
+            `depth` citation hops instead of traversing paths (can't be
+            combined with relationship_type)
     """
-    driver = get_driver()
-    
     # Validate depth
-    if depth < 1 or depth > 3:
-        raise HTTPException(status_code=400, detail="Depth must be between 1 and 3")
+    if depth < 1 or depth > MAX_GRAPH_DEPTH:
+        raise HTTPException(status_code=400, detail=f"Depth must be between 1 and {MAX_GRAPH_DEPTH}")
+    if transitive and relationship_type and relationship_type != "all":
+        raise HTTPException(status_code=400, detail="relationship_type can't be combined with transitive=true")
+    _check_label(label)
+    
+    cache_key = (node_id, depth, relationship_type, limit, label, transitive)
+    body = _graph_cache.get(cache_key)
+    if body is not None:
+        return _json_response(body)
     
     try:
-        with driver.session() as session:
-            # Build relationship filter
-            rel_filter = f":{relationship_type}" if relationship_type and relationship_type != "all" else ""
+        await _check_rel_type(session, relationship_type)
+        if transitive:
+            query = TRANSITIVE_QUERIES[label]
+            params = {"node_id": node_id, "limit": limit, "depth": depth}
+        else:
+            has_type = bool(relationship_type) and relationship_type != "all"
+            query = GRAPH_QUERIES[(label, has_type, depth)]
+            params = {"node_id": node_id, "limit": limit, "rel_type": relationship_type}
+        
+        records = await session.run(query, params)
+        
+        nodes = {}
+        links = []
+        append_link = links.append
+        rel_types = set()
+        
+        async for rec in records:
+            # Columns in GRAPH_QUERIES order, unpacked once per row
+            (source_id, target_id, rel_type, source_name, target_name,
+             source_labels, target_labels, source_era, target_era,
+             source_snippet, target_snippet) = rec.values()
+            source_id = str(source_id)
+            target_id = str(target_id)
             
-            # Multi-hop query based on your actual Neo4j schema
-            # Using n.id property (not deprecated id() function)
-            query = f"""
-            MATCH path = (n)-[{rel_filter}*1..{depth}]-(m)
-            WHERE n.id = $node_id
-            WITH nodes(path) as pathNodes, relationships(path) as pathRels
-            UNWIND range(0, size(pathRels)-1) as i
-            WITH pathNodes[i] as source, pathRels[i] as rel, pathNodes[i+1] as target
-            RETURN DISTINCT 
-                source.id as source_id,
-                target.id as target_id,
-                type(rel) as rel_type,
-                coalesce(source.name, source.title, source.id) as source_name,
-                coalesce(target.name, target.title, target.id) as target_name,
-                labels(source) as source_labels,
-                labels(target) as target_labels,
-                source.era as source_era,
-                target.era as target_era,
-                coalesce(source.content, source.snippet) as source_content,
-                coalesce(target.content, target.snippet) as target_content
-            LIMIT $limit
-            """
+            # Add source and target nodes
+            if source_id not in nodes:
+                nodes[source_id] = _graph_node(source_id, source_name, source_labels, source_era, source_snippet)
+            if target_id not in nodes:
+                nodes[target_id] = _graph_node(target_id, target_name, target_labels, target_era, target_snippet)
             
-            records = session.run(query, {"node_id": node_id, "limit": limit})
-            
-            nodes = {}
-            links = []
-            
-            for rec in records:
-                # Add source node
-                source_id = str(rec["source_id"])
-                if source_id not in nodes:
-                    nodes[source_id] = {
-                        "id": source_id,
-                        "title": rec.get("source_name", source_id),
-                        "type": rec.get("source_labels", ["Unknown"])[0] if rec.get("source_labels") else "Unknown",
-                        "snippet": (rec.get("source_content", "")[:100] + "...") if rec.get("source_content") else "",
-                        "metadata": {
-                            "labels": rec.get("source_labels", []),
-                            "era": rec.get("source_era")
-                        }
-                    }
-                
-                # Add target node
-                target_id = str(rec["target_id"])
-                if target_id not in nodes:
-                    nodes[target_id] = {
-                        "id": target_id,
-                        "title": rec.get("target_name", target_id),
-                        "type": rec.get("target_labels", ["Unknown"])[0] if rec.get("target_labels") else "Unknown",
-                        "snippet": (rec.get("target_content", "")[:100] + "...") if rec.get("target_content") else "",
-                        "metadata": {
-                            "labels": rec.get("target_labels", []),
-                            "era": rec.get("target_era")
-                        }
-                    }
-                
-                # Add link
-                links.append({
-                    "source": source_id,
-                    "target": target_id,
-                    "type": rec["rel_type"],
-                    "strength": 0.7
-                })
-            
-            if not nodes:
-                raise HTTPException(status_code=404, detail=f"No graph data found for node: {node_id}")
-            
-            return {
-                "nodes": list(nodes.values()),
-                "links": links,
-                "stats": {
-                    "total_nodes": len(nodes),
-                    "total_links": len(links),
-                    "depth": depth,
-                    "relationship_types": list(set(link["type"] for link in links))
-                }
+            # Add link
+            append_link({
+                "source": source_id,
+                "target": target_id,
+                "type": rel_type,
+                "strength": 0.7
+            })
+            rel_types.add(rel_type)
+        
+        if not nodes:
+            raise HTTPException(status_code=404, detail=f"No graph data found for node: {node_id}")
+        
+        body = _graph_cache[cache_key] = orjson.dumps({
+            "nodes": list(nodes.values()),
+            "links": links,
+            "stats": {
+                "total_nodes": len(nodes),
+                "total_links": len(links),
+                "depth": depth,
+                "relationship_types": list(rel_types)
             }
+        })
+        return _json_response(body)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-
-@router.get("/connections/relationship-types")
-def get_relationship_types():
-    """
-    Get all available relationship types in the graph database.
-    Useful for filters and UI options.
-    """
-    driver = get_driver()
-    try:
-        with driver.session() as session:
-            query = """
-            CALL db.relationshipTypes() YIELD relationshipType
-            RETURN relationshipType
-            ORDER BY relationshipType
-            LIMIT 50
-            """
-            records = session.run(query)
-            types = [rec["relationshipType"] for rec in records]
-            
-            return {
-                "relationship_types": types,
-                "total": len(types)
-            }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-
-@router.get("/connections/stats")
-def get_graph_stats():
-    """
-    Get overall statistics about the graph database.
-    """
-    driver = get_driver()
-    try:
-        with driver.session() as session:
-            # Get node count
-            node_query = "MATCH (n) RETURN count(n) as node_count"
-            node_result = session.run(node_query)
-            node_count = node_result.single()["node_count"]
-            
-            # Get relationship count
-            rel_query = "MATCH ()-[r]->() RETURN count(r) as rel_count"
-            rel_result = session.run(rel_query)
-            rel_count = rel_result.single()["rel_count"]
-            
-            # Get node labels
-            labels_query = "CALL db.labels() YIELD label RETURN label ORDER BY label"
-            labels_result = session.run(labels_query)
-            labels = [rec["label"] for rec in labels_result]
-            
-            # Get relationship types
-            types_query = "CALL db.relationshipTypes() YIELD relationshipType RETURN relationshipType ORDER BY relationshipType"
-            types_result = session.run(types_query)
-            rel_types = [rec["relationshipType"] for rec in types_result]
-            
-            return {
-                "nodes": {
-                    "total": node_count,
-                    "labels": labels,
-                    "label_count": len(labels)
-                },
-                "relationships": {
-                    "total": rel_count,
-                    "types": rel_types,
-                    "type_count": len(rel_types)
-                }
-            }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
@@ -2,33 +2,56 @@ from fastapi import APIRouter
 from models import DiffResult
 from pydantic import BaseModel
 from typing import List
+from difflib import SequenceMatcher
 
 router = APIRouter()
 
+# Above this many words, align whole lines first and only diff the
+# mismatched regions word by word
+DIFF_LINE_ANCHOR_WORDS = 2000
+
 class DiffRequest(BaseModel):
     base_text: str
     compare_text: str
 
+def _diff_words(words1: List[str], words2: List[str], diffs: List[dict]):
+    """Append one entry per changed span between two word lists"""
+    # Real word-level alignment. difflib is pure Python; the line anchoring
+    # in _diff_lines keeps the word lists short for long texts.
+    matcher = SequenceMatcher(a=words1, b=words2, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "replace":
+            diffs.append({"type": "change", "from": " ".join(words1[i1:i2]), "to": " ".join(words2[j1:j2])})
+        elif tag == "delete":
+            diffs.append({"type": "deletion", "from": " ".join(words1[i1:i2])})
+        elif tag == "insert":
+            diffs.append({"type": "insertion", "to": " ".join(words2[j1:j2])})
+
+def _diff_lines(lines1: List[str], lines2: List[str], diffs: List[dict]):
+    """
+    Diff long texts in two passes: match identical lines (verses) first,
+    then word-diff only the regions between them. Keeps the word-level
+    matcher off the long stretches the texts share.
+    """
+    matcher = SequenceMatcher(a=lines1, b=lines2, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != "equal":
+            _diff_words(
+                " ".join(lines1[i1:i2]).split(),
+                " ".join(lines2[j1:j2]).split(),
+                diffs
+            )
+
 @router.post("/diffs/", response_model=DiffResult)
 def compute_diff(payload: DiffRequest):
     base_text = payload.base_text
     compare_text = payload.compare_text
-    diffs = []
     words1 = base_text.split()
     words2 = compare_text.split()
-    i, j = 0, 0
-    while i < len(words1) or j < len(words2):
-        if i < len(words1) and j < len(words2) and words1[i] == words2[j]:
-            i += 1
-            j += 1
-        elif i < len(words1) and j < len(words2):
-            diffs.append({"type": "change", "from": words1[i], "to": words2[j]})
-            i += 1
-            j += 1
-        elif i < len(words1):
-            diffs.append({"type": "deletion", "from": words1[i]})
-            i += 1
-        elif j < len(words2):
-            diffs.append({"type": "insertion", "to": words2[j]})
-            j += 1
+    
+    diffs = []
+    if len(words1) + len(words2) > DIFF_LINE_ANCHOR_WORDS:
+        _diff_lines(base_text.splitlines(), compare_text.splitlines(), diffs)
+    else:
+        _diff_words(words1, words2, diffs)
     return DiffResult(base_text=base_text, compare_text=compare_text, diffs=diffs)
@@ -0,0 +1,29 @@
+"""
+HTTP caching helpers for endpoints that serve module-level sample data.
+That data only changes on redeploy, so one ETag per data set is computed
+at import and clients revalidate with If-None-Match.
+"""
+
+from fastapi import Request, Response
+from fastapi.responses import ORJSONResponse
+import hashlib
+import orjson
+
+STATIC_CACHE_CONTROL = "public, max-age=300, stale-while-revalidate=3600"
+
+def static_etag(*data) -> str:
+    """Strong ETag for a set of constant data structures"""
+    digest = hashlib.blake2b(digest_size=8)
+    for item in data:
+        digest.update(orjson.dumps(item, option=orjson.OPT_SORT_KEYS))
+    return f'"{digest.hexdigest()}"'
+
+def static_response(request: Request, content, etag: str) -> Response:
+    """
+    Return 304 Not Modified if the client already has this version,
+    otherwise the JSON content with ETag and Cache-Control headers.
+    """
+    headers = {"ETag": etag, "Cache-Control": STATIC_CACHE_CONTROL}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return ORJSONResponse(content, headers=headers)
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple, FrozenSet
+import orjson
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
 class SemanticNode(BaseModel):
     id: str
@@ -149,39 +151,71 @@ LEXICAL_DATA = {
     }
 }
 
+# Lookup structures built once from LEXICAL_DATA
+# Corpus names per term, overall and per lowercased corpus filter
+_TERM_CORPORA: Dict[str, List[str]] = {}
+_TERM_CORPORA_BY_FILTER: Dict[Tuple[str, str], List[str]] = {}
+# First node per (term, lowercased corpus), as the old linear scan returned
+_NODE_BY_TERM_CORPUS: Dict[Tuple[str, str], dict] = {}
+# First link per unordered pair of node ids
+_LINK_BY_ENDPOINTS: Dict[FrozenSet[str], dict] = {}
+for _term_id, _data in LEXICAL_DATA.items():
+    _TERM_CORPORA[_term_id] = list(dict.fromkeys(n["corpus"] for n in _data["nodes"]))
+    for _node in _data["nodes"]:
+        _corpus_lc = _node["corpus"].lower()
+        _NODE_BY_TERM_CORPUS.setdefault((_term_id, _corpus_lc), _node)
+        _filtered = _TERM_CORPORA_BY_FILTER.setdefault((_term_id, _corpus_lc), [])
+        if _node["corpus"] not in _filtered:
+            _filtered.append(_node["corpus"])
+    for _link in _data["links"]:
+        _LINK_BY_ENDPOINTS.setdefault(frozenset((_link["source"], _link["target"])), _link)
+
+# Each term's drift data serialized once; served as-is
+_LEXICAL_PAYLOADS: Dict[str, bytes] = {term_id: orjson.dumps(data) for term_id, data in LEXICAL_DATA.items()}
+
+# Serialized list_terms payloads keyed by lowercased corpus filter (None for
+# no filter); only filters that match a known corpus are stored
+_TERMS_PAYLOADS: Dict[Optional[str], bytes] = {}
+
+def _terms_payload(corpus_lc: Optional[str]) -> bytes:
+    terms = []
+    for term_id, data in LEXICAL_DATA.items():
+        corpora = _TERM_CORPORA[term_id] if corpus_lc is None else _TERM_CORPORA_BY_FILTER.get((term_id, corpus_lc))
+        if corpora:
+            terms.append({
+                "term": data["term"],
+                "hebrew_term": data["hebrew_term"],
+                "corpora": corpora
+            })
+    return orjson.dumps({"terms": terms})
+
+_TERMS_PAYLOADS[None] = _terms_payload(None)
+for (_term_id, _corpus_lc) in _TERM_CORPORA_BY_FILTER:
+    if _corpus_lc not in _TERMS_PAYLOADS:
+        _TERMS_PAYLOADS[_corpus_lc] = _terms_payload(_corpus_lc)
+_NO_TERMS_PAYLOAD = orjson.dumps({"terms": []})
+
 @router.get("/lexical/{term}", response_model=SemanticDriftData)
 def get_semantic_drift(term: str):
     """
     Track how a Hebrew/Aramaic term changes meaning across time and genre.
     Returns nodes representing the term in different corpora and links showing semantic drift.
     """
-    if term in LEXICAL_DATA:
-        return LEXICAL_DATA[term]
+    body = _LEXICAL_PAYLOADS.get(term)
+    if body is not None:
+        # Pre-serialized sample data, already in the response model's shape
+        return Response(content=body, media_type="application/json")
     
     raise HTTPException(status_code=404, detail=f"Lexical data for '{term}' not found")
 
 @router.get("/lexical/")
 def list_terms(corpus: Optional[str] = None):
     """List all available terms in the lexical hypergraph."""
-    terms = []
-    for term_id, data in LEXICAL_DATA.items():
-        if corpus:
-            # Filter nodes by corpus
-            nodes = [n for n in data["nodes"] if n["corpus"].lower() == corpus.lower()]
-            if nodes:
-                terms.append({
-                    "term": data["term"],
-                    "hebrew_term": data["hebrew_term"],
-                    "corpora": list(set([n["corpus"] for n in nodes]))
-                })
-        else:
-            terms.append({
-                "term": data["term"],
-                "hebrew_term": data["hebrew_term"],
-                "corpora": list(set([n["corpus"] for n in data["nodes"]]))
-            })
-    
-    return {"terms": terms}
+    if corpus:
+        body = _TERMS_PAYLOADS.get(corpus.lower(), _NO_TERMS_PAYLOAD)
+    else:
+        body = _TERMS_PAYLOADS[None]
+    return Response(content=body, media_type="application/json")
 
 @router.get("/lexical/{term}/compare")
 def compare_usage(term: str, corpus1: str, corpus2: str):
@@ -192,17 +226,14 @@ def compare_usage(term: str, corpus1: str, corpus2: str):
     if term not in LEXICAL_DATA:
         raise HTTPException(status_code=404, detail=f"Term '{term}' not found")
     
-    data = LEXICAL_DATA[term]
-    node1 = next((n for n in data["nodes"] if n["corpus"].lower() == corpus1.lower()), None)
-    node2 = next((n for n in data["nodes"] if n["corpus"].lower() == corpus2.lower()), None)
+    node1 = _NODE_BY_TERM_CORPUS.get((term, corpus1.lower()))
+    node2 = _NODE_BY_TERM_CORPUS.get((term, corpus2.lower()))
     
     if not node1 or not node2:
         raise HTTPException(status_code=404, detail=f"Comparison data not available for specified corpora")
     
     # Find link between them
-    link = next((l for l in data["links"] if 
-                 (l["source"] == node1["id"] and l["target"] == node2["id"]) or
-                 (l["source"] == node2["id"] and l["target"] == node1["id"])), None)
+    link = _LINK_BY_ENDPOINTS.get(frozenset((node1["id"], node2["id"])))
     
     return {
         "term": term,
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Dict
+import orjson
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
 class ManuscriptSegment(BaseModel):
     id: str
@@ -82,6 +84,40 @@ MANUSCRIPTS = {
     }
 }
 
+# Each manuscript serialized once; responses are assembled from these bytes
+_MS_PAYLOADS: Dict[str, bytes] = {ms_id: orjson.dumps(ms_data) for ms_id, ms_data in MANUSCRIPTS.items()}
+
+# Manuscript ids are "<ref>_<source>"; the ready-made versions response
+# for each ref
+_MS_IDS_BY_REF: Dict[str, List[str]] = {}
+for _ms_id in MANUSCRIPTS:
+    _MS_IDS_BY_REF.setdefault(_ms_id.rsplit("_", 1)[0], []).append(_ms_id)
+_MS_BY_REF: Dict[str, bytes] = {
+    ref: b"[" + b",".join(_MS_PAYLOADS[ms_id] for ms_id in ms_ids) + b"]"
+    for ref, ms_ids in _MS_IDS_BY_REF.items()
+}
+
+def _significance(diff_count: int) -> str:
+    if diff_count == 0:
+        return "low"
+    elif diff_count < 5:
+        return "medium"
+    return "high"
+
+# Differences count and significance depend only on the alternate
+# manuscript; the serialized end of each compare response
+_MS_DIFF_TAILS: Dict[str, bytes] = {}
+for _ms_id, _ms_data in MANUSCRIPTS.items():
+    _diff_count = sum(len(seg.get("changes", [])) for seg in _ms_data["segments"])
+    _MS_DIFF_TAILS[_ms_id] = (
+        b',"differences_count":' + orjson.dumps(_diff_count)
+        + b',"significance":' + orjson.dumps(_significance(_diff_count))
+        + b'}'
+    )
+
+def _json_response(body: bytes) -> Response:
+    return Response(content=body, media_type="application/json")
+
 @router.get("/manuscripts/{ref}", response_model=List[Manuscript])
 def get_manuscript_versions(ref: str):
     """
@@ -90,16 +126,22 @@ def get_manuscript_versions(ref: str):
     # Normalize ref
     normalized_ref = ref.replace(" ", "_")
     
-    # Find all manuscripts matching this ref
+    # Exact ref: one dict lookup, pre-serialized sample data already in
+    # the response model's shape
+    body = _MS_BY_REF.get(normalized_ref)
+    if body is not None:
+        return _json_response(body)
+    
+    # Partial ref (e.g. just a book name): find all manuscripts containing it
     results = []
-    for ms_id, ms_data in MANUSCRIPTS.items():
+    for ms_id, payload in _MS_PAYLOADS.items():
         if normalized_ref in ms_id:
-            results.append(ms_data)
+            results.append(payload)
     
     if not results:
         raise HTTPException(status_code=404, detail=f"No manuscripts found for {ref}")
     
-    return results
+    return _json_response(b"[" + b",".join(results) + b"]")
 
 @router.get("/manuscripts/compare/{ref}", response_model=VersionComparisonResult)
 def compare_manuscripts(
@@ -122,31 +164,14 @@ def compare_manuscripts(
     if alternate_key not in MANUSCRIPTS:
         raise HTTPException(status_code=404, detail=f"Alternate manuscript '{alternate}' not found for {ref}")
     
-    primary_ms = MANUSCRIPTS[primary_key]
-    alternate_ms = MANUSCRIPTS[alternate_key]
-    
-    # Count differences
-    diff_count = sum(len(seg.get("changes", [])) for seg in alternate_ms["segments"])
-    
-    # Determine significance
-    if diff_count == 0:
-        significance = "low"
-    elif diff_count < 5:
-        significance = "medium"
-    else:
-        significance = "high"
-    
-    return {
-        "ref": ref,
-        "primary": primary_ms,
-        "alternate": alternate_ms,
-        "differences_count": diff_count,
-        "significance": significance
-    }
+    return _json_response(
+        b'{"ref":' + orjson.dumps(ref)
+        + b',"primary":' + _MS_PAYLOADS[primary_key]
+        + b',"alternate":' + _MS_PAYLOADS[alternate_key]
+        + _MS_DIFF_TAILS[alternate_key]
+    )
 
-@router.get("/manuscripts/sources/")
-def list_manuscript_sources():
-    """List all available manuscript sources."""
+def _sources_payload() -> bytes:
     sources = {}
     for ms_id, ms_data in MANUSCRIPTS.items():
         source = ms_data["source"]
@@ -159,5 +184,11 @@ def list_manuscript_sources():
             }
         sources[source]["count"] += 1
     
-    return {"sources": list(sources.values())}
+    return orjson.dumps({"sources": list(sources.values())})
+
+_SOURCES_PAYLOAD = _sources_payload()
 
+@router.get("/manuscripts/sources/")
+def list_manuscript_sources():
+    """List all available manuscript sources."""
+    return _json_response(_SOURCES_PAYLOAD)
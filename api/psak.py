@@ -1,8 +1,10 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import List, Optional
+from functools import lru_cache
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
 class PsakNode(BaseModel):
     id: str
@@ -78,16 +80,32 @@ PSAK_DATA = {
     }
 }
 
+@lru_cache(maxsize=4096)
+def _normalize_ref(ref: str) -> str:
+    """'Shulchan Arukh OC 1:1' style refs -> PSAK_DATA key form"""
+    return ref.replace(" ", "_").replace(",", "").replace(":", "_")
+
+# Validated lineages keyed by normalized ref, and lowercased fields for
+# search, built once from PSAK_DATA
+PSAK_MODELS = {_normalize_ref(key): PsakLineage(**value) for key, value in PSAK_DATA.items()}
+PSAK_SEARCH_INDEX = [
+    (value["title"].lower(), value["ruling_ref"].lower(), {
+        "ref": value["ruling_ref"],
+        "title": value["title"],
+        "chain_length": len(value["chain"])
+    })
+    for value in PSAK_DATA.values()
+]
+
 @router.get("/psak/{ruling_ref}", response_model=PsakLineage)
 def get_psak_lineage(ruling_ref: str):
     """
     Trace a halakhic ruling back through its sources.
     Returns the full chain from Torah -> Mishnah -> Gemara -> Rishonim -> Acharonim.
     """
-    normalized_ref = ruling_ref.replace(" ", "_").replace(",", "").replace(":", "_")
-    
-    if normalized_ref in PSAK_DATA:
-        return PSAK_DATA[normalized_ref]
+    lineage = PSAK_MODELS.get(_normalize_ref(ruling_ref))
+    if lineage is not None:
+        return lineage
     
     # Return a generic chain if specific one not found
     raise HTTPException(status_code=404, detail=f"Psak lineage not found for {ruling_ref}")
@@ -97,14 +115,11 @@ def search_psak(query: str):
     """
     Search for halakhic rulings by keyword or topic.
     """
-    results = []
-    for key, value in PSAK_DATA.items():
-        if query.lower() in value["title"].lower() or query.lower() in value["ruling_ref"].lower():
-            results.append({
-                "ref": value["ruling_ref"],
-                "title": value["title"],
-                "chain_length": len(value["chain"])
-            })
+    query_lc = query.lower()
+    results = [
+        summary for title_lc, ruling_ref_lc, summary in PSAK_SEARCH_INDEX
+        if query_lc in title_lc or query_lc in ruling_ref_lc
+    ]
     
     return {"query": query, "results": results}
 
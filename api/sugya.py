@@ -1,97 +1,103 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Response, Depends
+from fastapi.responses import ORJSONResponse
+from typing import Optional, Dict, Set
+from cachetools import TTLCache
+from models import SugyaStructure
+from database import get_async_session
+from neo4j import AsyncSession
 from .sugya_manager import get_sugya_manager
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from ai.sugya_extractor import get_sugya_extractor
+import asyncio
+import orjson
+import os
+
+router = APIRouter(default_response_class=ORJSONResponse)
 
-router = APIRouter()
+# Built sugya structures, and the lookups currently running so concurrent
+# requests for the same ref share one Neo4j query
+_sugya_cache = TTLCache(maxsize=2048, ttl=600)
+_sugya_inflight: Dict[str, asyncio.Future] = {}
 
-class SugyaNode(BaseModel):
-    id: str
-    type: str  # question, answer, kasha, terutz, teiku, dispute, resolution
-    label: str
-    sugyaLocation: str
-    children: List['SugyaNode'] = []
+async def _load_sugya_structure(ref: str, session: AsyncSession) -> Optional[SugyaStructure]:
+    """Cached, single-flight SugyaManager.get_sugya_structure"""
+    structure = _sugya_cache.get(ref)
+    if structure is not None:
+        return structure
+    
+    pending = _sugya_inflight.get(ref)
+    while pending is not None:
+        try:
+            return await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            # Only the request running the query was cancelled, not this
+            # one: run the lookup here instead
+            if not pending.cancelled():
+                raise
+        pending = _sugya_inflight.get(ref)
+    
+    future = asyncio.get_running_loop().create_future()
+    # Mark a failure as retrieved even if no other request was waiting on it
+    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    _sugya_inflight[ref] = future
+    try:
+        structure = await get_sugya_manager().get_sugya_structure(ref, session=session)
+        if structure:
+            # Validate the tree once; cache hits return the built model
+            structure = _sugya_cache[ref] = SugyaStructure(**structure)
+        future.set_result(structure)
+        return structure
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        # Cancelled (client gone, timeout): release the waiting requests
+        if not future.done():
+            future.cancel()
+        del _sugya_inflight[ref]
 
-class SugyaStructure(BaseModel):
-    ref: str
-    title: str
-    root: SugyaNode
-    summary: str
+# AI extraction jobs: at most SUGYA_EXTRACTION_JOBS run at once, and a
+# tractate (or the all-tractates job) already queued or running isn't
+# started a second time
+SUGYA_EXTRACTION_JOBS = int(os.getenv("SUGYA_EXTRACTION_JOBS", "2"))
+ALL_TRACTATES_JOB = "*"
+_extraction_slots = asyncio.Semaphore(SUGYA_EXTRACTION_JOBS)
+_extraction_jobs: Set[str] = set()
 
-# Sample sugya data structure
-SUGYA_DATA = {
-    "Berakhot_2a": {
-        "ref": "Berakhot 2a",
-        "title": "Time for Evening Shema",
-        "summary": "This sugya explores when the evening Shema should be recited, presenting various opinions and their reasoning.",
-        "root": {
-            "id": "q1",
-            "type": "question",
-            "label": "When do we recite the evening Shema?",
-            "sugyaLocation": "2a:1",
-            "children": [
-                {
-                    "id": "a1",
-                    "type": "answer",
-                    "label": "From when priests eat terumah (when stars appear)",
-                    "sugyaLocation": "2a:2",
-                    "children": [
-                        {
-                            "id": "k1",
-                            "type": "kasha",
-                            "label": "When exactly do stars appear?",
-                            "sugyaLocation": "2a:3",
-                            "children": [
-                                {
-                                    "id": "dispute1",
-                                    "type": "dispute",
-                                    "label": "R. Eliezer: Until end of first watch; Sages: Until midnight",
-                                    "sugyaLocation": "2a:4",
-                                    "children": [
-                                        {
-                                            "id": "t1",
-                                            "type": "terutz",
-                                            "label": "Different interpretations of 'evening' - halakhic vs. practical time",
-                                            "sugyaLocation": "2a:5",
-                                            "children": []
-                                        }
-                                    ]
-                                }
-                            ]
-                        }
-                    ]
-                }
-            ]
-        }
+def _already_running(job: str) -> dict:
+    return {
+        "status": "already_running",
+        "message": f"AI extraction for {'all tractates' if job == ALL_TRACTATES_JOB else job} is already in progress"
     }
-}
+
+async def _run_extraction(job: str, extract, **kwargs):
+    """Run an extraction once a job slot is free; the job must already be registered"""
+    try:
+        async with _extraction_slots:
+            return await extract(**kwargs)
+    finally:
+        _extraction_jobs.discard(job)
 
 @router.get("/sugya/list/available")
-def list_available_sugyot():
+async def list_available_sugyot(session: AsyncSession = Depends(get_async_session)):
     """
     Get list of all available sugya references from the Neo4j database.
     Returns array of sugya references with titles.
     """
     try:
         manager = get_sugya_manager()
-        sugyot = manager.list_all_sugyot()
+        sugyot = await manager.list_all_sugyot(session=session)
         return {"sugyot": sugyot, "total": len(sugyot)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 @router.get("/sugya/{ref}", response_model=SugyaStructure)
-def get_sugya_structure(ref: str):
+async def get_sugya_structure(ref: str, session: AsyncSession = Depends(get_async_session)):
     """
     Get the dialectic structure of a Talmudic sugya from the Neo4j database.
     Returns a tree of questions, answers, challenges, and resolutions.
     """
     try:
-        manager = get_sugya_manager()
-        structure = manager.get_sugya_structure(ref)
+        structure = await _load_sugya_structure(ref, session)
         
         if structure:
             return structure
@@ -103,35 +109,32 @@ def get_sugya_structure(ref: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-@router.get("/sugya/{ref}/flow", response_model=List[dict])
+# Flow data for visualization; it doesn't depend on the ref, so it's
+# serialized once
+SUGYA_FLOW = [
+    {"id": 1, "type": "question", "text": "When do we recite evening Shema?", "position": {"x": 0, "y": 0}},
+    {"id": 2, "type": "answer", "text": "From when priests eat terumah", "position": {"x": 1, "y": 0}},
+    {"id": 3, "type": "kasha", "text": "But when exactly is that?", "position": {"x": 2, "y": 0}},
+    {"id": 4, "type": "dispute", "text": "R. Eliezer vs Sages dispute", "position": {"x": 3, "y": 0}},
+    {"id": 5, "type": "terutz", "text": "Different interpretations of timing", "position": {"x": 4, "y": 0}},
+    {"id": 6, "type": "resolution", "text": "Practical halakha follows Sages", "position": {"x": 5, "y": 0}},
+]
+_FLOW_PAYLOAD = orjson.dumps(SUGYA_FLOW)
+
+@router.get("/sugya/{ref}/flow")
 def get_sugya_flow(ref: str):
     """
     Get a simplified flow representation of the sugya for visualization.
     Returns nodes with positions for graph layout.
     """
-    normalized_ref = ref.replace(" ", "_")
-    
-    # Return flow data for visualization
-    flow = [
-        {"id": 1, "type": "question", "text": "When do we recite evening Shema?", "position": {"x": 0, "y": 0}},
-        {"id": 2, "type": "answer", "text": "From when priests eat terumah", "position": {"x": 1, "y": 0}},
-        {"id": 3, "type": "kasha", "text": "But when exactly is that?", "position": {"x": 2, "y": 0}},
-        {"id": 4, "type": "dispute", "text": "R. Eliezer vs Sages dispute", "position": {"x": 3, "y": 0}},
-        {"id": 5, "type": "terutz", "text": "Different interpretations of timing", "position": {"x": 4, "y": 0}},
-        {"id": 6, "type": "resolution", "text": "Practical halakha follows Sages", "position": {"x": 5, "y": 0}},
-    ]
-    
-    return flow
-
-# Enable forward references for recursive model
-SugyaNode.model_rebuild()
+    return Response(content=_FLOW_PAYLOAD, media_type="application/json")
 
 # ============================================================================
 # AI-Powered Extraction Endpoints
 # ============================================================================
 
 @router.post("/sugya/extract/{tractate}")
-def extract_sugyot_from_tractate(
+async def extract_sugyot_from_tractate(
     tractate: str,
     background_tasks: BackgroundTasks,
     start_page: str = "2a",
@@ -154,11 +157,17 @@ def extract_sugyot_from_tractate(
     Returns:
         Job status and initial information
     """
+    if tractate in _extraction_jobs:
+        return _already_running(tractate)
+    
     try:
         extractor = get_sugya_extractor()
         
         # Run extraction in background
+        _extraction_jobs.add(tractate)
         background_tasks.add_task(
+            _run_extraction,
+            tractate,
             extractor.extract_and_save_all,
             tractate=tractate,
             start_page=start_page,
@@ -178,7 +187,7 @@ def extract_sugyot_from_tractate(
         raise HTTPException(status_code=500, detail=f"Extraction error: {str(e)}")
 
 @router.post("/sugya/extract-sync/{tractate}")
-def extract_sugyot_sync(
+async def extract_sugyot_sync(
     tractate: str,
     start_page: str = "2a",
     limit: int = 20
@@ -190,13 +199,21 @@ def extract_sugyot_sync(
     Returns:
         Extraction statistics
     """
+    if tractate in _extraction_jobs:
+        return _already_running(tractate)
+    
     try:
         extractor = get_sugya_extractor()
-        stats = extractor.extract_and_save_all(
+        _extraction_jobs.add(tractate)
+        stats = await _run_extraction(
+            tractate,
+            extractor.extract_and_save_all,
             tractate=tractate,
             start_page=start_page,
             limit=limit
         )
+        # Newly saved sugyot replace any cached inferred structures
+        _sugya_cache.clear()
         
         return {
             "status": "completed",
@@ -208,7 +225,7 @@ def extract_sugyot_sync(
         raise HTTPException(status_code=500, detail=f"Extraction error: {str(e)}")
 
 @router.post("/sugya/extract-all")
-def extract_all_sugyot(
+async def extract_all_sugyot(
     background_tasks: BackgroundTasks,
     limit_per_tractate: int = 100
 ):
@@ -226,11 +243,17 @@ def extract_all_sugyot(
     Returns:
         Job status
     """
+    if ALL_TRACTATES_JOB in _extraction_jobs:
+        return _already_running(ALL_TRACTATES_JOB)
+    
     try:
         extractor = get_sugya_extractor()
         
         # Run in background
+        _extraction_jobs.add(ALL_TRACTATES_JOB)
         background_tasks.add_task(
+            _run_extraction,
+            ALL_TRACTATES_JOB,
             extractor.extract_all_sugyot,
             limit_per_tractate=limit_per_tractate
         )
@@ -246,7 +269,7 @@ def extract_all_sugyot(
         raise HTTPException(status_code=500, detail=f"Extraction error: {str(e)}")
 
 @router.post("/sugya/extract-all-sync")
-def extract_all_sugyot_sync(limit_per_tractate: int = 50):
+async def extract_all_sugyot_sync(limit_per_tractate: int = 50):
     """
     Synchronous version of extract-all (waits for completion).
     Use for smaller limits.
@@ -256,11 +279,18 @@ def extract_all_sugyot_sync(limit_per_tractate: int = 50):
     Returns:
         Extraction statistics for all tractates
     """
+    if ALL_TRACTATES_JOB in _extraction_jobs:
+        return _already_running(ALL_TRACTATES_JOB)
+    
     try:
         extractor = get_sugya_extractor()
-        stats = extractor.extract_all_sugyot(
+        _extraction_jobs.add(ALL_TRACTATES_JOB)
+        stats = await _run_extraction(
+            ALL_TRACTATES_JOB,
+            extractor.extract_all_sugyot,
             limit_per_tractate=limit_per_tractate
         )
+        _sugya_cache.clear()
         
         return {
             "status": "completed",
@@ -7,10 +7,27 @@ os.environ["NEO4J_URI"] = os.getenv("NEO4J_URI", "neo4j+s://8260863b.databases.n
 os.environ["NEO4J_USER"] = os.getenv("NEO4J_USER", "neo4j")
 os.environ["NEO4J_PASSWORD"] = os.getenv("NEO4J_PASSWORD", "IJYDpas_0uO5jbjB6Upk7uiEn_Gs-nb9vyO3oUH6v5c")
 
-from database import get_driver
+from database import get_async_driver, NEO4J_DATABASE
+from neo4j import AsyncSession
 from typing import List, Dict, Optional
 import re
 
+_TAG_RE = re.compile(r'<[^>]+>')
+
+# Hebrew/Aramaic keywords for detecting dialectic node types
+_KASHA_WORDS = frozenset(('למה', 'מאי', 'מנא', 'היכי'))
+_ANSWER_WORDS = frozenset(('אמר', 'תנן', 'תניא'))
+_DISPUTE_WORDS = frozenset(('פלוגתא', 'מחלוקת'))
+
+# Transaction functions for session.execute_read / execute_write
+async def _single_record(tx, query: str, params: Optional[Dict] = None):
+    result = await tx.run(query, params or {})
+    return await result.single()
+
+async def _consume(tx, query: str, params: Optional[Dict] = None):
+    result = await tx.run(query, params or {})
+    return await result.consume()
+
 class SugyaManager:
     """
     Manages Talmudic sugyot in the Neo4j database.
@@ -20,146 +37,174 @@ class SugyaManager:
     """
     
     def __init__(self):
-        self.driver = get_driver()
+        self.driver = get_async_driver()
     
-    def identify_sugyot(self, tractate: str = "Berakhot", limit: int = 50) -> List[Dict]:
+    async def _execute(self, session: Optional[AsyncSession], write: bool, txfunc, *args):
+        """
+        Run a transaction function on the caller's session (e.g. the request's
+        get_async_session), or on a short-lived one of our own.
+        """
+        if session is None:
+            async with self.driver.session(database=NEO4J_DATABASE) as own_session:
+                return await self._execute(own_session, write, txfunc, *args)
+        if write:
+            return await session.execute_write(txfunc, *args)
+        return await session.execute_read(txfunc, *args)
+    
+    async def identify_sugyot(self, tractate: str = "Berakhot", limit: int = 50,
+                             session: Optional[AsyncSession] = None) -> List[Dict]:
         """
         Identify sugyot from Talmudic texts in the database.
         Groups consecutive text nodes by page number (e.g., "2a", "2b", "3a")
         
         Returns list of sugyot with their text ranges.
         """
-        with self.driver.session() as session:
-            # Find all Talmud texts for this tractate, grouped by page
-            query = """
-            MATCH (t:Text)
-            WHERE t.id CONTAINS $tractate
-            AND (t.id CONTAINS 'Talmud' OR t.id =~ '.*\\d+[ab]:.*')
-            RETURN t.id as text_id, 
-                   t.content_he as content,
-                   t.content_en as content_en
-            ORDER BY t.id
-            LIMIT $limit
-            """
-            
-            results = session.run(query, {"tractate": tractate, "limit": limit})
-            texts = list(results)
-            
-            # Group texts by page (e.g., "Berakhot 2a", "Berakhot 2b")
-            sugyot = {}
-            for text in texts:
-                text_id = text['text_id']
-                
-                # Extract page reference (e.g., "2a", "2b")
-                page_match = re.search(r'(\d+[ab])', text_id)
-                if page_match:
-                    page = page_match.group(1)
-                    sugya_key = f"{tractate} {page}"
-                    
-                    if sugya_key not in sugyot:
-                        sugyot[sugya_key] = {
-                            'ref': sugya_key,
-                            'texts': [],
-                            'page': page
-                        }
-                    
-                    sugyot[sugya_key]['texts'].append({
-                        'id': text_id,
-                        'content_he': text.get('content', ''),
-                        'content_en': text.get('content_en', [])
-                    })
-            
-            return list(sugyot.values())
+        # Find the tractate's Talmud texts and group them by page (e.g.,
+        # "Berakhot 2a", "Berakhot 2b") in Cypher; $limit still caps texts.
+        # STARTS WITH is answered by a range seek on the Text.id constraint
+        # index; the regex only checks the matched ids.
+        query = """
+        MATCH (t:Text)
+        WHERE t.id STARTS WITH $prefix
+        AND t.id =~ $page_pattern
+        WITH t ORDER BY t.id
+        LIMIT $limit
+        WITH split(substring(t.id, size($prefix)), ':')[0] as page, t
+        RETURN page, collect({
+            id: t.id,
+            content_he: t.content_he,
+            content_en: t.content_en
+        }) as texts
+        ORDER BY page
+        """
+        prefix = f"{tractate} "
+        params = {
+            "prefix": prefix,
+            "page_pattern": re.escape(prefix) + r"\d+[ab]:.*",
+            "limit": limit
+        }
+        
+        async def read_pages(tx):
+            result = await tx.run(query, params)
+            return [
+                {
+                    'ref': f"{tractate} {record['page']}",
+                    'texts': record['texts'],
+                    'page': record['page']
+                }
+                async for record in result
+            ]
+        
+        return await self._execute(session, False, read_pages)
     
-    def create_sugya_node(self, sugya_ref: str, title: str, summary: str = "") -> bool:
+    async def create_sugya_node(self, sugya_ref: str, title: str, summary: str = "",
+                               session: Optional[AsyncSession] = None) -> bool:
         """
         Create a Sugya node in Neo4j to represent a thematic unit.
         Links it to its component Text nodes.
         """
-        with self.driver.session() as session:
-            # Create the Sugya node
-            query = """
-            MERGE (s:Sugya {ref: $ref})
-            ON CREATE SET 
-                s.title = $title,
-                s.summary = $summary,
-                s.created_at = datetime()
-            ON MATCH SET
-                s.title = $title,
-                s.summary = $summary,
-                s.updated_at = datetime()
-            RETURN s
-            """
-            
-            session.run(query, {
-                "ref": sugya_ref,
-                "title": title,
-                "summary": summary
-            })
-            
-            # Link Sugya to its Text nodes
-            link_query = """
-            MATCH (s:Sugya {ref: $ref})
+        # Create (or update) the Sugya node and link it to its Text nodes in
+        # one statement; the MERGE runs even when no texts match
+        query = """
+        MERGE (s:Sugya {ref: $ref})
+        ON CREATE SET 
+            s.title = $title,
+            s.summary = $summary,
+            s.created_at = datetime()
+        ON MATCH SET
+            s.title = $title,
+            s.summary = $summary,
+            s.updated_at = datetime()
+        WITH s
+        MATCH (t:Text)
+        WHERE t.id CONTAINS $ref OR t.id STARTS WITH $ref
+        MERGE (s)-[:CONTAINS_TEXT]->(t)
+        """
+        params = {
+            "ref": sugya_ref,
+            "title": title,
+            "summary": summary
+        }
+        
+        await self._execute(session, True, _consume, query, params)
+        return True
+    
+    async def bulk_create_sugya_nodes(self, rows: List[Dict], session: Optional[AsyncSession] = None) -> Dict:
+        """
+        Create (or update) many Sugya nodes in one write transaction, like
+        create_sugya_node for each {"ref", "title", "summary"} row.
+        Returns how many nodes were created and how many already existed.
+        """
+        query = """
+        UNWIND $rows AS row
+        MERGE (s:Sugya {ref: row.ref})
+        ON CREATE SET 
+            s.title = row.title,
+            s.summary = coalesce(row.summary, ''),
+            s.created_at = datetime()
+        ON MATCH SET
+            s.title = row.title,
+            s.summary = coalesce(row.summary, ''),
+            s.updated_at = datetime()
+        WITH s, row
+        CALL {
+            WITH s, row
             MATCH (t:Text)
-            WHERE t.id CONTAINS $ref OR t.id STARTS WITH $ref
+            WHERE t.id CONTAINS row.ref OR t.id STARTS WITH row.ref
             MERGE (s)-[:CONTAINS_TEXT]->(t)
-            """
-            
-            session.run(link_query, {"ref": sugya_ref})
-            
-            return True
+        }
+        """
+        summary = await self._execute(session, True, _consume, query, {"rows": rows})
+        created = summary.counters.nodes_created
+        return {"created": created, "updated": len(rows) - created}
     
-    def get_sugya_structure(self, sugya_ref: str) -> Optional[Dict]:
+    async def get_sugya_structure(self, sugya_ref: str, session: Optional[AsyncSession] = None) -> Optional[Dict]:
         """
         Get the structure of a sugya with its texts and dialectic flow.
         Returns a tree structure for visualization.
         """
-        with self.driver.session() as session:
-            # Check if Sugya node exists
-            sugya_query = """
-            MATCH (s:Sugya {ref: $ref})
-            RETURN s.title as title, s.summary as summary, s.ref as ref
-            """
-            
-            sugya_result = session.run(sugya_query, {"ref": sugya_ref})
-            sugya_node = sugya_result.single()
-            
-            if sugya_node:
-                # Sugya node exists, get its structure
-                title = sugya_node['title']
-                summary = sugya_node['summary']
-            else:
-                # Sugya doesn't exist yet, infer from texts
-                title = f"Discussion on {sugya_ref}"
-                summary = f"Talmudic discussion from {sugya_ref}"
-            
-            # Get all texts for this sugya
-            texts_query = """
+        # Sugya node (if it exists yet) and its first 20 texts in one round trip
+        query = """
+        CALL {
             MATCH (t:Text)
             WHERE t.id CONTAINS $ref
-            RETURN t.id as id, 
-                   t.content_he as content_he,
-                   t.content_en as content_en
-            ORDER BY t.id
+            WITH t ORDER BY t.id
             LIMIT 20
-            """
-            
-            texts_result = session.run(texts_query, {"ref": sugya_ref})
-            texts = list(texts_result)
-            
-            if not texts:
-                return None
-            
-            # Build a simple dialectic structure
-            # In a real implementation, this would use NLP to detect questions/answers
-            root = self._build_dialectic_tree(texts, sugya_ref)
-            
-            return {
-                "ref": sugya_ref,
-                "title": title,
-                "summary": summary,
-                "root": root
-            }
+            RETURN collect({
+                id: t.id,
+                content_he: t.content_he,
+                content_en: t.content_en
+            }) AS texts
+        }
+        OPTIONAL MATCH (s:Sugya {ref: $ref})
+        RETURN s IS NOT NULL as sugya_exists, s.title as title, s.summary as summary, texts
+        """
+        
+        record = await self._execute(session, False, _single_record, query, {"ref": sugya_ref})
+        
+        texts = record['texts']
+        if not texts:
+            return None
+        
+        if record['sugya_exists']:
+            # Sugya node exists, get its structure
+            title = record['title']
+            summary = record['summary']
+        else:
+            # Sugya doesn't exist yet, infer from texts
+            title = f"Discussion on {sugya_ref}"
+            summary = f"Talmudic discussion from {sugya_ref}"
+        
+        # Build a simple dialectic structure
+        # In a real implementation, this would use NLP to detect questions/answers
+        root = self._build_dialectic_tree(texts, sugya_ref)
+        
+        return {
+            "ref": sugya_ref,
+            "title": title,
+            "summary": summary,
+            "root": root
+        }
     
     def _build_dialectic_tree(self, texts: List[Dict], sugya_ref: str) -> Dict:
         """
@@ -203,7 +248,7 @@ class SugyaManager:
             if isinstance(content, list):
                 content = ' '.join(str(c) for c in content if c)
             # Remove HTML tags
-            content = re.sub(r'<[^>]+>', '', str(content))
+            content = _TAG_RE.sub('', str(content))
             # Take first 100 characters
             return content[:100].strip() + "..."
         return "What is the main topic of discussion?"
@@ -219,11 +264,11 @@ class SugyaManager:
         content_lower = str(content).lower() if content else ""
         
         # Hebrew keywords for different types
-        if any(word in content_lower for word in ['למה', 'מאי', 'מנא', 'היכי']):
+        if any(word in content_lower for word in _KASHA_WORDS):
             return "kasha"  # question/challenge
-        elif any(word in content_lower for word in ['אמר', 'תנן', 'תניא']):
+        elif any(word in content_lower for word in _ANSWER_WORDS):
             return "answer"
-        elif any(word in content_lower for word in ['פלוגתא', 'מחלוקת']):
+        elif any(word in content_lower for word in _DISPUTE_WORDS):
             return "dispute"
         elif index == 0:
             return "question"
@@ -244,61 +289,65 @@ class SugyaManager:
             content = ' '.join(str(c) for c in content if c)
         
         # Remove HTML tags
-        clean = re.sub(r'<[^>]+>', '', str(content))
+        clean = _TAG_RE.sub('', str(content))
         # Take first 80 characters
         label = clean[:80].strip()
         if len(clean) > 80:
             label += "..."
         return label
     
-    def list_all_sugyot(self) -> List[Dict]:
+    async def list_all_sugyot(self, session: Optional[AsyncSession] = None) -> List[Dict]:
         """
         List all sugyot in the database (both created Sugya nodes and inferred ones).
         """
-        with self.driver.session() as session:
-            # First, get explicitly created Sugya nodes
-            sugya_nodes_query = """
+        # Explicitly created Sugya nodes, and pages inferred from Text nodes
+        # only when there are none (the inner WHERE skips the regex scan
+        # otherwise), in one round trip
+        query = """
+        CALL {
             MATCH (s:Sugya)
-            RETURN s.ref as ref, s.title as title
-            ORDER BY s.ref
-            """
-            
-            explicit_sugyot = []
-            result = session.run(sugya_nodes_query)
-            for record in result:
-                explicit_sugyot.append({
-                    "ref": record['ref'],
-                    "title": record['title'],
-                    "normalized": record['ref'].replace(" ", "_")
-                })
-            
-            # If we have explicit Sugya nodes, return them
-            if explicit_sugyot:
-                return explicit_sugyot
-            
-            # Otherwise, infer from Text nodes
-            # Group by page number
-            texts_query = """
+            WITH s ORDER BY s.ref
+            RETURN collect({ref: s.ref, title: s.title}) AS explicit
+        }
+        CALL {
+            WITH explicit
+            WITH explicit WHERE size(explicit) = 0
             MATCH (t:Text)
-            WHERE t.id =~ '.*Berakhot \\d+[ab]:.*'
-            RETURN DISTINCT split(split(t.id, ':')[0], ' ')[1] as page
+            WHERE t.id STARTS WITH 'Berakhot '
+            AND t.id =~ 'Berakhot \\d+[ab]:.*'
+            WITH DISTINCT split(split(t.id, ':')[0], ' ')[1] as page
             ORDER BY page
             LIMIT 20
-            """
-            
-            inferred_sugyot = []
-            result = session.run(texts_query)
-            for record in result:
-                page = record['page']
-                if page:
-                    ref = f"Berakhot {page}"
-                    inferred_sugyot.append({
-                        "ref": ref,
-                        "title": f"Discussion on {ref}",
-                        "normalized": ref.replace(" ", "_")
-                    })
-            
-            return inferred_sugyot
+            RETURN collect(page) AS pages
+        }
+        RETURN explicit, pages
+        """
+        
+        record = await self._execute(session, False, _single_record, query)
+        
+        # If we have explicit Sugya nodes, return them
+        if record['explicit']:
+            return [
+                {
+                    "ref": sugya['ref'],
+                    "title": sugya['title'],
+                    "normalized": sugya['ref'].replace(" ", "_")
+                }
+                for sugya in record['explicit']
+            ]
+        
+        # Otherwise, infer from Text nodes, grouped by page number
+        inferred_sugyot = []
+        for page in record['pages']:
+            if page:
+                ref = f"Berakhot {page}"
+                inferred_sugyot.append({
+                    "ref": ref,
+                    "title": f"Discussion on {ref}",
+                    "normalized": ref.replace(" ", "_")
+                })
+        
+        return inferred_sugyot
 
 # Singleton instance
 _manager = None
@@ -1,21 +1,60 @@
 from fastapi import APIRouter, HTTPException
 from models import Text
-import requests
+from cachetools import TTLCache
+import httpx
 
 router = APIRouter()
 
+SEFARIA_BASE_URL = "https://www.sefaria.org"
+
+# Sefaria texts rarely change; keep fetched texts for an hour
+_text_cache = TTLCache(maxsize=8192, ttl=3600)
+
+client = None
+
+def get_sefaria_client() -> httpx.AsyncClient:
+    """
+    Returns a singleton AsyncClient for the Sefaria API.
+    Keep-alive and HTTP/2 let requests reuse one TLS connection instead
+    of opening a new one per text.
+    """
+    global client
+    if client is None:
+        client = httpx.AsyncClient(
+            base_url=SEFARIA_BASE_URL,
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=32),
+            timeout=httpx.Timeout(5.0)
+        )
+    return client
+
+async def close_sefaria_client():
+    """Close the shared Sefaria client and its connection pool."""
+    global client
+    if client:
+        await client.aclose()
+        client = None
+
 @router.get("/texts/{ref}", response_model=Text)
-def get_text(ref: str, lang: str = "he"):
+async def get_text(ref: str, lang: str = "he"):
+    cache_key = (ref, lang)
+    text = _text_cache.get(cache_key)
+    if text is not None:
+        return text
+
     try:
         # Demo: fetch from Sefaria public API if available
-        sefaria_url = f"https://www.sefaria.org/api/texts/{ref}?lang={lang}"
-        resp = requests.get(sefaria_url)
+        resp = await get_sefaria_client().get(f"/api/texts/{ref}", params={"lang": lang})
         if resp.status_code == 200:
             j = resp.json()
             content = j.get("he") if lang == "he" else j.get("text", "")
             content = "\n".join(content) if isinstance(content, list) else str(content)
-            return Text(ref=ref, lang=lang, content=content, versions=[j.get("versionTitle","")])
+            text = Text(ref=ref, lang=lang, content=content, versions=[j.get("versionTitle","")])
+            _text_cache[cache_key] = text
+            return text
         else:
             raise HTTPException(status_code=404, detail="Not found via Sefaria API")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
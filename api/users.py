@@ -1,40 +1,159 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends, Response
+from fastapi.responses import ORJSONResponse
 from models import User
-from typing import List
-from passlib.hash import bcrypt
+from typing import List, Tuple
+from cachetools import TTLCache
+from passlib.context import CryptContext
+from database import get_async_session
+from neo4j import AsyncSession
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import orjson
+import os
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
-USERS = {}
+# Password hashing scheme for new passwords: "bcrypt" or "argon2" (argon2id).
+# argon2id is memory-hard, so at similar strength it spends less CPU per
+# hash than bcrypt. Hashes made with either scheme keep verifying after a
+# switch, since CryptContext recognizes both.
+PASSWORD_HASHER = os.getenv("PASSWORD_HASHER", "bcrypt")
+# bcrypt cost factor; each extra round doubles hashing time, so dev and test
+# environments can lower it
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "10"))
+HASHER = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    default=PASSWORD_HASHER,
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    argon2__type="ID",
+    argon2__memory_cost=65536,  # KiB (64 MiB)
+    argon2__time_cost=2,
+    argon2__parallelism=4
+)
+
+# Processes that hash passwords. A thread would still hold the interpreter
+# for part of each hash, so logins would slow down every other request
+# in the worker; separate processes hash truly in parallel.
+AUTH_WORKERS = int(os.getenv("AUTH_WORKERS", str(os.cpu_count() or 1)))
+
+auth_pool = None
+
+def get_auth_pool() -> ProcessPoolExecutor:
+    """Returns the singleton process pool used for password hashing"""
+    global auth_pool
+    if auth_pool is None:
+        auth_pool = ProcessPoolExecutor(max_workers=AUTH_WORKERS)
+    return auth_pool
+
+def close_auth_pool():
+    """Shut down the password hashing processes"""
+    global auth_pool
+    if auth_pool:
+        auth_pool.shutdown(cancel_futures=True)
+        auth_pool = None
+
+# Module-level so they can be sent to the pool's processes
+def _hash_password(password: str) -> str:
+    return HASHER.hash(password)
+
+def _verify_password(password: str, hashed: str) -> bool:
+    return HASHER.verify(password, hashed)
+
+async def _in_auth_pool(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(get_auth_pool(), func, *args)
+
+# Users are stored as :User nodes (username is unique, see SCHEMA_STATEMENTS)
+# so every worker process sees the same accounts
+USER_FIELDS = "u.username as username, u.email as email, u.hashed_password as hashed_password, u.is_active as is_active"
+
+CREATE_USER_QUERY = f"""
+MERGE (u:User {{username: $username}})
+ON CREATE SET
+    u.email = $email,
+    u.hashed_password = $hashed_password,
+    u.is_active = true,
+    u.created_at = datetime()
+// datetime() is the statement clock, so this is only true for a node created just now
+WITH u, u.created_at = datetime.statement() as created
+RETURN created, {USER_FIELDS}
+"""
+
+GET_USER_QUERY = f"MATCH (u:User {{username: $username}}) RETURN {USER_FIELDS}"
+
+LIST_USERS_QUERY = f"MATCH (u:User) RETURN {USER_FIELDS} ORDER BY u.username"
+
+# Accounts never change once registered, so found users are kept as
+# (validated model, serialized JSON). Unknown usernames aren't cached, so a
+# user registered through another worker is found on the next lookup.
+_user_cache = TTLCache(maxsize=10_000, ttl=300)
+# Serialized user list; kept briefly since other workers may register users
+_users_list_cache = TTLCache(maxsize=1, ttl=30)
+
+def _json_response(body: bytes) -> Response:
+    return Response(content=body, media_type="application/json")
+
+def _remember_user(user: User) -> Tuple[User, bytes]:
+    entry = _user_cache[user.username] = (user, orjson.dumps(user.model_dump()))
+    return entry
+
+async def _get_user(session: AsyncSession, username: str) -> Tuple[User, bytes]:
+    """The user and its JSON, from the cache or Neo4j"""
+    entry = _user_cache.get(username)
+    if entry is not None:
+        return entry
+    try:
+        result = await session.run(GET_USER_QUERY, username=username)
+        record = await result.single()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    if not record:
+        raise HTTPException(status_code=404, detail="No such user")
+    return _remember_user(User(**record.data()))
 
 @router.post("/users/register", response_model=User)
-def register(user: User):
+async def register(user: User, session: AsyncSession = Depends(get_async_session)):
     """Register a new user (demo: username must be unique)"""
-    if user.username in USERS:
+    # Hashing is CPU-bound; keep it out of this process
+    hashed = await _in_auth_pool(_hash_password, user.hashed_password)
+    try:
+        result = await session.run(
+            CREATE_USER_QUERY,
+            username=user.username,
+            email=user.email,
+            hashed_password=hashed
+        )
+        record = await result.single()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    if not record["created"]:
         raise HTTPException(status_code=409, detail="Username already exists")
-    hashed = bcrypt.hash(user.hashed_password)
-    db_user = User(username=user.username, email=user.email, hashed_password=hashed)
-    USERS[user.username] = db_user
-    return db_user
+    _users_list_cache.clear()
+    _, body = _remember_user(User(**{k: v for k, v in record.items() if k != "created"}))
+    return _json_response(body)
 
 @router.post("/users/login", response_model=User)
-def login(user: User):
+async def login(user: User, session: AsyncSession = Depends(get_async_session)):
     """Demo login (password verified against hash; in production issue JWT)"""
-    if user.username not in USERS:
-        raise HTTPException(status_code=404, detail="No such user")
-    db_user = USERS[user.username]
-    if not bcrypt.verify(user.hashed_password, db_user.hashed_password):
+    db_user, body = await _get_user(session, user.username)
+    if not await _in_auth_pool(_verify_password, user.hashed_password, db_user.hashed_password):
         raise HTTPException(status_code=401, detail="Incorrect password")
-    return db_user
+    return _json_response(body)
 
 @router.get("/users/{username}", response_model=User)
-def get_profile(username: str):
+async def get_profile(username: str, session: AsyncSession = Depends(get_async_session)):
     """Get user profile by username."""
-    if username not in USERS:
-        raise HTTPException(status_code=404, detail="No such user")
-    return USERS[username]
+    _, body = await _get_user(session, username)
+    return _json_response(body)
 
 @router.get("/users/", response_model=List[User])
-def list_users():
+async def list_users(session: AsyncSession = Depends(get_async_session)):
     """List all registered users (dangerous in prod, demo only!)"""
-    return list(USERS.values())
+    body = _users_list_cache.get(None)
+    if body is None:
+        try:
+            result = await session.run(LIST_USERS_QUERY)
+            users = [User(**record.data()) async for record in result]
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+        body = _users_list_cache[None] = orjson.dumps([user.model_dump() for user in users])
+    return _json_response(body)
@@ -0,0 +1,30 @@
+"""
+Environment settings
+Loads the .env file once per process and exposes the settings scripts
+check before connecting
+"""
+
+from dotenv import load_dotenv
+from functools import lru_cache
+from typing import NamedTuple, Optional
+import os
+
+class Settings(NamedTuple):
+    neo4j_uri: Optional[str]
+    neo4j_user: Optional[str]
+    neo4j_password: Optional[str]
+    openai_api_key: Optional[str]
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """
+    Load .env into the environment (first call only) and return the settings.
+    Call this BEFORE importing database, which reads the environment at import.
+    """
+    load_dotenv()
+    return Settings(
+        neo4j_uri=os.getenv("NEO4J_URI"),
+        neo4j_user=os.getenv("NEO4J_USER"),
+        neo4j_password=os.getenv("NEO4J_PASSWORD"),
+        openai_api_key=os.getenv("OPENAI_API_KEY")
+    )
@@ -1,4 +1,5 @@
-from neo4j import GraphDatabase
+from neo4j import GraphDatabase, AsyncGraphDatabase
+import atexit
 import os
 
 # Neo4j Configuration - loaded from .env file
@@ -6,6 +7,25 @@ import os
 NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
 NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "password")
+# Naming the database on each session saves the driver a routing round trip
+NEO4J_DATABASE = os.getenv("NEO4J_DATABASE", "neo4j")
+
+# Connection pool shared by all sessions of a driver. Sized for the
+# concurrent sugya extraction and async API handlers; acquiring a
+# connection waits at most NEO4J_ACQUISITION_TIMEOUT seconds.
+NEO4J_POOL_SIZE = int(os.getenv("NEO4J_POOL_SIZE", "64"))
+NEO4J_ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "30"))
+
+# Check connectivity as soon as get_driver() creates the driver (useful for
+# CLI scripts that should fail fast); otherwise the first query connects
+NEO4J_VERIFY_ON_STARTUP = os.getenv("NEO4J_VERIFY_ON_STARTUP", "0") == "1"
+
+DRIVER_CONFIG = {
+    "max_connection_pool_size": NEO4J_POOL_SIZE,
+    "connection_acquisition_timeout": NEO4J_ACQUISITION_TIMEOUT,
+    "max_connection_lifetime": 3600,
+    "keep_alive": True,
+}
 
 # Debug: Print configuration (remove in production)
 print(f"🔧 Neo4j Configuration:")
@@ -19,6 +39,7 @@ print(f"   Password: {'*' * len(NEO4J_PASSWORD) if NEO4J_PASSWORD else 'NOT SET'
 # NEO4J_PASSWORD=your-password
 
 driver = None
+async_driver = None
 
 def get_driver():
     """
@@ -33,12 +54,16 @@ def get_driver():
             driver = GraphDatabase.driver(
                 NEO4J_URI, 
                 auth=(NEO4J_USER, NEO4J_PASSWORD),
-                max_connection_lifetime=3600
+                **DRIVER_CONFIG
             )
-            # Test connection
-            with driver.session() as session:
-                session.run("RETURN 1")
-            print(f"✅ Connected to Neo4j at {NEO4J_URI}")
+            # Scripts share the driver and never close it themselves; it is
+            # closed once when the interpreter exits
+            atexit.register(close_driver)
+            # The driver connects lazily on the first query; only pay for an
+            # extra round trip up front when asked to
+            if NEO4J_VERIFY_ON_STARTUP:
+                driver.verify_connectivity()
+                print(f"✅ Connected to Neo4j at {NEO4J_URI}")
         except Exception as e:
             print(f"❌ Failed to connect to Neo4j: {e}")
             print(f"URI: {NEO4J_URI}, User: {NEO4J_USER}")
@@ -51,3 +76,125 @@ def close_driver():
     if driver:
         driver.close()
         driver = None
+
+def get_async_driver():
+    """
+    Returns a singleton async Neo4j driver instance.
+    Use this from async code (FastAPI handlers, AI pipeline) so Bolt I/O
+    doesn't block the event loop. The driver owns a connection pool that
+    is reused across sessions.
+    """
+    global async_driver
+    if not async_driver:
+        async_driver = AsyncGraphDatabase.driver(
+            NEO4J_URI,
+            auth=(NEO4J_USER, NEO4J_PASSWORD),
+            **DRIVER_CONFIG
+        )
+    return async_driver
+
+async def get_async_session():
+    """
+    FastAPI dependency yielding one async session per request.
+    The session only borrows a pooled connection when it first runs a query
+    and hands it back when the request finishes.
+    """
+    async with get_async_driver().session(database=NEO4J_DATABASE) as session:
+        yield session
+
+async def close_async_driver():
+    """Close the async Neo4j driver connection."""
+    global async_driver
+    if async_driver:
+        await async_driver.close()
+        async_driver = None
+
+# Indexes and constraints the API relies on. Every statement is idempotent
+# (IF NOT EXISTS) so this is safe to run on each startup.
+TEXT_ID_CONSTRAINT = "CREATE CONSTRAINT text_id_unique IF NOT EXISTS FOR (t:Text) REQUIRE t.id IS UNIQUE"
+
+SCHEMA_STATEMENTS = [
+    # HNSW vector index used by semantic search (ai/embeddings.py).
+    # Quantization keeps a compact int8 copy of each vector in the index so
+    # graph traversal touches far less memory; results are rescored exactly.
+    """
+    CREATE VECTOR INDEX text_embedding_idx IF NOT EXISTS
+    FOR (t:Text) ON t.embedding
+    OPTIONS {indexConfig: {
+        `vector.dimensions`: 1536,
+        `vector.similarity_function`: 'cosine',
+        `vector.quantization.enabled`: true
+    }}
+    """,
+    # Text lookups by reference (commentary cache, AI endpoints, embeddings)
+    # and `t.id STARTS WITH` prefix scans (sugya extraction).
+    # The constraint is backed by its own index, so the plain index that
+    # used to cover Text.id is dropped first (Neo4j won't create the
+    # constraint while it exists). If the constraint then fails, e.g. on
+    # duplicate ids, the plain index is recreated (SCHEMA_FALLBACKS).
+    "DROP INDEX text_id_idx IF EXISTS",
+    TEXT_ID_CONSTRAINT,
+    # Text index so `a.name CONTAINS $tradition` doesn't scan every Author
+    "CREATE TEXT INDEX author_name_text_idx IF NOT EXISTS FOR (a:Author) ON (a.name)",
+    # Composite key used to look up cached AI commentary
+    """
+    CREATE INDEX ai_commentary_key IF NOT EXISTS
+    FOR (c:AICommentary) ON (c.text_ref, c.tradition, c.mode)
+    """,
+    # Semantic cache for AI commentary: embeddings of (reference, tradition,
+    # mode, text) so near-duplicate requests reuse stored commentary.
+    # Quantized like text_embedding_idx.
+    """
+    CREATE VECTOR INDEX ai_commentary_key_embedding_idx IF NOT EXISTS
+    FOR (c:AICommentary) ON c.key_embedding
+    OPTIONS {indexConfig: {
+        `vector.dimensions`: 1536,
+        `vector.similarity_function`: 'cosine',
+        `vector.quantization.enabled`: true
+    }}
+    """,
+    # MERGE keys used when saving extracted sugyot (ai/sugya_extractor.py).
+    # DialecticNode ids are prefixed with their sugya ref, so id alone is unique.
+    "CREATE CONSTRAINT sugya_ref_unique IF NOT EXISTS FOR (s:Sugya) REQUIRE s.ref IS UNIQUE",
+    "CREATE CONSTRAINT dialectic_node_id_unique IF NOT EXISTS FOR (d:DialecticNode) REQUIRE d.id IS UNIQUE",
+    # User accounts (api/users.py); also makes concurrent registrations of
+    # the same username MERGE into one node
+    "CREATE CONSTRAINT user_username_unique IF NOT EXISTS FOR (u:User) REQUIRE u.username IS UNIQUE",
+]
+
+# Statements run in place of a SCHEMA_STATEMENTS entry that fails, so the
+# data it was meant to cover keeps an index
+SCHEMA_FALLBACKS = {
+    TEXT_ID_CONSTRAINT: "CREATE INDEX text_id_idx IF NOT EXISTS FOR (t:Text) ON (t.id)",
+}
+
+async def ensure_schema() -> bool:
+    """
+    Create the indexes listed in SCHEMA_STATEMENTS if they don't exist yet.
+    Returns False if the schema couldn't be checked at all (e.g. no connection).
+    """
+    driver = get_async_driver()
+    try:
+        applied = 0
+        async with driver.session(database=NEO4J_DATABASE) as session:
+            for statement in SCHEMA_STATEMENTS:
+                try:
+                    result = await session.run(statement)
+                    await result.consume()
+                    applied += 1
+                except Exception as e:
+                    fallback = SCHEMA_FALLBACKS.get(statement)
+                    if fallback is None:
+                        print(f"⚠️ Could not apply schema statement (skipping): {e}")
+                        continue
+                    print(f"⚠️ Could not apply schema statement (using fallback): {e}")
+                    try:
+                        result = await session.run(fallback)
+                        await result.consume()
+                    except Exception as e:
+                        print(f"⚠️ Could not apply schema fallback (skipping): {e}")
+        print(f"✅ Neo4j schema verified ({applied}/{len(SCHEMA_STATEMENTS)} statements applied)")
+        return True
+    except Exception as e:
+        print(f"⚠️ Could not verify Neo4j schema: {e}")
+        return False
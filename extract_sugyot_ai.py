@@ -11,6 +11,7 @@ os.environ["NEO4J_USER"] = os.getenv("NEO4J_USER", "neo4j")
 os.environ["NEO4J_PASSWORD"] = os.getenv("NEO4J_PASSWORD", "IJYDpas_0uO5jbjB6Upk7uiEn_Gs-nb9vyO3oUH6v5c")
 
 import argparse
+import asyncio
 from ai.sugya_extractor import get_sugya_extractor
 import json
 
@@ -26,8 +27,14 @@ Examples:
   # Extract with custom settings
   python extract_sugyot_ai.py --tractate Shabbat --start-page 10a --limit 100
   
+  # Extract from all tractates through the OpenAI Batch API
+  python extract_sugyot_ai.py --all --batch
+  
   # Quick test extraction (default settings)
   python extract_sugyot_ai.py
+  
+  # Unattended run (cron/CI): never prompt
+  python extract_sugyot_ai.py --all --yes
 
 Notes:
   - Requires OPENAI_API_KEY in .env file
@@ -43,6 +50,12 @@ Notes:
         help='Extract from ALL tractates in the database (automatic discovery)'
     )
     
+    parser.add_argument(
+        '--batch',
+        action='store_true',
+        help='With --all, submit pages through the OpenAI Batch API (half price, up to 24h turnaround)'
+    )
+    
     parser.add_argument(
         '--tractate',
         type=str,
@@ -70,8 +83,17 @@ Notes:
         help='Export results to JSON file (optional)'
     )
     
+    parser.add_argument(
+        '-y', '--yes',
+        action='store_true',
+        help='Don\'t ask for confirmation (also set by EXTRACT_YES=1), for unattended runs'
+    )
+    
     args = parser.parse_args()
     
+    if args.batch and not args.all:
+        parser.error("--batch is only supported together with --all")
+    
     print("=" * 80)
     print("🤖 AI-POWERED SUGYA EXTRACTION")
     print("=" * 80)
@@ -95,28 +117,34 @@ Notes:
         print("   Set your API key in backend/.env to enable real AI analysis")
         print()
         
-        response = input("Continue with simulated analysis? (y/n): ")
-        if response.lower() != 'y':
-            print("Extraction cancelled.")
-            return
+        if not (args.yes or os.getenv("EXTRACT_YES") == "1"):
+            response = input("Continue with simulated analysis? (y/n): ")
+            if response.lower() != 'y':
+                print("Extraction cancelled.")
+                return
     else:
         print("✅ OpenAI API key found - using GPT-4 for analysis")
     
     # Run extraction
     extractor = get_sugya_extractor()
     
-    if args.all:
+    if args.all and args.batch:
+        # Extract from ALL tractates via the Batch API
+        stats = asyncio.run(extractor.extract_all_sugyot_batch(
+            limit_per_tractate=args.limit
+        ))
+    elif args.all:
         # Extract from ALL tractates
-        stats = extractor.extract_all_sugyot(
+        stats = asyncio.run(extractor.extract_all_sugyot(
             limit_per_tractate=args.limit
-        )
+        ))
     else:
         # Extract from single tractate
-        stats = extractor.extract_and_save_all(
+        stats = asyncio.run(extractor.extract_and_save_all(
             tractate=args.tractate,
             start_page=args.start_page,
             limit=args.limit
-        )
+        ))
     
     # Print summary
     print("\n" + "=" * 80)
@@ -7,7 +7,9 @@ os.environ["NEO4J_URI"] = os.getenv("NEO4J_URI", "neo4j+s://8260863b.databases.n
 os.environ["NEO4J_USER"] = os.getenv("NEO4J_USER", "neo4j")
 os.environ["NEO4J_PASSWORD"] = os.getenv("NEO4J_PASSWORD", "IJYDpas_0uO5jbjB6Upk7uiEn_Gs-nb9vyO3oUH6v5c")
 
+import asyncio
 from api.sugya_manager import get_sugya_manager
+from database import close_async_driver
 
 # Define initial sugyot to create
 INITIAL_SUGYOT = [
@@ -43,46 +45,41 @@ INITIAL_SUGYOT = [
     },
 ]
 
-def main():
+async def main():
     print("=" * 80)
     print("INITIALIZING SUGYOT IN NEO4J DATABASE")
     print("=" * 80)
     
     manager = get_sugya_manager()
     
-    created = 0
+    print(f"\nCreating {len(INITIAL_SUGYOT)} sugyot:")
     for sugya_data in INITIAL_SUGYOT:
-        print(f"\nCreating: {sugya_data['ref']}")
-        print(f"  Title: {sugya_data['title']}")
-        
-        try:
-            success = manager.create_sugya_node(
-                sugya_data['ref'],
-                sugya_data['title'],
-                sugya_data['summary']
-            )
-            
-            if success:
-                print(f"  ✅ Created successfully")
-                created += 1
-            else:
-                print(f"  ❌ Failed to create")
-        except Exception as e:
-            print(f"  ❌ Error: {e}")
+        print(f"  - {sugya_data['ref']}: {sugya_data['title']}")
+    
+    # All sugyot in one transaction instead of one round trip each
+    saved = 0
+    try:
+        result = await manager.bulk_create_sugya_nodes(INITIAL_SUGYOT)
+        saved = result["created"] + result["updated"]
+        print(f"\n✅ {result['created']} created, {result['updated']} already existed (updated)")
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
     
     print("\n" + "=" * 80)
-    print(f"INITIALIZATION COMPLETE - Created {created}/{len(INITIAL_SUGYOT)} sugyot")
+    print(f"INITIALIZATION COMPLETE - Saved {saved}/{len(INITIAL_SUGYOT)} sugyot")
     print("=" * 80)
     
     # List all sugyot to verify
     print("\nVerifying - All available sugyot:")
-    all_sugyot = manager.list_all_sugyot()
+    all_sugyot = await manager.list_all_sugyot()
     for sugya in all_sugyot[:10]:
         print(f"  - {sugya['ref']}: {sugya['title']}")
     
     if len(all_sugyot) > 10:
         print(f"  ... and {len(all_sugyot) - 10} more")
+    
+    await close_async_driver()
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
 
@@ -1,18 +1,39 @@
 from fastapi import FastAPI
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
+from config import get_settings
 
 # Load environment variables from .env file FIRST, before any other imports
-load_dotenv()
+# (a no-op if a script importing the app already loaded them)
+get_settings()
 
 from api import texts, connections, diffs, ai, annotations, users
 from api import sugya, psak, author_map, concepts, lexical, calendar, manuscripts
 from api import ai_enhanced
+from database import ensure_schema, close_driver, close_async_driver
+from ai.openai_client import close_openai_client
+from api.texts import close_sefaria_client
+from api.users import close_auth_pool
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Make sure the Neo4j indexes used by the API exist (this also opens
+    # the first pooled connection, so the first request doesn't)
+    await ensure_schema()
+    # Relationship types accepted by the connection filters
+    await connections.preload_relationship_types()
+    yield
+    close_driver()
+    await close_async_driver()
+    await close_openai_client()
+    await close_sefaria_client()
+    close_auth_pool()
 
 app = FastAPI(
     title="Sefaria Advanced Backend API",
     version="1.0",
-    description="Comprehensive API for advanced Sefaria features including graph analysis, AI commentary, and more"
+    description="Comprehensive API for advanced Sefaria features including graph analysis, AI commentary, and more",
+    lifespan=lifespan
 )
 #
 # CORS middleware for frontend integration - open to all origins
@@ -38,3 +38,19 @@ class AICommentary(BaseModel):
     tradition: str
     mode: str
     generated: str
+
+class SugyaNode(BaseModel):
+    id: str
+    type: str  # question, answer, kasha, terutz, teiku, dispute, resolution
+    label: str
+    sugyaLocation: str
+    children: List['SugyaNode'] = []
+
+class SugyaStructure(BaseModel):
+    ref: str
+    title: str
+    root: SugyaNode
+    summary: str
+
+# Enable forward references for recursive model
+SugyaNode.model_rebuild()
@@ -3,6 +3,7 @@ Script to batch embed all texts in the Neo4j database
 Run this to generate embeddings for semantic search
 """
 
+import argparse
 import asyncio
 import sys
 import os
@@ -16,9 +17,14 @@ load_dotenv(Path(__file__).parent.parent / '.env')
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from ai.embeddings import TextEmbedder
-from database import get_driver
+from ai.openai_client import close_openai_client
+from database import get_async_driver, close_async_driver, NEO4J_DATABASE
+from neo4j import READ_ACCESS
 
-async def main():
+# Remaining texts tokenized to estimate the cost of the whole run
+TOKEN_SAMPLE_SIZE = 1000
+
+async def main(assume_yes: bool = False):
     """Main embedding process"""
     print("🚀 Starting text embedding process...")
     print("=" * 60)
@@ -31,17 +37,30 @@ async def main():
         return
     
     # Get total count of texts
-    driver = get_driver()
-    with driver.session() as session:
-        result = session.run("MATCH (t:Text) RETURN count(t) as total").single()
-        total_texts = result["total"]
+    driver = get_async_driver()
+    async with driver.session(database=NEO4J_DATABASE, default_access_mode=READ_ACCESS) as session:
+        # Both counts, and the characters left to embed, in one round trip
+        # (count(x) skips nulls)
+        result = await session.run("""
+            MATCH (t:Text)
+            RETURN count(t) as total,
+                   count(t.embedding) as embedded,
+                   sum(CASE WHEN t.embedding IS NULL
+                       THEN size(coalesce(t.content_he, t.content_en, ''))
+                       ELSE 0 END) as remaining_chars
+        """)
+        record = await result.single()
+        total_texts, already_embedded = record["total"], record["embedded"]
+        remaining_chars = record["remaining_chars"]
         
-        result = session.run("""
-            MATCH (t:Text) 
-            WHERE t.embedding IS NOT NULL 
-            RETURN count(t) as embedded
-        """).single()
-        already_embedded = result["embedded"]
+        # Tokens per character, measured on a sample of the remaining texts
+        result = await session.run("""
+            MATCH (t:Text)
+            WHERE t.embedding IS NULL
+            RETURN coalesce(t.content_he, t.content_en, '') as content
+            LIMIT $sample_size
+        """, sample_size=TOKEN_SAMPLE_SIZE)
+        sample = [record["content"] async for record in result]
     
     remaining = total_texts - already_embedded
     
@@ -55,20 +74,26 @@ async def main():
         print("✅ All texts are already embedded!")
         return
     
-    # Estimate cost
-    avg_tokens_per_text = 500
+    embedder = TextEmbedder()
+    
+    # Estimate cost from the tokenized sample
+    sample_chars = sum(len(text) for text in sample)
+    tokens_per_char = sum(embedder.count_tokens(sample)) / sample_chars if sample_chars else 1
+    estimated_tokens = int(remaining_chars * tokens_per_char)
     cost_per_1k_tokens = 0.00013
-    estimated_cost = (remaining * avg_tokens_per_text * cost_per_1k_tokens) / 1000
+    estimated_cost = (estimated_tokens * cost_per_1k_tokens) / 1000
     
     print(f"💰 Estimated Cost:")
+    print(f"   ~{estimated_tokens:,} tokens ({tokens_per_char:.2f} per character)")
     print(f"   ~${estimated_cost:.2f} to embed {remaining:,} texts")
     print()
     
-    # Ask for confirmation
-    response = input("Do you want to continue? (yes/no): ")
-    if response.lower() not in ['yes', 'y']:
-        print("❌ Cancelled")
-        return
+    # Ask for confirmation (off the event loop) unless told not to
+    if not assume_yes:
+        response = await asyncio.to_thread(input, "Do you want to continue? (yes/no): ")
+        if response.lower() not in ['yes', 'y']:
+            print("❌ Cancelled")
+            return
     
     print()
     print("🔄 Starting embedding process...")
@@ -76,35 +101,43 @@ async def main():
     print("=" * 60)
     print()
     
-    embedder = TextEmbedder()
-    total_embedded = 0
     batch_size = 100
+    progress = {"batches": 0, "embedded": 0}
     
-    while True:
-        print(f"Processing batch {total_embedded // batch_size + 1}...")
-        
-        count = await embedder.batch_embed_texts(batch_size)
-        
-        if count == 0:
-            print()
-            print("✅ All texts embedded!")
-            break
-        
-        total_embedded += count
-        progress = (already_embedded + total_embedded) / total_texts * 100
-        
-        print(f"   Embedded {count} texts")
-        print(f"   Total progress: {already_embedded + total_embedded:,}/{total_texts:,} ({progress:.1f}%)")
+    def report(count):
+        progress["batches"] += 1
+        progress["embedded"] += count
+        done = already_embedded + progress["embedded"]
+        print(f"   Batch {progress['batches']}: embedded {count} texts")
+        print(f"   Total progress: {done:,}/{total_texts:,} ({done / total_texts * 100:.1f}%)")
         print()
-        
-        # Small delay to avoid rate limits
-        await asyncio.sleep(1)
+    
+    # Several batches in flight at once (EMBED_WORKERS); the OpenAI client
+    # backs off on rate limits, so there's no fixed delay between batches
+    total_embedded = await embedder.embed_all_texts(batch_size, on_batch=report)
+    print()
+    print("✅ All texts embedded!")
     
     print("=" * 60)
     print(f"🎉 Embedding complete!")
     print(f"   Total embedded in this session: {total_embedded:,}")
     print(f"   Database now has: {already_embedded + total_embedded:,} embedded texts")
 
+async def run(assume_yes: bool = False):
+    """Run the embedding process, then close the shared Neo4j and OpenAI clients"""
+    try:
+        await main(assume_yes)
+    finally:
+        await close_async_driver()
+        await close_openai_client()
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Embed all texts that have no embedding yet")
+    parser.add_argument(
+        "-y", "--yes",
+        action="store_true",
+        help="Don't ask for confirmation (also set by EMBED_YES=1), for unattended runs"
+    )
+    args = parser.parse_args()
+    asyncio.run(run(args.yes or os.getenv("EMBED_YES") == "1"))
 
@@ -0,0 +1,64 @@
+"""
+Script to precompute transitive citation edges in the Neo4j database
+Writes a CITES_TRANSITIVE shortcut from each Text to every node it reaches
+through up to 3 CITES hops, with the shortest hop count as `distance`.
+Run this nightly (or after importing new citations) so
+/api/connections/graph/{node_id}?transitive=true is a single-hop lookup.
+"""
+
+import sys
+import time
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv(Path(__file__).parent.parent / '.env')
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database import get_driver, close_driver, NEO4J_DATABASE
+from api.connections import TRANSITIVE_REL_TYPE, MAX_GRAPH_DEPTH
+
+# Source texts handled per transaction; each can write many edges
+SOURCES_PER_TRANSACTION = 1000
+
+# CALL { ... } IN TRANSACTIONS only runs in auto-commit transactions,
+# which is what session.run uses
+DELETE_QUERY = f"""
+MATCH ()-[r:{TRANSITIVE_REL_TYPE}]->()
+CALL {{ WITH r DELETE r }} IN TRANSACTIONS OF 10000 ROWS
+"""
+
+MATERIALIZE_QUERY = f"""
+MATCH (s:Text)
+CALL {{
+    WITH s
+    MATCH path = (s)-[:CITES*1..{MAX_GRAPH_DEPTH}]->(t)
+    WHERE t <> s
+    WITH s, t, min(length(path)) AS distance
+    CREATE (s)-[:{TRANSITIVE_REL_TYPE} {{distance: distance}}]->(t)
+}} IN TRANSACTIONS OF {SOURCES_PER_TRANSACTION} ROWS
+"""
+
+def main():
+    """Rebuild all transitive citation edges"""
+    print("🚀 Materializing transitive citation edges...")
+    print("=" * 60)
+
+    driver = get_driver()
+    start = time.time()
+    with driver.session(database=NEO4J_DATABASE) as session:
+        summary = session.run(DELETE_QUERY).consume()
+        print(f"🗑️  Removed {summary.counters.relationships_deleted:,} old {TRANSITIVE_REL_TYPE} edges")
+
+        summary = session.run(MATERIALIZE_QUERY).consume()
+        print(f"✅ Created {summary.counters.relationships_created:,} {TRANSITIVE_REL_TYPE} edges "
+              f"(up to {MAX_GRAPH_DEPTH} hops)")
+
+    print("=" * 60)
+    print(f"🎉 Done in {time.time() - start:.1f}s")
+    close_driver()
+
+if __name__ == "__main__":
+    main()
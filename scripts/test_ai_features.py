@@ -16,25 +16,31 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from ai.commentary_generator import CommentaryGenerator
 from ai.embeddings import SemanticSearch, TextEmbedder
-from database import get_driver
+from ai.openai_client import close_openai_client
+from database import get_async_driver, close_async_driver, NEO4J_DATABASE
+from neo4j import READ_ACCESS
+
+# Banner rule, built once
+BAR = "=" * 60
 
 async def test_commentary():
     """Test AI commentary generation"""
-    print("\n" + "=" * 60)
+    print("\n" + BAR)
     print("🔬 Testing AI Commentary Generation")
-    print("=" * 60)
+    print(BAR)
     
     generator = CommentaryGenerator()
     
     # Get a sample text from database
-    driver = get_driver()
-    with driver.session() as session:
-        result = session.run("""
+    driver = get_async_driver()
+    async with driver.session(database=NEO4J_DATABASE, default_access_mode=READ_ACCESS) as session:
+        result = await session.run("""
             MATCH (t:Text)
             WHERE t.content_he IS NOT NULL
             RETURN t.id as ref, t.content_he as content
             LIMIT 1
-        """).single()
+        """)
+        result = await result.single()
         
         if not result:
             print("❌ No texts found in database")
@@ -65,9 +71,9 @@ async def test_commentary():
 
 async def test_semantic_search():
     """Test semantic search"""
-    print("\n" + "=" * 60)
+    print("\n" + BAR)
     print("🔍 Testing Semantic Search")
-    print("=" * 60)
+    print(BAR)
     
     searcher = SemanticSearch()
     
@@ -95,20 +101,21 @@ async def test_semantic_search():
 
 async def test_embeddings():
     """Test embedding generation"""
-    print("\n" + "=" * 60)
+    print("\n" + BAR)
     print("🧬 Testing Embedding Generation")
-    print("=" * 60)
+    print(BAR)
     
     embedder = TextEmbedder()
     
     # Get count of embedded texts
-    driver = get_driver()
-    with driver.session() as session:
-        result = session.run("""
+    driver = get_async_driver()
+    async with driver.session(database=NEO4J_DATABASE, default_access_mode=READ_ACCESS) as session:
+        result = await session.run("""
             MATCH (t:Text) 
             WHERE t.embedding IS NOT NULL 
             RETURN count(t) as count
-        """).single()
+        """)
+        result = await result.single()
         
         embedded_count = result["count"]
     
@@ -118,14 +125,15 @@ async def test_embeddings():
         print("\n⚠️  No texts embedded yet. Embedding a sample text...")
         
         # Embed one text as test
-        with driver.session() as session:
-            result = session.run("""
+        async with driver.session(database=NEO4J_DATABASE, default_access_mode=READ_ACCESS) as session:
+            result = await session.run("""
                 MATCH (t:Text)
                 WHERE t.embedding IS NULL 
                       AND t.content_he IS NOT NULL
-                RETURN t.`<id>` as id, t.content_he as content
+                RETURN t.id as id, t.content_he as content
                 LIMIT 1
-            """).single()
+            """)
+            result = await result.single()
             
             if result:
                 success = await embedder.embed_and_store(
@@ -187,6 +195,9 @@ async def main():
         print("🎉 All tests passed!")
     else:
         print("⚠️  Some tests failed. Check errors above.")
+    
+    await close_async_driver()
+    await close_openai_client()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -4,43 +4,86 @@ Test script for Neo4j connections API
 Run this to verify the backend connections are working without deprecation warnings
 """
 
-import requests
+import asyncio
+import httpx
 import json
 import sys
+from urllib.parse import quote
 
 BASE_URL = "http://localhost:8000"
 
-def test_endpoint(name, url, expected_status=200):
-    """Test an API endpoint"""
-    print(f"\n{'='*60}")
-    print(f"Testing: {name}")
-    print(f"URL: {url}")
-    print(f"{'='*60}")
+# Bytes of each response body read for the preview
+PREVIEW_BYTES = 4096
+
+# Seconds to wait for /health before giving up on the whole run
+HEALTH_TIMEOUT = 1.0
+
+# Banner rule, built once
+BAR = "=" * 60
+
+def make_client() -> httpx.AsyncClient:
+    """
+    One keep-alive connection pool for every test; failed connects are retried.
+    HTTP/2 is used when the server negotiates it (over TLS), so all requests
+    share a single connection.
+    """
+    return httpx.AsyncClient(
+        base_url=BASE_URL,
+        http2=True,
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=20),
+        transport=httpx.AsyncHTTPTransport(retries=2)
+    )
+
+# Header of each test's report, filled in per test
+REPORT_HEADER = "\n{bar}\n{heading}\n{bar}\n\n{bar}\nTesting: {name}\nURL: {url}\n{bar}"
+
+async def test_endpoint(client, heading, name, url, expected_status=200):
+    """
+    Test an API endpoint.
+    Returns (passed, report); the tests run concurrently, so each one's
+    output is collected and printed in order afterwards.
+    """
+    lines = [REPORT_HEADER.format_map({
+        "bar": BAR,
+        "heading": heading,
+        "name": name,
+        "url": BASE_URL + url,
+    })]
     
     try:
-        response = requests.get(url, timeout=10)
+        # Only the start of the body is shown, so don't download (or parse
+        # and re-format) large graph responses in full
+        async with client.stream("GET", url, timeout=10) as response:
+            body = b""
+            async for chunk in response.aiter_bytes():
+                body += chunk
+                if len(body) > PREVIEW_BYTES:
+                    break
+        status = response.status_code
+        complete = len(body) <= PREVIEW_BYTES
+        preview = body[:PREVIEW_BYTES].decode("utf-8", errors="replace")
         
-        print(f"Status: {response.status_code}")
+        lines.append(f"Status: {status}")
         
-        if response.status_code == expected_status:
-            print("✅ SUCCESS")
-            data = response.json()
-            print(f"\nResponse preview:")
-            print(json.dumps(data, indent=2)[:500] + "...")
-            return True
+        if status == expected_status:
+            if complete:
+                preview = json.dumps(json.loads(body), indent=2, ensure_ascii=False)
+            lines.append(f"✅ SUCCESS\n\nResponse preview:\n{preview[:500]}...")
+            passed = True
         else:
-            print(f"❌ FAILED - Expected {expected_status}, got {response.status_code}")
-            print(f"Response: {response.text}")
-            return False
-            
-    except requests.exceptions.RequestException as e:
-        print(f"❌ ERROR: {e}")
-        return False
+            lines.append(f"❌ FAILED - Expected {expected_status}, got {status}\nResponse: {preview}")
+            passed = False
+    
+    except httpx.HTTPError as e:
+        lines.append(f"❌ ERROR: {e}")
+        passed = False
+    
+    return passed, "\n".join(lines)
 
-def main():
-    print("="*60)
+async def main():
+    print(BAR)
     print("Neo4j Connections API Test Suite")
-    print("="*60)
+    print(BAR)
     print("\nMake sure the backend server is running on http://localhost:8000")
     print("Press Ctrl+C to exit\n")
     
@@ -50,115 +93,117 @@ def main():
         "Berakhot 2a",
         "Genesis 1:1"
     ]
-    
-    results = []
-    
-    # Test 1: Health check (if available)
-    print("\n" + "="*60)
-    print("1. Testing Backend Health")
-    print("="*60)
-    
-    try:
-        response = requests.get(f"{BASE_URL}/health", timeout=5)
-        if response.status_code == 200:
-            print("✅ Backend is running")
-        else:
-            print("⚠️  Backend health check returned:", response.status_code)
-    except:
-        print("⚠️  Could not reach backend - make sure it's running")
-        print("   Start with: cd backend && uvicorn main:app --reload")
-        sys.exit(1)
-    
-    # Test 2: Get relationship types
-    print("\n" + "="*60)
-    print("2. Testing Relationship Types Endpoint")
-    print("="*60)
-    
-    result = test_endpoint(
-        "Get Relationship Types",
-        f"{BASE_URL}/api/connections/relationship-types"
-    )
-    results.append(("Relationship Types", result))
-    
-    # Test 3: Get graph stats
-    print("\n" + "="*60)
-    print("3. Testing Graph Stats Endpoint")
-    print("="*60)
-    
-    result = test_endpoint(
-        "Get Graph Stats",
-        f"{BASE_URL}/api/connections/stats"
-    )
-    results.append(("Graph Stats", result))
-    
-    # Test 4: Get connections for each test node
-    for i, node_id in enumerate(test_nodes, start=4):
-        print("\n" + "="*60)
-        print(f"{i}. Testing Connections for: {node_id}")
-        print("="*60)
+    # Percent-encoded once for the URLs below
+    encoded = {node_id: quote(node_id, safe="") for node_id in test_nodes}
+    
+    async with make_client() as client:
+        # Test 1: Health check (if available)
+        print("\n" + BAR)
+        print("1. Testing Backend Health")
+        print(BAR)
         
-        result = test_endpoint(
-            f"Connections: {node_id}",
-            f"{BASE_URL}/api/connections/{requests.utils.quote(node_id)}?limit=10",
-            expected_status=200  # or 404 if node doesn't exist
-        )
-        results.append((f"Connections: {node_id}", result))
-    
-    # Test 5: Get graph data
-    test_node = test_nodes[0]
-    print("\n" + "="*60)
-    print(f"5. Testing Graph Data for: {test_node}")
-    print("="*60)
-    
-    result = test_endpoint(
-        f"Graph Data: {test_node}",
-        f"{BASE_URL}/api/connections/graph/{requests.utils.quote(test_node)}?depth=2&limit=50",
-        expected_status=200  # or 404 if node doesn't exist
-    )
-    results.append((f"Graph Data: {test_node}", result))
-    
-    # Test 6: Get graph data with relationship filter
-    print("\n" + "="*60)
-    print(f"6. Testing Graph Data with Filter: {test_node}")
-    print("="*60)
+        # The server is local, so a healthy one answers well within
+        # HEALTH_TIMEOUT. Bail out here rather than wait on every test's
+        # timeout against a backend that's down or broken.
+        try:
+            response = await client.get("/health", timeout=HEALTH_TIMEOUT)
+        except httpx.HTTPError:
+            print("⚠️  Could not reach backend - make sure it's running")
+            print("   Start with: cd backend && uvicorn main:app --reload")
+            sys.exit(1)
+        if response.status_code != 200:
+            print("❌ Backend health check returned:", response.status_code)
+            print("   Fix the backend before running the endpoint tests")
+            sys.exit(1)
+        print("✅ Backend is running")
+        
+        # (summary name, heading, test name, path) - the tests are independent,
+        # so they all run at once
+        test_node = test_nodes[0]
+        tests = [
+            (
+                "Relationship Types",
+                "2. Testing Relationship Types Endpoint",
+                "Get Relationship Types",
+                "/api/connections/relationship-types"
+            ),
+            (
+                "Graph Stats",
+                "3. Testing Graph Stats Endpoint",
+                "Get Graph Stats",
+                "/api/connections/stats"
+            ),
+        ]
+        
+        # Test 4: Get connections for each test node
+        for i, node_id in enumerate(test_nodes, start=4):
+            tests.append((
+                f"Connections: {node_id}",
+                f"{i}. Testing Connections for: {node_id}",
+                f"Connections: {node_id}",
+                f"/api/connections/{encoded[node_id]}?limit=10"  # 404 if node doesn't exist
+            ))
+        
+        # Test 5: Get graph data
+        tests.append((
+            f"Graph Data: {test_node}",
+            f"5. Testing Graph Data for: {test_node}",
+            f"Graph Data: {test_node}",
+            f"/api/connections/graph/{encoded[test_node]}?depth=2&limit=50"
+        ))
+        
+        # Test 6: Get graph data with relationship filter
+        tests.append((
+            f"Graph Data (Filtered): {test_node}",
+            f"6. Testing Graph Data with Filter: {test_node}",
+            f"Graph Data (CITES): {test_node}",
+            f"/api/connections/graph/{encoded[test_node]}?depth=2&relationship_type=CITES"
+        ))
+        
+        outcomes = await asyncio.gather(*[
+            test_endpoint(client, heading, name, url)
+            for _, heading, name, url in tests
+        ])
     
-    result = test_endpoint(
-        f"Graph Data (CITES): {test_node}",
-        f"{BASE_URL}/api/connections/graph/{requests.utils.quote(test_node)}?depth=2&relationship_type=CITES",
-        expected_status=200  # or 404 if no results
-    )
-    results.append((f"Graph Data (Filtered): {test_node}", result))
+    # Every report and the summary go out in one write
+    out = []
+    results = []
+    for (summary_name, *_), (result, report) in zip(tests, outcomes):
+        out.append(report)
+        results.append((summary_name, result))
     
     # Summary
-    print("\n" + "="*60)
-    print("TEST SUMMARY")
-    print("="*60)
+    out.append("\n" + BAR)
+    out.append("TEST SUMMARY")
+    out.append(BAR)
     
     passed = sum(1 for _, result in results if result)
     total = len(results)
     
     for name, result in results:
         status = "✅ PASS" if result else "❌ FAIL"
-        print(f"{status} - {name}")
+        out.append(f"{status} - {name}")
     
-    print(f"\n{passed}/{total} tests passed")
+    out.append(f"\n{passed}/{total} tests passed")
     
     if passed == total:
-        print("\n🎉 All tests passed! No deprecation warnings should appear in logs.")
+        out.append("\n🎉 All tests passed! No deprecation warnings should appear in logs.")
     else:
-        print("\n⚠️  Some tests failed. Check the output above for details.")
+        out.append("\n⚠️  Some tests failed. Check the output above for details.")
     
-    print("\n" + "="*60)
-    print("IMPORTANT: Check the backend server logs for deprecation warnings")
-    print("You should NOT see any warnings about:")
-    print("  - 'id is deprecated'")
-    print("  - 'property key does not exist: <id>'")
-    print("="*60)
+    out.append("\n" + BAR)
+    out.append("IMPORTANT: Check the backend server logs for deprecation warnings")
+    out.append("You should NOT see any warnings about:")
+    out.append("  - 'id is deprecated'")
+    out.append("  - 'property key does not exist: <id>'")
+    out.append(BAR)
+    
+    sys.stdout.write("\n".join(out) + "\n")
+    sys.stdout.flush()
 
 if __name__ == "__main__":
     try:
-        main()
+        asyncio.run(main())
     except KeyboardInterrupt:
         print("\n\nTest interrupted by user")
         sys.exit(0)
-
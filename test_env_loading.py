@@ -3,21 +3,23 @@ Quick test to verify environment variables are loaded correctly
 Run this before starting the main application to verify configuration
 """
 
-import os
-from dotenv import load_dotenv
+from config import get_settings
 
 # Load .env file
-load_dotenv()
+settings = get_settings()
 
-print("=" * 60)
+# Banner rule, built once
+BAR = "=" * 60
+
+print(BAR)
 print("ENVIRONMENT VARIABLE CHECK")
-print("=" * 60)
+print(BAR)
 
 # Check Neo4j configuration
-neo4j_uri = os.getenv("NEO4J_URI")
-neo4j_user = os.getenv("NEO4J_USER")
-neo4j_password = os.getenv("NEO4J_PASSWORD")
-openai_key = os.getenv("OPENAI_API_KEY")
+neo4j_uri = settings.neo4j_uri
+neo4j_user = settings.neo4j_user
+neo4j_password = settings.neo4j_password
+openai_key = settings.openai_api_key
 
 print("\n1. Neo4j Configuration:")
 print(f"   URI: {neo4j_uri}")
@@ -32,19 +34,13 @@ else:
     print("   ❌ API Key: NOT SET")
 
 print("\n3. Testing Neo4j Connection:")
+# The app's shared driver, with its pool settings (database.DRIVER_CONFIG).
+# It stays open for anything else in this process and is closed at exit.
+from database import get_driver
 try:
-    from neo4j import GraphDatabase
-    driver = GraphDatabase.driver(
-        neo4j_uri,
-        auth=(neo4j_user, neo4j_password),
-        max_connection_lifetime=3600
-    )
-    with driver.session() as session:
-        result = session.run("RETURN 1 as test")
-        test_value = result.single()["test"]
-        if test_value == 1:
-            print("   ✅ Neo4j connection successful!")
-        driver.close()
+    driver = get_driver()
+    driver.verify_connectivity()
+    print("   ✅ Neo4j connection successful!")
 except Exception as e:
     print(f"   ❌ Neo4j connection failed: {str(e)}")
 
@@ -60,7 +56,7 @@ try:
 except Exception as e:
     print(f"   ❌ OpenAI initialization failed: {str(e)}")
 
-print("\n" + "=" * 60)
+print("\n" + BAR)
 print("CONFIGURATION CHECK COMPLETE")
-print("=" * 60)
+print(BAR)
 
@@ -1,59 +1,75 @@
 """
 Test the Sugya API endpoints with real data
 """
-import requests
-import json
+import asyncio
+import httpx
+import sys
 
 BASE_URL = "http://localhost:8000/api"
 
-print("=" * 80)
-print("TESTING SUGYA API ENDPOINTS")
-print("=" * 80)
-
-# Test 1: List all available sugyot
-print("\n1. Testing /api/sugya/list/available")
-try:
-    response = requests.get(f"{BASE_URL}/sugya/list/available")
-    if response.status_code == 200:
-        data = response.json()
-        print(f"   ✅ Success - Found {data['total']} sugyot")
-        for sugya in data['sugyot'][:5]:
-            print(f"      - {sugya['ref']}: {sugya['title']}")
-    else:
-        print(f"   ❌ Failed - Status {response.status_code}")
-except Exception as e:
-    print(f"   ❌ Error: {e}")
-
-# Test 2: Get specific sugya structure
-print("\n2. Testing /api/sugya/Berakhot 2a")
-try:
-    response = requests.get(f"{BASE_URL}/sugya/Berakhot%202a")
-    if response.status_code == 200:
-        data = response.json()
-        print(f"   ✅ Success")
-        print(f"      Title: {data['title']}")
-        print(f"      Summary: {data['summary']}")
-        print(f"      Root type: {data['root']['type']}")
-        print(f"      Children: {len(data['root']['children'])}")
-    else:
-        print(f"   ❌ Failed - Status {response.status_code}")
-except Exception as e:
-    print(f"   ❌ Error: {e}")
-
-# Test 3: Get sugya that doesn't exist
-print("\n3. Testing /api/sugya/NonExistent (should 404)")
-try:
-    response = requests.get(f"{BASE_URL}/sugya/NonExistent")
-    if response.status_code == 404:
-        print(f"   ✅ Correctly returns 404")
-    else:
-        print(f"   ❌ Unexpected status: {response.status_code}")
-except Exception as e:
-    print(f"   ❌ Error: {e}")
-
-print("\n" + "=" * 80)
-print("API TESTING COMPLETE")
-print("=" * 80)
-print("\n💡 Start the backend with: uvicorn main:app --reload")
-print("💡 View docs at: http://localhost:8000/docs")
+# Banner rule, built once
+BAR = "=" * 80
 
+def report_list(data):
+    lines = [f"   ✅ Success - Found {data['total']} sugyot"]
+    for sugya in data['sugyot'][:5]:
+        lines.append(f"      - {sugya['ref']}: {sugya['title']}")
+    return lines
+
+def report_sugya(data):
+    return [
+        f"   ✅ Success",
+        f"      Title: {data['title']}",
+        f"      Summary: {data['summary']}",
+        f"      Root type: {data['root']['type']}",
+        f"      Children: {len(data['root']['children'])}",
+    ]
+
+def report_not_found(data):
+    return [f"   ✅ Correctly returns 404"]
+
+# (heading, path, expected status, reports the response JSON)
+TESTS = [
+    ("1. Testing /api/sugya/list/available", "/sugya/list/available", 200, report_list),
+    ("2. Testing /api/sugya/Berakhot 2a", "/sugya/Berakhot%202a", 200, report_sugya),
+    ("3. Testing /api/sugya/NonExistent (should 404)", "/sugya/NonExistent", 404, report_not_found),
+]
+
+async def run_test(client, heading, path, expected_status, report):
+    lines = [f"\n{heading}"]
+    try:
+        response = await client.get(path)
+        if response.status_code == expected_status:
+            lines.extend(report(response.json()))
+        else:
+            lines.append(f"   ❌ Failed - Status {response.status_code} (expected {expected_status})")
+    except Exception as e:
+        lines.append(f"   ❌ Error: {e}")
+    return lines
+
+async def main():
+    print(BAR)
+    print("TESTING SUGYA API ENDPOINTS")
+    print(BAR)
+
+    # The requests are independent, so send them all at once and print
+    # each test's output in order once they're done
+    # One keep-alive connection pool for all tests; failed connects are retried
+    async with httpx.AsyncClient(
+        base_url=BASE_URL,
+        timeout=10,
+        transport=httpx.AsyncHTTPTransport(retries=2)
+    ) as client:
+        results = await asyncio.gather(*[run_test(client, *test) for test in TESTS])
+
+    # All reports and the footer in one write
+    out = ["\n".join(lines) for lines in results]
+    out.append("\n" + BAR)
+    out.append("API TESTING COMPLETE")
+    out.append(BAR)
+    out.append("\n💡 Start the backend with: uvicorn main:app --reload")
+    out.append("💡 View docs at: http://localhost:8000/docs")
+    sys.stdout.write("\n".join(out) + "\n")
+    sys.stdout.flush()
+
+asyncio.run(main())